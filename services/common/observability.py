@@ -0,0 +1,72 @@
+import time
+import uuid
+import logging
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence
+
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# id da requisição em curso; o RAG o propaga nas chamadas aos serviços de embedding e gerador
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+def outgoing_headers() -> Dict[str, str]:
+    rid = request_id.get()
+    return {REQUEST_ID_HEADER: rid} if rid else {}
+
+class RequestIdFilter(logging.Filter):
+    """Inclui o id da requisição (ou "-") em todos os registros de log."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get() or "-"
+        return True
+
+class RequestContextMiddleware:
+    """
+    Middleware ASGI que adota o X-Request-ID recebido (ou gera um), devolve-o na resposta e mede a
+    duração da requisição por rota. Respostas em streaming são medidas até o último byte.
+    """
+
+    def __init__(self, app, histogram: Histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rid = dict(scope["headers"]).get(REQUEST_ID_HEADER.lower().encode(), b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        token = request_id.set(rid)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (REQUEST_ID_HEADER.lower().encode(), rid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            # o rótulo é o padrão da rota, não o caminho, para não explodir a cardinalidade
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.histogram.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
+            request_id.reset(token)
+
+def instrument(app: FastAPI, buckets: Sequence[float]):
+    """
+    Registra o middleware de id/latência e o endpoint `/metrics` no formato do Prometheus. Os buckets
+    do histograma HTTP vêm de cada serviço, que sabe a faixa de latência das próprias rotas.
+    """
+    histogram = Histogram(
+        "http_request_duration_seconds", "Duração das requisições HTTP até o fim da resposta.",
+        ["method", "route", "status"], buckets=buckets,
+    )
+    app.add_middleware(RequestContextMiddleware, histogram=histogram)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
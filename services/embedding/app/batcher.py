@@ -0,0 +1,118 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from llama_cpp import Llama
+
+from .metrics import BATCH_TEXTS, STAGE_SECONDS
+
+log = logging.getLogger(__name__)
+
+# o lote é dimensionado por uma estimativa, sem tokenizar: o create_embedding tokeniza cada texto de
+# qualquer forma e divide o lote em chamadas de até n_batch tokens, então o limite pode ser aproximado.
+# Texto em português fica perto de 4 caracteres por token; 3 erra para lotes um pouco menores.
+CHARS_PER_TOKEN = 3
+
+class MicroBatcher:
+    """
+    Agrupa requisições de embedding concorrentes: a primeira requisição abre uma janela de
+    `window_ms` milissegundos durante a qual outras são acumuladas, até cerca de `max_tokens` tokens no total.
+    O lote roda em uma única chamada ao modelo e os vetores são devolvidos a cada requisição.
+    Uma única thread usa o modelo, então as chamadas ao `Llama` nunca concorrem entre si.
+    """
+
+    def __init__(self, llm: Llama, window_ms: float, max_tokens: int):
+        self.llm = llm
+        self.window = window_ms / 1000
+        self.max_tokens = max_tokens
+        self._pending: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._carry: Optional[Tuple[Tuple[List[str], Future], int]] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def submit(self, texts: List[str]) -> Future:
+        future: Future = Future()
+        self._pending.put((texts, future))
+        return future
+
+    @staticmethod
+    def _estimate_tokens(texts: List[str]) -> int:
+        return sum(len(t) // CHARS_PER_TOKEN + 1 for t in texts)
+
+    def _collect(self) -> List[Tuple[List[str], Future]]:
+        if self._carry:
+            first, tokens = self._carry
+            self._carry = None
+        else:
+            first = self._pending.get(timeout=0.5)
+            tokens = self._estimate_tokens(first[0])
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while tokens < self.max_tokens:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            item_tokens = self._estimate_tokens(item[0])
+            if tokens + item_tokens > self.max_tokens:
+                # não cabe neste lote: abre o próximo
+                self._carry = (item, item_tokens)
+                break
+            batch.append(item)
+            tokens += item_tokens
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                batch = self._collect()
+            except queue.Empty:
+                continue
+
+            texts = [t for item_texts, _ in batch for t in item_texts]
+            start = time.perf_counter()
+            try:
+                data = self.llm.create_embedding(texts)["data"]
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            STAGE_SECONDS.labels("model_batch").observe(time.perf_counter() - start)
+            BATCH_TEXTS.observe(len(texts))
+
+            offset = 0
+            for item_texts, future in batch:
+                future.set_result([d["embedding"] for d in data[offset : offset + len(item_texts)]])
+                offset += len(item_texts)
+            self.batches += 1
+            self.requests += len(batch)
+            self.texts += len(texts)
+            if len(batch) > 1:
+                log.debug(f"Lote de embedding com {len(batch)} requisições ({len(texts)} textos).")
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "texts": self.texts,
+            "queue_depth": self._pending.qsize(),
+            "avg_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else None,
+            "window_ms": self.window * 1000,
+            "max_tokens": self.max_tokens,
+        }
@@ -0,0 +1,90 @@
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """
+    Cache persistente texto -> vetor em SQLite, com despejo LRU limitado a `max_entries`.
+    A chave é o hash do nome do modelo + texto, então trocar o modelo invalida as entradas antigas.
+    Os vetores são guardados como float32 empacotado.
+    """
+
+    def __init__(self, path: Path, model_name: str, max_entries: int):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        log.info(f"Cache de embeddings em {path} com {self._entries} entradas.")
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model_name}\x00{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        keys = [self._key(t) for t in texts]
+        found: Dict[bytes, bytes] = {}
+        with self._lock:
+            unique = list(set(keys))
+            for i in range(0, len(unique), 500):
+                part = unique[i : i + 500]
+                marks = ",".join("?" * len(part))
+                found.update(self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part))
+                self._conn.execute(f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [time.time(), *part])
+            self._conn.commit()
+
+        results = []
+        for key in keys:
+            blob = found.get(key)
+            results.append(array("f", blob).tolist() if blob is not None else None)
+        hits = sum(r is not None for r in results)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        now = time.time()
+        rows = [(self._key(t), array("f", v).tobytes(), now) for t, v in zip(texts, vectors)]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            self._entries += self._conn.total_changes - before
+            if self._entries > self.max_entries:
+                # despeja em bloco até 90% da capacidade para não pagar um DELETE a cada inserção
+                excess = self._entries - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+                )
+                self._entries -= excess
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -9,6 +9,7 @@ class Config:
     MODELS_DIR = BASE_DIR / "models"
     EMB_DIR = MODELS_DIR / "embeddings"
     LOGS_DIR = BASE_DIR / "app" / "logs"
+    CACHE_DIR = BASE_DIR / "cache"
 
     EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME")
 
@@ -21,6 +22,15 @@ class Config:
     MAX_CONTEXT_LENGTH = int(os.getenv("MAX_CONTEXT_LENGTH", "4096"))
     PORT = int(os.getenv("PORT", "8001"))
 
+    # micro-batching: janela de espera por requisições concorrentes e limite de tokens (estimados pelo
+    # tamanho do texto) por lote, nunca acima do n_batch/n_ubatch do modelo (MAX_CONTEXT_LENGTH)
+    EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+    EMBED_BATCH_MAX_TOKENS = min(int(os.getenv("EMBED_BATCH_MAX_TOKENS", str(MAX_CONTEXT_LENGTH))), MAX_CONTEXT_LENGTH)
+
+    # cache persistente de vetores; 0 desativa
+    EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+    EMBED_CACHE_PATH = CACHE_DIR / "embeddings.sqlite"
+
     LOG_FILE_PATH = LOGS_DIR / "embedding_service.log"
 
 settings = Config()
\ No newline at end of file
@@ -1,20 +1,29 @@
+import struct
+import asyncio
 import logging
+import numpy as np
 from logging.handlers import RotatingFileHandler
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Response
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 from contextlib import asynccontextmanager
 from llama_cpp import Llama
+from common.observability import RequestIdFilter, instrument
 
 from .config import settings
+from .metrics import LATENCY_BUCKETS, TEXTS, timed
+from .batcher import MicroBatcher
+from .cache import EmbeddingCache
 settings.LOGS_DIR.mkdir(exist_ok=True)
 
 file_handler = RotatingFileHandler(settings.LOG_FILE_PATH, maxBytes=10*1024*1024, backupCount=5)
-file_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s'))
+file_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] [%(name)s] [%(request_id)s] %(message)s'))
+file_handler.addFilter(RequestIdFilter())
 
 # Configura o logger para também exibir no console (`docker logs`)
 stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s'))
+stream_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] [%(request_id)s] %(message)s'))
+stream_handler.addFilter(RequestIdFilter())
 
 root_logger = logging.getLogger()
 root_logger.setLevel(logging.INFO)
@@ -29,6 +38,54 @@ class EmbedRequest(BaseModel):
 class EmbedResponse(BaseModel):
     embeddings: List[List[float]]
 
+class TokenizeRequest(BaseModel):
+    texts: List[str]
+
+class TokenizeResponse(BaseModel):
+    counts: List[int]
+    context_length: int
+
+# formatos binários negociados via `Accept`: cabeçalho little-endian <uint32 linhas, uint32 dimensão>
+# seguido da matriz linha a linha em float32 ou float16 little-endian
+BINARY_FORMATS = {
+    "application/x-embeddings-f32": "<f4",
+    "application/x-embeddings-f16": "<f2",
+}
+
+def negotiate_format(accept: Optional[str]) -> Optional[str]:
+    """
+    Formato binário pedido no `Accept`, ou None para JSON. Vale o tipo de maior `q` (`q=0` recusa o
+    tipo) e, no empate, o que aparece primeiro; curingas (`*/*`, `application/*`) contam como JSON.
+    """
+    if not accept:
+        return None
+    best, best_q = None, 0.0
+    for part in accept.split(","):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        media_type = media_type.lower()
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type in BINARY_FORMATS:
+            candidate = media_type
+        elif media_type in ("application/json", "application/*", "*/*"):
+            candidate = None
+        else:
+            continue
+        if q > best_q:
+            best, best_q = candidate, q
+    return best
+
+def pack_embeddings(embeddings: List[List[float]], media_type: str) -> bytes:
+    matrix = np.asarray(embeddings, dtype=BINARY_FORMATS[media_type])
+    rows, dim = matrix.shape
+    return struct.pack("<II", rows, dim) + matrix.tobytes()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     if not settings.EMBEDDING_MODEL_PATH or not settings.EMBEDDING_MODEL_PATH.exists():
@@ -41,11 +98,21 @@ async def lifespan(app: FastAPI):
         llm = Llama(
             model_path=str(settings.EMBEDDING_MODEL_PATH),
             n_ctx=settings.MAX_CONTEXT_LENGTH,
+            n_batch=settings.MAX_CONTEXT_LENGTH,
+            # embeddings com pooling precisam de cada sequência inteira em um único ubatch
+            n_ubatch=settings.MAX_CONTEXT_LENGTH,
             embedding=True,
             n_threads=settings.N_THREADS,
             verbose=False
         )
         model_state["llm"] = llm
+        batcher = MicroBatcher(llm, settings.EMBED_BATCH_WINDOW_MS, settings.EMBED_BATCH_MAX_TOKENS)
+        batcher.start()
+        model_state["batcher"] = batcher
+        if settings.EMBED_CACHE_MAX_ENTRIES > 0:
+            model_state["cache"] = EmbeddingCache(
+                settings.EMBED_CACHE_PATH, settings.EMBEDDING_MODEL_PATH.name, settings.EMBED_CACHE_MAX_ENTRIES
+            )
         logging.info(f"--- Serviço de Embedding pronto na porta {settings.PORT} ---")
         yield
     except Exception as e:
@@ -53,26 +120,71 @@ async def lifespan(app: FastAPI):
         raise
     
     logging.info("--- Finalizando Serviço de Embedding ---")
+    batcher.stop()
+    if "cache" in model_state:
+        model_state["cache"].close()
     model_state.clear()
 
 app = FastAPI(lifespan=lifespan)
+instrument(app, LATENCY_BUCKETS)
 
 @app.post("/embed", response_model=EmbedResponse)
-def create_embeddings(request: EmbedRequest):
-    llm = model_state.get("llm")
-    if not llm:
+async def create_embeddings(request: EmbedRequest, accept: Optional[str] = Header(None)):
+    batcher = model_state.get("batcher")
+    if not batcher:
         raise HTTPException(status_code=503, detail="Modelo não inicializado.")
     
     try:
         logging.info(f"Recebida requisição para embedar {len(request.texts)} textos.")
-        embeddings_data = llm.create_embedding(request.texts)
-        embeddings = [d["embedding"] for d in embeddings_data["data"]]
-        logging.info("Embeddings criados com sucesso.")
-        return EmbedResponse(embeddings=embeddings)
+        cache = model_state.get("cache")
+        with timed("cache_get"):
+            cached = await asyncio.to_thread(cache.get_many, request.texts) if cache else [None] * len(request.texts)
+        # só os textos sem vetor em cache vão ao modelo, cada um uma única vez
+        missing = list(dict.fromkeys(t for t, v in zip(request.texts, cached) if v is None))
+        computed = {}
+        if missing:
+            with timed("model"):
+                vectors = await asyncio.wrap_future(batcher.submit(missing))
+            computed = dict(zip(missing, vectors))
+            if cache:
+                with timed("cache_put"):
+                    await asyncio.to_thread(cache.put_many, missing, vectors)
+        embeddings = [v if v is not None else computed[t] for t, v in zip(request.texts, cached)]
+        TEXTS.labels("cache").inc(len(request.texts) - len(missing))
+        TEXTS.labels("model").inc(len(missing))
+        logging.info(f"Embeddings criados com sucesso ({len(request.texts) - len(missing)} do cache).")
+        media_type = negotiate_format(accept)
+        with timed("encode"):
+            if media_type:
+                return Response(content=pack_embeddings(embeddings, media_type), media_type=media_type)
+            return EmbedResponse(embeddings=embeddings)
     except Exception as e:
         logging.error(f"Erro ao criar embeddings: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Falha ao processar textos.")
 
+@app.post("/tokenize", response_model=TokenizeResponse)
+def tokenize_texts(request: TokenizeRequest):
+    """Conta os tokens de cada texto com o tokenizador do modelo de embedding (sem o BOS)."""
+    llm = model_state.get("llm")
+    if not llm:
+        raise HTTPException(status_code=503, detail="Modelo não inicializado.")
+    counts = [len(llm.tokenize(text.encode("utf-8"), add_bos=False)) for text in request.texts]
+    return TokenizeResponse(counts=counts, context_length=llm.n_ctx())
+
+@app.get("/batch/stats")
+def batch_stats():
+    batcher = model_state.get("batcher")
+    if not batcher:
+        raise HTTPException(status_code=503, detail="Modelo não inicializado.")
+    return batcher.stats()
+
+@app.get("/cache/stats")
+def cache_stats():
+    cache = model_state.get("cache")
+    if not cache:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
\ No newline at end of file
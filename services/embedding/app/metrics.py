@@ -0,0 +1,25 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import Counter, Histogram
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "embedding_stage_duration_seconds",
+    "Duração das etapas do /embed: cache_get, model (fila + lote), cache_put e encode; model_batch é a chamada ao modelo.",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+TEXTS = Counter("embedding_texts_total", "Textos recebidos no /embed, por origem do vetor.", ["source"])
+BATCH_TEXTS = Histogram(
+    "embedding_batch_texts", "Textos por lote enviado ao modelo.", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
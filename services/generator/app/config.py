@@ -22,6 +22,22 @@ class Config:
     MAX_CONTEXT_LENGTH = int(os.getenv("MAX_CONTEXT_LENGTH", "4096"))
     PORT = int(os.getenv("PORT", "8002"))
 
+    # instâncias do modelo (cada uma atende uma requisição por vez) e fila de espera na frente delas
+    GENERATOR_INSTANCES = int(os.getenv("GENERATOR_INSTANCES", "1"))
+    MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", "16"))
+    QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", "120"))
+
+    # RAM máxima para estados KV de prefixos de prompt; 0 desativa o cache
+    PROMPT_CACHE_BYTES = int(os.getenv("PROMPT_CACHE_BYTES", str(1024 ** 3)))
+
+    # decodificação especulativa por prompt lookup: até SPECULATIVE_DRAFT_TOKENS tokens rascunhados a
+    # partir de n-gramas (até SPECULATIVE_MAX_NGRAM tokens) do próprio contexto e verificados num único
+    # passo do modelo. O llama_cpp passa a guardar os logits de todas as posições (mais RAM), por isso
+    # vem desligada
+    SPECULATIVE_DECODING = os.getenv("SPECULATIVE_DECODING", "false").lower() in ("1", "true", "yes")
+    SPECULATIVE_DRAFT_TOKENS = int(os.getenv("SPECULATIVE_DRAFT_TOKENS", "10"))
+    SPECULATIVE_MAX_NGRAM = int(os.getenv("SPECULATIVE_MAX_NGRAM", "2"))
+
     LOG_FILE_PATH = LOGS_DIR / "generator_service.log"
 
 settings = Config()
\ No newline at end of file
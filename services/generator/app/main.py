@@ -1,17 +1,29 @@
+import json
+import time
 import logging
 from logging.handlers import RotatingFileHandler
+from typing import Iterator, List, Optional
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 from llama_cpp import Llama
+from common.observability import RequestIdFilter, instrument
 
 from .config import settings
+from .metrics import LATENCY_BUCKETS, STAGE_SECONDS, record_draft, record_generation, timed
+from .prompt_cache import PrefixCache
+from .scheduler import ModelSlot, QueueFullError, Scheduler, Ticket
+from .speculative import PromptLookupDraft
 
 settings.LOGS_DIR.mkdir(exist_ok=True)
 file_handler = RotatingFileHandler(settings.LOG_FILE_PATH, maxBytes=10*1024*1024, backupCount=5)
-file_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s'))
+file_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] [%(name)s] [%(request_id)s] %(message)s'))
+file_handler.addFilter(RequestIdFilter())
 stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s'))
+stream_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] [%(request_id)s] %(message)s'))
+stream_handler.addFilter(RequestIdFilter())
 root_logger = logging.getLogger()
 root_logger.setLevel(logging.INFO)
 root_logger.addHandler(file_handler)
@@ -20,11 +32,41 @@ root_logger.addHandler(stream_handler)
 
 model_state = {}
 
+GENERATION_PARAMS = dict(
+    max_tokens=1024,
+    temperature=0.2,
+    top_p=0.9,
+    repeat_penalty=1.1,
+    stop=["</s>", "[/INST]"]
+)
+
 class GenerateRequest(BaseModel):
     prompt: str
+    stream: bool = False
+    # trecho inicial do prompt (ex.: system prompt) cujo estado KV deve ser reaproveitado entre requisições
+    cache_prefix: Optional[str] = None
+    # None segue SPECULATIVE_DECODING; False desliga a decodificação especulativa nesta requisição (A/B)
+    speculative: Optional[bool] = None
+
+class GenerationStats(BaseModel):
+    prompt_tokens: int = 0
+    generated_tokens: int = 0
+    time_to_first_token_ms: float = 0.0
+    tokens_per_second: Optional[float] = None
+    speculative: bool = False
+    draft_tokens: int = 0
+    accepted_draft_tokens: int = 0
 
 class GenerateResponse(BaseModel):
     text: str
+    stats: Optional[GenerationStats] = None
+
+class TokenizeRequest(BaseModel):
+    texts: List[str]
+
+class TokenizeResponse(BaseModel):
+    counts: List[int]
+    context_length: int
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -33,16 +75,32 @@ async def lifespan(app: FastAPI):
         logging.critical(msg)
         raise FileNotFoundError(msg)
 
-    logging.info(f"Carregando modelo gerador: {settings.AGENT_MODEL_PATH.name}")
+    instances = max(1, settings.GENERATOR_INSTANCES)
+    logging.info(f"Carregando modelo gerador: {settings.AGENT_MODEL_PATH.name} ({instances} instância(s))")
     try:
-        llm = Llama(
-            model_path=str(settings.AGENT_MODEL_PATH),
-            n_ctx=settings.MAX_CONTEXT_LENGTH,
-            n_gpu_layers=settings.N_GPU_LAYERS,
-            n_threads=settings.N_THREADS,
-            verbose=False
-        )
-        model_state["llm"] = llm
+        slots = []
+        if settings.SPECULATIVE_DECODING:
+            logging.info(
+                f"Decodificação especulativa por prompt lookup ativa ({settings.SPECULATIVE_DRAFT_TOKENS} tokens "
+                f"por rascunho, n-gramas de até {settings.SPECULATIVE_MAX_NGRAM} tokens)."
+            )
+        for index in range(instances):
+            draft = (
+                PromptLookupDraft(settings.SPECULATIVE_MAX_NGRAM, settings.SPECULATIVE_DRAFT_TOKENS)
+                if settings.SPECULATIVE_DECODING else None
+            )
+            llm = Llama(
+                model_path=str(settings.AGENT_MODEL_PATH),
+                n_ctx=settings.MAX_CONTEXT_LENGTH,
+                n_gpu_layers=settings.N_GPU_LAYERS,
+                # as instâncias dividem os núcleos em vez de disputá-los
+                n_threads=max(1, settings.N_THREADS // instances),
+                draft_model=draft,
+                verbose=False
+            )
+            prompt_cache = PrefixCache(settings.PROMPT_CACHE_BYTES // instances) if settings.PROMPT_CACHE_BYTES > 0 else None
+            slots.append(ModelSlot(index, llm, prompt_cache, draft))
+        model_state["scheduler"] = Scheduler(slots, settings.MAX_QUEUE_SIZE, settings.QUEUE_TIMEOUT)
         logging.info(f"--- Serviço Gerador pronto na porta {settings.PORT} ---")
         yield
     except Exception as e:
@@ -53,30 +111,171 @@ async def lifespan(app: FastAPI):
     model_state.clear()
 
 app = FastAPI(lifespan=lifespan)
+instrument(app, LATENCY_BUCKETS)
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def prepare_prompt(slot: ModelSlot, request: GenerateRequest) -> List[int]:
+    """Tokeniza o prompt (como o `Llama` faria) e posiciona o KV no prefixo em cache, quando houver."""
+    tokens = slot.llm.tokenize(request.prompt.encode("utf-8"), special=True)
+    cache = slot.prompt_cache
+    if cache and request.cache_prefix and request.prompt.startswith(request.cache_prefix):
+        cache.prepare(slot.llm, request.cache_prefix, tokens)
+    return tokens
+
+def run_generation(slot: ModelSlot, request: GenerateRequest, stats: GenerationStats) -> Iterator[str]:
+    """
+    Gera a resposta em streaming no slot, registrando em `stats` (e nas métricas) tokens do prompt e
+    gerados, tempo até o primeiro token, tokens/s e, com decodificação especulativa, os tokens
+    rascunhados e aceitos. O modo não-streaming também passa por aqui, juntando os pedaços.
+    """
+    start = time.perf_counter()
+    with timed("prompt_prepare"):
+        tokens = prepare_prompt(slot, request)
+    prepared = time.perf_counter()
+    draft = slot.draft if request.speculative is not False else None
+    # o Llama consulta `draft_model` a cada passo; desligar por requisição só exige trocá-lo aqui
+    slot.llm.draft_model = draft
+    if draft:
+        draft.begin()
+    first_token_at = None
+    chunks = 0
+    try:
+        for chunk in slot.llm(tokens, stream=True, **GENERATION_PARAMS):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            chunks += 1
+            yield chunk["choices"][0]["text"]
+    finally:
+        slot.llm.draft_model = slot.draft
+    end = time.perf_counter()
+    first_token_at = first_token_at or end
+    STAGE_SECONDS.labels("prompt_eval").observe(first_token_at - prepared)
+    # um pedaço do stream pode juntar vários tokens; o KV diz quantos foram de fato avaliados
+    generated = max(chunks, slot.llm.n_tokens - len(tokens))
+    decode_seconds = end - first_token_at
+    record_generation(len(tokens), generated, first_token_at - start, decode_seconds)
+    stats.prompt_tokens, stats.generated_tokens = len(tokens), generated
+    stats.time_to_first_token_ms = round((first_token_at - start) * 1000, 1)
+    if generated > 1 and decode_seconds > 0:
+        stats.tokens_per_second = round((generated - 1) / decode_seconds, 2)
+    speculation = ""
+    if draft:
+        stats.speculative = True
+        stats.draft_tokens, stats.accepted_draft_tokens = draft.finish(slot.llm.input_ids[: slot.llm.n_tokens])
+        record_draft(stats.draft_tokens, stats.accepted_draft_tokens)
+        speculation = f", {stats.accepted_draft_tokens}/{stats.draft_tokens} tokens rascunhados aceitos"
+    logging.info(
+        f"Geração: {len(tokens)} tokens de prompt, {generated} gerados, primeiro token em "
+        f"{stats.time_to_first_token_ms:.0f}ms, {stats.tokens_per_second or '-'} tokens/s{speculation}."
+    )
+
+def stream_tokens(scheduler: Scheduler, ticket: Ticket, slot: ModelSlot, request: GenerateRequest) -> Iterator[str]:
+    """
+    Gera a resposta token a token como eventos SSE: `data: {"token": ...}` e, ao final, `event: done`.
+    O slot já foi obtido antes da resposta começar e é devolvido assim que a geração termina.
+    """
+    try:
+        started = False
+        stats = GenerationStats()
+        for token in run_generation(slot, request, stats):
+            if not started:
+                token = token.lstrip()
+            if token:
+                started = True
+                yield sse_event({"token": token})
+        logging.info("Resposta gerada com sucesso (streaming).")
+        yield sse_event(stats.model_dump(), event="done")
+    except Exception as e:
+        logging.error(f"Erro na geração de texto (streaming): {e}", exc_info=True)
+        yield sse_event({"detail": "Falha ao gerar resposta."}, event="error")
+    finally:
+        scheduler.finish(ticket)
+
+def queue_full(e: QueueFullError) -> HTTPException:
+    logging.warning(f"Requisição de geração recusada: {e}")
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
 @app.post("/generate", response_model=GenerateResponse)
 def generate_text(request: GenerateRequest):
-    llm = model_state.get("llm")
-    if not llm:
+    scheduler = model_state.get("scheduler")
+    if not scheduler:
         raise HTTPException(status_code=503, detail="Modelo não inicializado.")
 
+    if request.stream:
+        logging.info(f"Recebida requisição de geração (streaming) com prompt: '{request.prompt[:100]}...'")
+        # espera pelo slot antes de responder: fila cheia ou espera esgotada ainda viram um 429 de verdade
+        try:
+            ticket = scheduler.admit()
+            slot = scheduler.acquire(ticket)
+        except QueueFullError as e:
+            raise queue_full(e)
+        # a tarefa de fundo libera o ticket mesmo se o cliente desconectar antes do stream começar
+        return StreamingResponse(
+            stream_tokens(scheduler, ticket, slot, request), media_type="text/event-stream",
+            background=BackgroundTask(scheduler.finish, ticket)
+        )
+
     try:
         logging.info(f"Recebida requisição de geração com prompt: '{request.prompt[:100]}...'")
-        output = llm(
-            request.prompt,
-            max_tokens=1024,
-            temperature=0.2,
-            top_p=0.9,
-            repeat_penalty=1.1,
-            stop=["</s>", "[/INST]"]
-        )
-        response_text = output["choices"][0]["text"].strip()
+        stats = GenerationStats()
+        with scheduler.slot() as slot:
+            response_text = "".join(run_generation(slot, request, stats)).strip()
         logging.info("Resposta gerada com sucesso.")
-        return GenerateResponse(text=response_text)
+        return GenerateResponse(text=response_text, stats=stats)
+    except QueueFullError as e:
+        raise queue_full(e)
     except Exception as e:
         logging.error(f"Erro na geração de texto: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Falha ao gerar resposta.")
 
+@app.post("/tokenize", response_model=TokenizeResponse)
+def tokenize_texts(request: TokenizeRequest):
+    """Conta os tokens de cada texto com o tokenizador do modelo; não ocupa um slot de geração."""
+    scheduler = model_state.get("scheduler")
+    if not scheduler:
+        raise HTTPException(status_code=503, detail="Modelo não inicializado.")
+    llm = scheduler.slots[0].llm
+    counts = [len(llm.tokenize(text.encode("utf-8"), add_bos=False, special=True)) for text in request.texts]
+    return TokenizeResponse(counts=counts, context_length=llm.n_ctx())
+
+@app.get("/queue/stats")
+def queue_stats():
+    scheduler = model_state.get("scheduler")
+    if not scheduler:
+        raise HTTPException(status_code=503, detail="Modelo não inicializado.")
+    return scheduler.stats()
+
+@app.get("/cache/stats")
+def cache_stats():
+    scheduler = model_state.get("scheduler")
+    if not scheduler:
+        raise HTTPException(status_code=503, detail="Modelo não inicializado.")
+    caches = [slot.prompt_cache.stats() for slot in scheduler.slots if slot.prompt_cache]
+    if not caches:
+        return {"enabled": False}
+    totals = {k: sum(c[k] for c in caches) for k in ("hits", "misses", "bypassed", "entries", "bytes", "capacity_bytes")}
+    lookups = totals["hits"] + totals["misses"]
+    totals["hit_rate"] = round(totals["hits"] / lookups, 4) if lookups else None
+    return {"enabled": True, **totals}
+
+@app.get("/speculative/stats")
+def speculative_stats():
+    scheduler = model_state.get("scheduler")
+    if not scheduler:
+        raise HTTPException(status_code=503, detail="Modelo não inicializado.")
+    drafts = [slot.draft.stats() for slot in scheduler.slots if slot.draft]
+    if not drafts:
+        return {"enabled": False}
+    totals = {k: sum(d[k] for d in drafts) for k in ("requests", "drafted", "accepted")}
+    totals["acceptance_rate"] = round(totals["accepted"] / totals["drafted"], 4) if totals["drafted"] else None
+    return {
+        "enabled": True, "draft_tokens": settings.SPECULATIVE_DRAFT_TOKENS,
+        "max_ngram_size": settings.SPECULATIVE_MAX_NGRAM, **totals,
+    }
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
\ No newline at end of file
@@ -0,0 +1,57 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import Counter, Histogram
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+STAGE_SECONDS = Histogram(
+    "generator_stage_duration_seconds",
+    "Duração das etapas da geração: queue (espera por um slot), prompt_prepare (tokenização e cache de "
+    "prefixo), prompt_eval (até o primeiro token) e decode (do primeiro ao último token).",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "generator_time_to_first_token_seconds", "Tempo entre obter um slot e o primeiro token gerado.", buckets=LATENCY_BUCKETS
+)
+PROMPT_TOKENS = Histogram("generator_prompt_tokens", "Tokens do prompt por requisição.", buckets=TOKEN_BUCKETS)
+GENERATED_TOKENS = Histogram("generator_generated_tokens", "Tokens gerados por requisição.", buckets=TOKEN_BUCKETS)
+TOKENS_PER_SECOND = Histogram(
+    "generator_tokens_per_second", "Velocidade de decodificação (tokens gerados / tempo de decode).",
+    buckets=(1, 2, 4, 6, 8, 12, 16, 24, 32, 48, 64, 128),
+)
+TOKENS = Counter("generator_tokens_total", "Tokens processados, por tipo (prompt ou generated).", ["kind"])
+DRAFT_TOKENS = Counter(
+    "generator_draft_tokens_total", "Tokens rascunhados pela decodificação especulativa, por resultado.", ["result"]
+)
+DRAFT_ACCEPTANCE = Histogram(
+    "generator_draft_acceptance_ratio", "Fração dos tokens rascunhados aceitos, por geração especulativa.",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+def record_generation(prompt_tokens: int, generated_tokens: int, first_token_seconds: float, decode_seconds: float):
+    TIME_TO_FIRST_TOKEN.observe(first_token_seconds)
+    STAGE_SECONDS.labels("decode").observe(decode_seconds)
+    PROMPT_TOKENS.observe(prompt_tokens)
+    GENERATED_TOKENS.observe(generated_tokens)
+    TOKENS.labels("prompt").inc(prompt_tokens)
+    TOKENS.labels("generated").inc(generated_tokens)
+    if generated_tokens > 1 and decode_seconds > 0:
+        # o primeiro token sai junto com a avaliação do prompt; a taxa mede só os seguintes
+        TOKENS_PER_SECOND.observe((generated_tokens - 1) / decode_seconds)
+
+def record_draft(drafted: int, accepted: int):
+    DRAFT_TOKENS.labels("accepted").inc(accepted)
+    DRAFT_TOKENS.labels("rejected").inc(drafted - accepted)
+    if drafted:
+        DRAFT_ACCEPTANCE.observe(accepted / drafted)
@@ -0,0 +1,103 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from llama_cpp import Llama
+
+log = logging.getLogger(__name__)
+
+MIN_PREFIX_TOKENS = 8
+
+class PrefixCache:
+    """
+    Cache LRU de estados KV de prefixos de prompt compartilhados (ex.: o system prompt do RAG),
+    usando `save_state`/`load_state` do llama_cpp e limitado a `capacity_bytes` de RAM.
+    Deve ser usado com o modelo travado: `prepare` altera o contexto do `Llama`.
+
+    Com um único prefixo o cache não faz nada: o llama_cpp já reaproveita o maior prefixo comum entre
+    o prompt e o KV residente. Ele só compensa quando prefixos se alternam no mesmo slot (system
+    prompts diferentes, ou o prompt de outro cliente entre dois do RAG): o KV residente deixa de
+    ter o prefixo e, em vez de avaliá-lo de novo, o estado salvo é restaurado.
+    """
+
+    def __init__(self, capacity_bytes: int):
+        self.capacity_bytes = capacity_bytes
+        self._entries: "OrderedDict[str, Tuple[List[int], object]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def _common_prefix(a: List[int], b: List[int]) -> int:
+        n = 0
+        for x, y in zip(a, b):
+            if x != y:
+                break
+            n += 1
+        return n
+
+    def prepare(self, llm: Llama, prefix: str, prompt_tokens: List[int]) -> int:
+        """
+        Deixa o KV do modelo posicionado no fim do prefixo, restaurando ou criando o estado salvo.
+        Retorna o número de tokens de prefixo que não precisarão ser avaliados de novo.
+        """
+        key = hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+        entry = self._entries.get(key)
+        resident = self._common_prefix(llm.input_ids[: llm.n_tokens].tolist(), prompt_tokens)
+
+        if entry is not None and prompt_tokens[: len(entry[0])] == entry[0]:
+            prefix_tokens, state = entry
+            self._entries.move_to_end(key)
+            n = len(prefix_tokens)
+            if resident < n:
+                llm.load_state(state)
+                self.hits += 1
+            # com o prefixo ainda no KV, o llama_cpp o reaproveita sem ajuda do cache
+            return n
+
+        # tokeniza o prefixo isoladamente e fica só com a parte que coincide com o prompt completo,
+        # pois a fronteira do prefixo pode ser tokenizada de forma diferente
+        prefix_tokens = llm.tokenize(prefix.encode("utf-8"), special=True)
+        n = self._common_prefix(prefix_tokens, prompt_tokens)
+        if n < MIN_PREFIX_TOKENS or n >= len(prompt_tokens):
+            self.bypassed += 1
+            return 0
+
+        prefix_tokens = prompt_tokens[:n]
+        if resident >= n:
+            # no KV mas sem estado salvo (despejado do cache): o llama_cpp o reaproveita; o estado
+            # é salvo na próxima vez em que outro prefixo o tiver tirado de lá
+            return n
+        llm.reset()
+        llm.eval(prefix_tokens)
+        state = llm.save_state()
+        self.misses += 1
+        self._store(key, prefix_tokens, state)
+        return n
+
+    def _store(self, key: str, prefix_tokens: List[int], state):
+        size = state.llama_state_size
+        if size > self.capacity_bytes:
+            log.warning(f"Estado do prefixo ({size} bytes) excede a capacidade do cache; não será guardado.")
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1].llama_state_size
+        self._entries[key] = (prefix_tokens, state)
+        self._bytes += size
+        while self._bytes > self.capacity_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted.llama_state_size
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "capacity_bytes": self.capacity_bytes,
+        }
@@ -0,0 +1,129 @@
+import math
+import time
+import queue
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from llama_cpp import Llama
+
+from .metrics import STAGE_SECONDS
+from .prompt_cache import PrefixCache
+from .speculative import PromptLookupDraft
+
+class QueueFullError(Exception):
+    """Fila de geração cheia (ou espera excedida); o cliente deve tentar de novo após `retry_after` segundos."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Fila de geração cheia; tente novamente em {retry_after}s.")
+        self.retry_after = retry_after
+
+class ModelSlot:
+    """Uma instância do modelo com seu próprio cache de prefixos (o estado KV é por contexto) e draft model."""
+
+    def __init__(self, index: int, llm: Llama, prompt_cache: Optional[PrefixCache] = None,
+                 draft: Optional[PromptLookupDraft] = None):
+        self.index = index
+        self.llm = llm
+        self.prompt_cache = prompt_cache
+        self.draft = draft
+
+class Ticket:
+    def __init__(self):
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.slot: Optional[ModelSlot] = None
+        self.state = "waiting"
+
+class Scheduler:
+    """
+    Controle de admissão na frente do modelo: cada requisição ocupa um `ModelSlot` por vez e até
+    `max_queue` requisições aguardam por um slot livre. Acima disso (ou após `queue_timeout` segundos
+    de espera) a requisição é recusada com `QueueFullError`.
+    """
+
+    def __init__(self, slots: List[ModelSlot], max_queue: int, queue_timeout: float):
+        self.slots = slots
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._free: queue.Queue = queue.Queue()
+        for slot in slots:
+            self._free.put(slot)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._wait_times: deque = deque(maxlen=1000)
+        self._service_times: deque = deque(maxlen=100)
+
+    def retry_after(self) -> int:
+        service = sum(self._service_times) / len(self._service_times) if self._service_times else 10.0
+        return max(1, math.ceil(service * (self.waiting + 1) / len(self.slots)))
+
+    def admit(self) -> Ticket:
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(self.retry_after())
+            self.waiting += 1
+            self.admitted += 1
+        return Ticket()
+
+    def acquire(self, ticket: Ticket) -> ModelSlot:
+        try:
+            slot = self._free.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            with self._lock:
+                self.timed_out += 1
+            self.finish(ticket)
+            raise QueueFullError(self.retry_after())
+        with self._lock:
+            ticket.state, ticket.slot, ticket.started_at = "running", slot, time.monotonic()
+            self.waiting -= 1
+            self.active += 1
+            self._wait_times.append(ticket.started_at - ticket.enqueued_at)
+        STAGE_SECONDS.labels("queue").observe(ticket.started_at - ticket.enqueued_at)
+        return slot
+
+    def finish(self, ticket: Ticket):
+        """Libera o ticket; idempotente, pode ser chamado tanto pelo fluxo normal quanto por limpeza."""
+        with self._lock:
+            if ticket.state == "waiting":
+                self.waiting -= 1
+            elif ticket.state == "running":
+                self.active -= 1
+                self._service_times.append(time.monotonic() - ticket.started_at)
+                self._free.put(ticket.slot)
+            ticket.state = "done"
+
+    @contextmanager
+    def slot(self, ticket: Optional[Ticket] = None) -> Iterator[ModelSlot]:
+        ticket = ticket or self.admit()
+        try:
+            yield self.acquire(ticket)
+        finally:
+            self.finish(ticket)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            waits = sorted(self._wait_times)
+
+        def percentile(p: float) -> Optional[float]:
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 4) if waits else None
+
+        return {
+            "instances": len(self.slots),
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_seconds_avg": round(sum(waits) / len(waits), 4) if waits else None,
+            "wait_seconds_p50": percentile(0.50),
+            "wait_seconds_p95": percentile(0.95),
+            "wait_seconds_max": round(waits[-1], 4) if waits else None,
+        }
@@ -0,0 +1,50 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+
+class PromptLookupDraft(LlamaPromptLookupDecoding):
+    """
+    Draft model de prompt lookup: rascunha os próximos tokens a partir de n-gramas já vistos no
+    contexto, o que acerta muito quando a resposta copia trechos do prompt (artigos citados pelo RAG).
+    O `Llama` não informa quantos tokens rascunhados aceitou; isso é inferido na chamada seguinte,
+    comparando o rascunho anterior com os tokens que de fato entraram no contexto. Cada instância
+    pertence a um `ModelSlot`, que atende uma geração por vez.
+    """
+
+    def __init__(self, max_ngram_size: int, num_pred_tokens: int):
+        super().__init__(max_ngram_size=max_ngram_size, num_pred_tokens=num_pred_tokens)
+        self._pending: Optional[Tuple[int, np.ndarray]] = None
+        self._request_start = (0, 0)
+        self.drafted = 0
+        self.accepted = 0
+        self.requests = 0
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs) -> np.ndarray:
+        self._settle(input_ids)
+        draft = super().__call__(input_ids, **kwargs)
+        self._pending = (len(input_ids), draft)
+        self.drafted += len(draft)
+        return draft
+
+    def _settle(self, input_ids: np.ndarray):
+        if self._pending is None:
+            return
+        start, draft = self._pending
+        self._pending = None
+        produced = input_ids[start : start + len(draft)]
+        mismatch = np.flatnonzero(produced != draft[: len(produced)])
+        self.accepted += int(mismatch[0]) if len(mismatch) else len(produced)
+
+    def begin(self):
+        self._pending = None
+        self._request_start = (self.drafted, self.accepted)
+
+    def finish(self, input_ids: np.ndarray) -> Tuple[int, int]:
+        """Fecha a contabilidade da geração com os tokens finais do contexto; devolve (rascunhados, aceitos)."""
+        self._settle(input_ids)
+        self.requests += 1
+        return self.drafted - self._request_start[0], self.accepted - self._request_start[1]
+
+    def stats(self) -> Dict:
+        return {"requests": self.requests, "drafted": self.drafted, "accepted": self.accepted}
@@ -0,0 +1,120 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+class AnswerCache:
+    """
+    Cache semântico de respostas: a pergunta é comparada por similaridade de cosseno com as perguntas
+    já respondidas e, acima de `threshold`, a resposta guardada é reutilizada sem passar pelo gerador.
+    Entradas expiram após `ttl` segundos, são despejadas por LRU acima de `capacity` e são invalidadas
+    quando qualquer chunk usado no contexto é reindexado ou removido. `epoch` muda a cada alteração no
+    índice: uma resposta montada antes da alteração não é guardada (`store` com a época da recuperação).
+    """
+
+    def __init__(self, capacity: int, ttl: float, threshold: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None  # (capacity, dim), vetores normalizados
+        self._slots: "OrderedDict[int, Dict]" = OrderedDict()  # ordem LRU
+        self._free = list(range(capacity))
+        self._by_chunk: Dict[str, Set[int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.epoch = 0
+        self.stale_skipped = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding: List[float]) -> Optional[str]:
+        vector = self._normalize(embedding)
+        with self._lock:
+            if not self._slots or self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None
+            slots = np.fromiter(self._slots.keys(), dtype=np.int64)
+            scores = self._matrix[slots] @ vector
+            best = int(np.argmax(scores))
+            slot = int(slots[best])
+            entry = self._slots[slot]
+            if scores[best] < self.threshold or entry["expires_at"] < time.time():
+                if entry["expires_at"] < time.time():
+                    self._remove(slot)
+                self.misses += 1
+                return None
+            self._slots.move_to_end(slot)
+            self.hits += 1
+            return entry["answer"]
+
+    def store(self, embedding: List[float], answer: str, chunk_ids: Iterable[str], epoch: Optional[int] = None):
+        vector = self._normalize(embedding)
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                # o índice mudou entre a recuperação e o fim da geração: o contexto pode estar desatualizado
+                self.stale_skipped += 1
+                return
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                # primeira entrada (ou troca de modelo de embedding): aloca a matriz na dimensão certa
+                self._matrix = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+                self._clear()
+            if not self._free:
+                self._remove(next(iter(self._slots)))
+            slot = self._free.pop()
+            self._matrix[slot] = vector
+            ids = set(chunk_ids)
+            self._slots[slot] = {"answer": answer, "chunk_ids": ids, "expires_at": time.time() + self.ttl}
+            for cid in ids:
+                self._by_chunk.setdefault(cid, set()).add(slot)
+
+    def invalidate(self, chunk_ids: Iterable[str]):
+        with self._lock:
+            self.epoch += 1
+            if not self._by_chunk:
+                return
+            for cid in chunk_ids:
+                for slot in list(self._by_chunk.get(cid, ())):
+                    self._remove(slot)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.epoch += 1
+            self._clear()
+
+    def _clear(self):
+        self._slots.clear()
+        self._by_chunk.clear()
+        self._free = list(range(self.capacity))
+
+    def _remove(self, slot: int):
+        entry = self._slots.pop(slot)
+        for cid in entry["chunk_ids"]:
+            slots = self._by_chunk.get(cid)
+            if slots:
+                slots.discard(slot)
+                if not slots:
+                    del self._by_chunk[cid]
+        self._free.append(slot)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._slots),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "invalidations": self.invalidations,
+            "stale_skipped": self.stale_skipped,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl,
+        }
@@ -0,0 +1,200 @@
+import re
+import logging
+from typing import Iterable, Iterator, List, Optional
+
+import httpx
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+# títulos de markdown e divisões de normas ("CAPÍTULO II", "Seção I") sempre abrem um novo chunk
+HEADING_RE = re.compile(
+    r"^(#{1,6}\s|(CAP[IÍ]TULO|Cap[ií]tulo|T[IÍ]TULO|T[ií]tulo|SE[CÇ][AÃ]O|Se[cç][aã]o|LIVRO|ANEXO)\s+[IVXLCDM\d]+)"
+)
+# início de artigo ("Art. 5º", "Art 12") ou parágrafo de norma ("§ 1º", "Parágrafo único")
+BLOCK_RE = re.compile(r"^(Art\.?\s*\d+|§\s*\d+|Par[áa]grafo\s+[úu]nico)")
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?;:])\s+")
+# abreviações que terminam em ponto sem encerrar a frase
+ABBREVIATIONS = {"art", "arts", "inc", "n", "nº", "no", "p", "pág", "pp", "sr", "sra", "dr", "dra", "cf", "ex", "fl", "fls", "al"}
+
+def signature() -> str:
+    """Identifica a configuração de chunking; ao mudar, os arquivos já indexados precisam ser rechunkados."""
+    if settings.CHUNK_MODE == "tokens":
+        return f"tokens:{settings.CHUNK_MAX_TOKENS}:{settings.CHUNK_OVERLAP_TOKENS}"
+    return f"words:{settings.CHUNK_SIZE}:{settings.CHUNK_OVERLAP}"
+
+class TokenCounter:
+    """
+    Conta tokens com o tokenizador do serviço de embedding (`/tokenize`), em lotes.
+    Se o serviço não responder, usa uma estimativa conservadora por caracteres.
+    """
+
+    BATCH_SIZE = 1024
+
+    def __init__(self, url: Optional[str]):
+        self.url = url
+        self.context_length: Optional[int] = None
+        self._client: Optional[httpx.Client] = None
+        self._warned = False
+
+    def count(self, texts: List[str]) -> List[int]:
+        if self._client is None:
+            self._client = httpx.Client(timeout=httpx.Timeout(settings.EMBEDDING_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT))
+        counts: List[int] = []
+        for i in range(0, len(texts), self.BATCH_SIZE):
+            part = texts[i : i + self.BATCH_SIZE]
+            try:
+                response = self._client.post(self.url, json={"texts": part})
+                response.raise_for_status()
+                data = response.json()
+                counts.extend(data["counts"])
+                self.context_length = data["context_length"]
+            except (httpx.HTTPError, KeyError, TypeError) as e:
+                if not self._warned:
+                    log.warning(f"Falha ao contar tokens no serviço de embedding, usando estimativa: {e}")
+                    self._warned = True
+                counts.extend(len(text) // 3 + 1 for text in part)
+        return counts
+
+class Unit:
+    """Frase (ou pedaço de frase longa) com sua contagem de tokens e a posição na estrutura do texto."""
+
+    def __init__(self, text: str, tokens: int, block_start: bool = False, heading: bool = False):
+        self.text = text
+        self.tokens = tokens
+        self.block_start = block_start
+        self.heading = heading
+
+def split_sentences(text: str) -> List[str]:
+    sentences: List[str] = []
+    for piece in SENTENCE_SPLIT_RE.split(text):
+        if sentences and sentences[-1].rsplit(None, 1)[-1].rstrip(".").lower() in ABBREVIATIONS:
+            sentences[-1] = f"{sentences[-1]} {piece}"
+        else:
+            sentences.append(piece)
+    return [s for s in sentences if s]
+
+def split_blocks(segment: str) -> Iterator[List[str]]:
+    """Separa o texto em blocos estruturais (parágrafos, artigos, títulos), com as linhas de cada um."""
+    lines: List[str] = []
+    for raw in segment.splitlines():
+        line = raw.strip()
+        if not line or HEADING_RE.match(line) or BLOCK_RE.match(line):
+            if lines:
+                yield lines
+                lines = []
+            if not line:
+                continue
+        lines.append(line)
+    if lines:
+        yield lines
+
+class StructuralChunker:
+    """
+    Chunking por tokens do modelo de embedding respeitando a estrutura do texto: títulos abrem um
+    novo chunk, e cortes preferem fronteiras de artigo/parágrafo a meio de bloco. Nenhum chunk passa de
+    `max_tokens` (nem do contexto do modelo). Quando o corte cai no meio de um bloco, as últimas
+    frases (até `overlap_tokens`) são repetidas no início do chunk seguinte.
+    """
+
+    def __init__(self, counter: TokenCounter, max_tokens: int, overlap_tokens: int):
+        self.counter = counter
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    @property
+    def limit(self) -> int:
+        if self.counter.context_length:
+            # um token de folga para o BOS que o modelo adiciona
+            return min(self.max_tokens, self.counter.context_length - 1)
+        return self.max_tokens
+
+    @staticmethod
+    def _cost(units: List[Unit]) -> int:
+        # um token de folga por junção entre frases
+        return sum(u.tokens for u in units) + len(units)
+
+    def _units(self, segment: str) -> List[Unit]:
+        units: List[Unit] = []
+        for lines in split_blocks(segment):
+            heading = bool(HEADING_RE.match(lines[0]))
+            for i, sentence in enumerate(split_sentences(" ".join(lines))):
+                units.append(Unit(sentence, 0, block_start=i == 0, heading=heading and i == 0))
+        for unit, tokens in zip(units, self.counter.count([u.text for u in units])):
+            unit.tokens = tokens
+        return units
+
+    def _split_long(self, unit: Unit) -> List[Unit]:
+        """Corta uma frase maior que o limite em janelas de palavras, conferindo cada pedaço."""
+        words = unit.text.split()
+        size = max(1, int(len(words) * self.limit / (unit.tokens + 1) * 0.9))
+        pieces = [" ".join(words[i : i + size]) for i in range(0, len(words), size)]
+        result: List[Unit] = []
+        for piece, tokens in zip(pieces, self.counter.count(pieces)):
+            part = Unit(piece, tokens)
+            result.extend(self._split_long(part) if tokens + 1 >= self.limit and len(piece.split()) > 1 else [part])
+        if result:
+            result[0].block_start, result[0].heading = unit.block_start, unit.heading
+        return result
+
+    @staticmethod
+    def _join(units: List[Unit]) -> str:
+        parts = []
+        for i, unit in enumerate(units):
+            if i:
+                parts.append("\n" if unit.block_start else " ")
+            parts.append(unit.text)
+        return "".join(parts)
+
+    def _overlap(self, units: List[Unit]) -> List[Unit]:
+        tail: List[Unit] = []
+        for unit in reversed(units):
+            if self._cost(tail + [unit]) > self.overlap_tokens:
+                break
+            tail.insert(0, unit)
+        return tail
+
+    def iter_chunks(self, segments: Iterable[str]) -> Iterator[str]:
+        current: List[Unit] = []
+        fresh = 0  # frases de `current` que ainda não saíram em nenhum chunk
+        for segment in segments:
+            for unit in self._units(segment):
+                pieces = self._split_long(unit) if unit.tokens + 1 >= self.limit else [unit]
+                for piece in pieces:
+                    if piece.heading:
+                        if not fresh:
+                            # a sobreposição não atravessa títulos
+                            current = []
+                        elif not all(u.heading for u in current[-fresh:]):
+                            # títulos seguidos (ex.: "# Norma" e "CAPÍTULO I") ficam no mesmo chunk
+                            yield self._join(current)
+                            current, fresh = [], 0
+                    while current and self._cost(current + [piece]) > self.limit:
+                        if not fresh:
+                            # só sobrou sobreposição e ela não cabe junto da próxima frase
+                            current = []
+                            break
+                        cut = self._boundary_cut(current, len(current) - fresh)
+                        if cut:
+                            yield self._join(current[:cut])
+                            current = current[cut:]
+                            fresh = len(current)
+                        else:
+                            yield self._join(current)
+                            current = self._overlap(current)
+                            fresh = 0
+                    current.append(piece)
+                    fresh += 1
+        if fresh:
+            yield self._join(current)
+
+    def _boundary_cut(self, units: List[Unit], carried: int) -> int:
+        """
+        Última fronteira de bloco que deixa o chunk ao menos meio cheio e com alguma frase além das
+        `carried` repetidas do chunk anterior; 0 se não houver.
+        """
+        for i in range(len(units) - 1, carried, -1):
+            if units[i].block_start and self._cost(units[:i]) >= self.limit // 2:
+                return i
+        return 0
@@ -7,6 +7,9 @@ load_dotenv()
 class Config:
     BASE_DIR = Path('/app')
     DB_DIR = BASE_DIR / ".rag_db"
+    MANIFEST_PATH = DB_DIR / "index_manifest.json"
+    LEXICAL_INDEX_PATH = DB_DIR / "lexical_index.pkl"
+    DEDUP_INDEX_PATH = DB_DIR / "dedup_index.pkl"
     DATA_DIR = BASE_DIR / "data"
     LOGS_DIR = BASE_DIR / "app" / "logs"
     
@@ -29,16 +32,93 @@ class Config:
     )
 
     N_THREADS = int(os.getenv("N_THREADS", "4"))
+    EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(N_THREADS)))
+    EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "120"))
     
+    # "words": janela deslizante de CHUNK_SIZE palavras com CHUNK_OVERLAP de sobreposição (padrão);
+    # "tokens": chunks estruturais medidos com o tokenizador do modelo de embedding. Trocar o modo
+    # muda todos os chunks e provoca a reindexação completa dos documentos na próxima subida.
+    CHUNK_MODE = os.getenv("CHUNK_MODE", "words").lower()
+    CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
     CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "512"))
     CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))
     EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "2"))
+    EMBEDDING_QUEUE_SIZE = int(os.getenv("EMBEDDING_QUEUE_SIZE", "8"))
+    # intervalo, em segundos, entre gravações completas dos índices auxiliares durante a indexação;
+    # entre elas só as entradas novas do manifesto vão para o disco
+    INDEX_CHECKPOINT_INTERVAL = float(os.getenv("INDEX_CHECKPOINT_INTERVAL", "300"))
     TOP_K_RESULTS = int(os.getenv("TOP_K_RESULTS", "3"))
 
+    # chunks com similaridade de Jaccard estimada (MinHash/LSH) >= DEDUP_THRESHOLD a um já indexado
+    # não são embedados; o chunk existente passa a listar as duas fontes
+    DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+    DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+    DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "128"))
+    DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
+
+    # busca híbrida: candidatos vetoriais e léxicos (BM25) fundidos por RRF até TOP_K_RESULTS
+    HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+    VECTOR_TOP_K = int(os.getenv("VECTOR_TOP_K", str(TOP_K_RESULTS)))
+    LEXICAL_TOP_K = int(os.getenv("LEXICAL_TOP_K", str(TOP_K_RESULTS)))
+    RRF_K = int(os.getenv("RRF_K", "60"))
+
+    # orçamento de tokens do contexto no prompt, medido com o tokenizador do gerador, e tokens
+    # reservados para a resposta (o max_tokens do gerador)
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2048"))
+    RESPONSE_TOKEN_RESERVE = int(os.getenv("RESPONSE_TOKEN_RESERVE", "1024"))
+
+    # cache semântico de respostas; ANSWER_CACHE_SIZE=0 desativa
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+    ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
     COLLECTION_NAME = os.getenv("COLLECTION_NAME", "rag_documentos")
+
+    # "chroma" (HNSW do ChromaDB) ou "numpy" (matriz memory-mapped com busca exata por cosseno);
+    # no "numpy", NUMPY_STORE_DTYPE=int8 quantiza os vetores e ocupa 1/4 do espaço do float32
+    VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma").lower()
+    NUMPY_STORE_DIR = DB_DIR / "numpy_store"
+    NUMPY_STORE_DTYPE = os.getenv("NUMPY_STORE_DTYPE", "float32").lower()
+    # fração de linhas removidas a partir da qual o índice NumPy é compactado
+    NUMPY_STORE_COMPACT_RATIO = float(os.getenv("NUMPY_STORE_COMPACT_RATIO", "0.25"))
     
     EMBEDDING_SERVICE_URL = os.getenv("EMBEDDING_SERVICE_URL")
+    EMBEDDING_TOKENIZE_URL = os.getenv("EMBEDDING_TOKENIZE_URL") or (
+        EMBEDDING_SERVICE_URL.rsplit("/", 1)[0] + "/tokenize" if EMBEDDING_SERVICE_URL else None
+    )
     GENERATOR_SERVICE_URL = os.getenv("GENERATOR_SERVICE_URL")
+    GENERATOR_TOKENIZE_URL = os.getenv("GENERATOR_TOKENIZE_URL") or (
+        GENERATOR_SERVICE_URL.rsplit("/", 1)[0] + "/tokenize" if GENERATOR_SERVICE_URL else None
+    )
+
+    # formato da resposta do /embed: "f32" ou "f16" (binário) ou "json"
+    EMBEDDING_WIRE_FORMAT = os.getenv("EMBEDDING_WIRE_FORMAT", "f32")
+
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "90"))
+    GENERATOR_TIMEOUT = float(os.getenv("GENERATOR_TIMEOUT", "600"))
+    # contagem de tokens do empacotamento de contexto: conexões próprias, separadas das gerações
+    TOKENIZE_TIMEOUT = float(os.getenv("TOKENIZE_TIMEOUT", "10"))
+    EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "8"))
+    GENERATOR_MAX_CONCURRENCY = int(os.getenv("GENERATOR_MAX_CONCURRENCY", "4"))
+
+    # watcher dos diretórios de dados: reindexa arquivos criados, alterados ou removidos sem reiniciar.
+    # WATCH_MODE: "auto" (inotify, com polling se indisponível), "inotify" ou "poll"
+    WATCH_ENABLED = os.getenv("WATCH_ENABLED", "true").lower() in ("1", "true", "yes")
+    WATCH_MODE = os.getenv("WATCH_MODE", "auto").lower()
+    WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "2"))
+    WATCH_MAX_DELAY = float(os.getenv("WATCH_MAX_DELAY", "30"))
+    WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "10"))
+    # embedding da reindexação em segundo plano: chunks/s (0 = sem limite) e lotes simultâneos
+    WATCH_EMBEDDING_RATE = float(os.getenv("WATCH_EMBEDDING_RATE", "64"))
+    WATCH_EMBEDDING_CONCURRENCY = int(os.getenv("WATCH_EMBEDDING_CONCURRENCY", "1"))
+
+    # POST /chat/batch: perguntas por lote e gerações simultâneas de um lote (abaixo de GENERATOR_MAX_CONCURRENCY)
+    BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+    BATCH_GENERATION_CONCURRENCY = int(os.getenv("BATCH_GENERATION_CONCURRENCY", "2"))
+    BATCH_BUSY_RETRIES = int(os.getenv("BATCH_BUSY_RETRIES", "5"))
 
     LOG_FILE_PATH = LOGS_DIR / "rag_service.log"
 
@@ -0,0 +1,104 @@
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+SEPARATOR = "\n\n---\n\n"
+# sobreposições menores que isso são coincidência, não a janela repetida pelo chunking
+MIN_OVERLAP_WORDS = 8
+
+TokenCounter = Callable[[List[str]], Awaitable[Tuple[List[int], Optional[int]]]]
+
+def merge_overlap(first: str, second: str, max_words: int) -> Optional[str]:
+    """Se o fim de `first` repete o início de `second`, devolve os dois unidos sem a repetição."""
+    a, b = first.split(), second.split()
+    for n in range(min(max_words, len(a), len(b)), MIN_OVERLAP_WORDS - 1, -1):
+        if a[-n:] == b[:n]:
+            return " ".join(a + b[n:])
+    return None
+
+class Passage:
+    def __init__(self, text: str, source: str, chunk_id: str):
+        self.text = text
+        self.source = source
+        self.chunk_ids = [chunk_id]
+
+class PackedContext:
+    def __init__(self, text: str, sources: List[str], chunk_ids: List[str], tokens: int):
+        self.text = text
+        self.sources = sources
+        self.chunk_ids = chunk_ids
+        self.tokens = tokens
+
+class ContextPacker:
+    """
+    Monta o contexto do prompt dentro de um orçamento de tokens medido com o tokenizador do gerador.
+    Chunks vizinhos da mesma fonte são unidos sem a região de sobreposição do chunking e os trechos
+    entram em ordem de relevância enquanto couberem. O orçamento é o menor entre `budget` e o que
+    sobra do contexto do modelo depois do restante do prompt e de `reserve` tokens para a resposta.
+    """
+
+    def __init__(self, count_tokens: TokenCounter, budget: int, reserve: int, max_overlap_words: int):
+        self.count_tokens = count_tokens
+        self.budget = budget
+        self.reserve = reserve
+        self.max_overlap_words = max_overlap_words
+
+    def _merge(self, contexts: List[str], sources: List[str], chunk_ids: List[str]) -> List[Passage]:
+        passages: List[Passage] = []
+        for text, source, chunk_id in zip(contexts, sources, chunk_ids):
+            current = Passage(text, source, chunk_id)
+            merged = True
+            while merged:
+                merged = False
+                for passage in passages:
+                    if passage is current or passage.source != current.source:
+                        continue
+                    joined = merge_overlap(passage.text, current.text, self.max_overlap_words) \
+                        or merge_overlap(current.text, passage.text, self.max_overlap_words)
+                    if joined:
+                        # o trecho unido fica na posição do mais relevante e pode emendar em outro
+                        if current in passages and passages.index(current) < passages.index(passage):
+                            passage, current = current, passage
+                        passage.text = joined
+                        passage.chunk_ids.extend(current.chunk_ids)
+                        if current in passages:
+                            passages.remove(current)
+                        current, merged = passage, True
+                        break
+            if current not in passages:
+                passages.append(current)
+        return passages
+
+    async def pack(self, frame: str, contexts: List[str], sources: List[str], chunk_ids: List[str]) -> PackedContext:
+        """`frame` é o prompt completo sem o contexto; só é usado para medir o espaço que ele ocupa."""
+        passages = self._merge(contexts, sources, chunk_ids)
+        counts, context_length = await self.count_tokens([frame, SEPARATOR] + [p.text for p in passages])
+        frame_tokens, separator_tokens, passage_tokens = counts[0], counts[1], counts[2:]
+
+        available = self.budget
+        if context_length:
+            available = min(available, context_length - self.reserve - frame_tokens)
+
+        texts, used_sources, used_ids, used = [], [], [], 0
+        for passage, tokens in zip(passages, passage_tokens):
+            cost = tokens + (separator_tokens if texts else 0)
+            if used + cost <= available:
+                text = passage.text
+            elif not texts and available > 0:
+                # nem o trecho mais relevante cabe: entra cortado proporcionalmente
+                words = passage.text.split()
+                text = " ".join(words[: int(len(words) * available / tokens)])
+                cost = available
+            else:
+                continue
+            texts.append(text)
+            used_sources.append(passage.source)
+            used_ids.extend(passage.chunk_ids)
+            used += cost
+
+        log.info(
+            f"Contexto montado: {len(texts)}/{len(passages)} trechos ({len(contexts)} chunks), "
+            f"{used}/{available} tokens."
+        )
+        return PackedContext(SEPARATOR.join(texts), used_sources, used_ids, used)
@@ -0,0 +1,182 @@
+import pickle
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from .lexical_index import tokenize
+
+log = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 3
+
+class DedupIndex:
+    """
+    Detecção de chunks quase duplicados por MinHash + LSH. Cada chunk canônico guarda sua assinatura
+    e as chaves dos arquivos que o referenciam; um chunk quase igual a um canônico não é embedado, só
+    passa a referenciá-lo. O chunk sai do store apenas quando o último arquivo que o referencia sai.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path, threshold: float, num_perm: int = 128, bands: int = 16):
+        if num_perm % bands:
+            raise ValueError("num_perm deve ser múltiplo de bands")
+        self.path = path
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        # hashing multiply-shift: ((a * x + b) mod 2**64) >> 32, com `a` ímpar; a semente é fixa
+        # para que as assinaturas persistidas continuem comparáveis entre execuções
+        rng = np.random.default_rng(1)
+        self._a = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64, endpoint=True) | np.uint64(1)
+        self._b = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64, endpoint=True)
+        self._lock = threading.Lock()
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._refs: Dict[str, Set[str]] = {}
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(bands)]
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def signature(self, text: str) -> np.ndarray:
+        terms = tokenize(text)
+        if len(terms) >= SHINGLE_SIZE:
+            shingles = {" ".join(terms[i : i + SHINGLE_SIZE]) for i in range(len(terms) - SHINGLE_SIZE + 1)}
+        else:
+            shingles = {" ".join(terms) or text}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+            dtype=np.uint64, count=len(shingles),
+        )
+        with np.errstate(over="ignore"):
+            return ((np.outer(hashes, self._a) + self._b) >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows : (i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def find(self, signature: np.ndarray) -> Optional[str]:
+        """Chunk canônico com similaridade de Jaccard estimada >= threshold, se houver."""
+        with self._lock:
+            candidates: Set[str] = set()
+            for band, key in zip(self._buckets, self._band_keys(signature)):
+                candidates.update(band.get(key, ()))
+            best, best_score = None, self.threshold
+            for cid in candidates:
+                score = float(np.mean(self._signatures[cid] == signature))
+                if score >= best_score:
+                    best, best_score = cid, score
+            return best
+
+    def add(self, cid: str, signature: np.ndarray, key: str):
+        with self._lock:
+            self._insert(cid, signature)
+            self._refs.setdefault(cid, set()).add(key)
+            self._dirty = True
+
+    def _insert(self, cid: str, signature: np.ndarray):
+        self._signatures[cid] = signature
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            band.setdefault(band_key, set()).add(cid)
+
+    def acquire(self, cid: str, key: str) -> bool:
+        """Registra `key` como referência do canônico; False se ele já não existe."""
+        with self._lock:
+            refs = self._refs.get(cid)
+            if refs is None:
+                return False
+            refs.add(key)
+            self._dirty = True
+            return True
+
+    def refs(self, cid: str) -> Set[str]:
+        with self._lock:
+            return set(self._refs.get(cid, ()))
+
+    def release(self, cid: str, key: str) -> bool:
+        """Remove a referência de `key`; True se o chunk ficou sem referências e deve sair do store."""
+        with self._lock:
+            refs = self._refs.get(cid)
+            if refs is None:
+                return True
+            refs.discard(key)
+            self._dirty = True
+            if refs:
+                return False
+            self._discard(cid)
+            return True
+
+    def discard(self, cid: str):
+        with self._lock:
+            self._discard(cid)
+            self._dirty = True
+
+    def _discard(self, cid: str):
+        self._refs.pop(cid, None)
+        signature = self._signatures.pop(cid, None)
+        if signature is None:
+            return
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            members = band.get(band_key)
+            if members:
+                members.discard(cid)
+                if not members:
+                    del band[band_key]
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self._dirty = True
+
+    def _clear(self):
+        self._signatures = {}
+        self._refs = {}
+        self._buckets = [{} for _ in range(self.bands)]
+
+    def restore(self, ids: List[str], documents: List[str], refs: Dict[str, Set[str]]):
+        """Registra chunks já gravados (reconstrução a partir do store), com as referências do manifesto."""
+        signatures = [self.signature(text) for text in documents]
+        with self._lock:
+            for cid, signature in zip(ids, signatures):
+                self._insert(cid, signature)
+                self._refs[cid] = set(refs.get(cid, ()))
+            self._dirty = True
+
+    def load(self) -> bool:
+        if not self.path.exists():
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+            if data.get("version") != self.VERSION or data.get("num_perm") != self.num_perm or data.get("bands") != self.bands:
+                return False
+        except Exception as e:
+            log.warning(f"Snapshot do índice de duplicatas em {self.path} ilegível, será reconstruído: {e}")
+            return False
+        with self._lock:
+            self._clear()
+            for cid, signature in data["signatures"].items():
+                self._insert(cid, signature)
+            self._refs = data["refs"]
+            self._dirty = False
+        return True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {
+                "version": self.VERSION, "num_perm": self.num_perm, "bands": self.bands,
+                "signatures": self._signatures, "refs": self._refs,
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp_path.replace(self.path)
+            self._dirty = False
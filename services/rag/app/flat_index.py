@@ -0,0 +1,338 @@
+import os
+import pickle
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+class FlatVectorIndex:
+    """
+    Índice vetorial plano em disco, com busca exata por cosseno. Os vetores, normalizados e guardados
+    em float32 ou quantizados em int8 com uma escala por linha, ficam num arquivo binário lido por
+    memory map; os textos ficam num arquivo à parte, lidos por offset; ids e metadados ficam num
+    journal de frames pickle. Toda gravação é um append nos arquivos, e o frame do journal é o ponto
+    de commit: sobras de uma gravação interrompida são descartadas ao abrir. Remoções só marcam a
+    linha como morta; `compact` reescreve os arquivos numa nova geração.
+    """
+
+    VERSION = 1
+    DTYPES = {"float32": np.float32, "int8": np.int8}
+    # linhas por bloco na busca: limita a cópia em float32 dos vetores int8 e a matriz de scores
+    BLOCK_ROWS = 16384
+
+    def __init__(self, path: Path, dtype: str = "float32"):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Tipo de vetor não suportado: {dtype} (use float32 ou int8)")
+        self.path = path
+        self.dtype = dtype
+        self._lock = threading.RLock()
+        self._files: Dict[str, object] = {}
+        self.path.mkdir(parents=True, exist_ok=True)
+        pointer = self.path / "CURRENT"
+        name = pointer.read_text(encoding="utf-8").strip() if pointer.exists() else ""
+        if name and (self.path / name / "journal.pkl").exists():
+            self._open(self.path / name)
+        else:
+            self._start_generation(self._next_generation(name))
+
+    # --- gerações e arquivos ---
+    def _next_generation(self, current: str) -> str:
+        number = int(current[1:]) + 1 if current[1:].isdigit() else 0
+        return f"g{number:06d}"
+
+    def _reset_state(self):
+        self.dim: Optional[int] = None
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._metas: List[Optional[Dict]] = []
+        self._doc_offsets: List[int] = []
+        self._doc_lengths: List[int] = []
+        self._doc_bytes = 0
+        self._alive = np.zeros(0, dtype=bool)
+        self._matrix: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+
+    def _close_files(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def _start_generation(self, name: str, frames: Tuple[Dict, ...] = ()):
+        """Cria uma geração com os `frames` dados (os dados já gravados nos arquivos) e passa a usá-la."""
+        directory = self.path / name
+        directory.mkdir(parents=True, exist_ok=True)
+        for file_name in ("vectors.bin", "scales.bin", "documents.bin"):
+            (directory / file_name).touch()
+        with open(directory / "journal.pkl", "wb") as f:
+            pickle.dump({"op": "header", "version": self.VERSION, "dtype": self.dtype}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            for frame in frames:
+                pickle.dump(frame, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pointer = self.path / "CURRENT"
+        tmp_pointer = pointer.with_suffix(".tmp")
+        tmp_pointer.write_text(name, encoding="utf-8")
+        tmp_pointer.replace(pointer)
+        self._open(directory)
+
+    def _open(self, directory: Path):
+        self._close_files()
+        self._reset_state()
+        self._dir = directory
+        journal = directory / "journal.pkl"
+        committed = 0
+        with open(journal, "rb") as f:
+            try:
+                header = pickle.load(f)
+            except Exception:
+                header = {}
+            if header.get("version") != self.VERSION or header.get("dtype") != self.dtype:
+                log.warning(
+                    f"Índice vetorial em {directory} é de outra versão ou tipo ({header.get('dtype')}); "
+                    f"será recriado vazio em {self.dtype}."
+                )
+                self._start_generation(self._next_generation(directory.name))
+                return
+            committed = f.tell()
+            while True:
+                try:
+                    frame = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception as e:
+                    log.warning(f"Frame incompleto no journal do índice vetorial, descartado: {e}")
+                    break
+                self._apply(frame)
+                committed = f.tell()
+
+        # o que passou do último frame completo é sobra de uma gravação interrompida
+        rows = len(self._ids)
+        itemsize = np.dtype(self.DTYPES[self.dtype]).itemsize
+        sizes = {
+            "journal.pkl": committed,
+            "vectors.bin": rows * (self.dim or 0) * itemsize,
+            "scales.bin": rows * 4 if self.dtype == "int8" else 0,
+            "documents.bin": self._doc_bytes,
+        }
+        for file_name, size in sizes.items():
+            f = open(directory / file_name, "r+b")
+            f.truncate(size)
+            f.seek(size)
+            self._files[file_name] = f
+        self._remap()
+        for other in self.path.glob("g*"):
+            if other.is_dir() and other != directory:
+                shutil.rmtree(other, ignore_errors=True)
+
+    def _remap(self):
+        rows = len(self._ids)
+        if not rows:
+            self._matrix = self._scales = None
+            return
+        self._matrix = np.memmap(self._dir / "vectors.bin", dtype=self.DTYPES[self.dtype], mode="r", shape=(rows, self.dim))
+        if self.dtype == "int8":
+            self._scales = np.memmap(self._dir / "scales.bin", dtype=np.float32, mode="r", shape=(rows,))
+
+    def _apply(self, frame: Dict):
+        op = frame["op"]
+        if op == "add":
+            self.dim = frame["dim"]
+            alive = np.ones(len(frame["ids"]), dtype=bool)
+            for position, (doc_id, meta, length) in enumerate(zip(frame["ids"], frame["metas"], frame["doc_lengths"])):
+                old = self._rows.get(doc_id)
+                if old is not None:
+                    self._kill(old)
+                self._rows[doc_id] = len(self._ids)
+                self._ids.append(doc_id)
+                self._metas.append(meta)
+                self._doc_offsets.append(self._doc_bytes)
+                self._doc_lengths.append(length)
+                self._doc_bytes += length
+            self._alive = np.concatenate([self._alive, alive])
+            # um id repetido dentro do mesmo frame: vale a última ocorrência
+            for row in range(len(self._alive) - len(alive), len(self._alive)):
+                if self._ids[row] is None:
+                    self._alive[row] = False
+        elif op == "delete":
+            for doc_id in frame["ids"]:
+                row = self._rows.get(doc_id)
+                if row is not None:
+                    self._kill(row)
+        elif op == "update":
+            for doc_id, meta in zip(frame["ids"], frame["metas"]):
+                row = self._rows.get(doc_id)
+                if row is not None:
+                    self._metas[row] = {**self._metas[row], **meta}
+
+    def _kill(self, row: int):
+        del self._rows[self._ids[row]]
+        self._ids[row] = None
+        self._metas[row] = None
+        if row < len(self._alive):
+            self._alive[row] = False
+
+    def _commit(self, frame: Dict):
+        journal = self._files["journal.pkl"]
+        pickle.dump(frame, journal, protocol=pickle.HIGHEST_PROTOCOL)
+        journal.flush()
+        self._apply(frame)
+
+    # --- escrita ---
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        if self.dtype == "float32":
+            return vectors.astype(np.float32), None
+        # quantização simétrica por linha: o maior componente em módulo vira ±127
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+        return np.rint(vectors / scales[:, None]).astype(np.int8), scales
+
+    def upsert(self, ids: List[str], embeddings, metadatas: List[Dict], documents: List[str]):
+        if not ids: return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError(f"Esperados {len(ids)} vetores, recebido array com formato {vectors.shape}")
+        encoded_docs = [doc.encode("utf-8") for doc in documents]
+        with self._lock:
+            if self.dim is not None and vectors.shape[1] != self.dim:
+                raise ValueError(f"Dimensão {vectors.shape[1]} diferente da dimensão do índice ({self.dim})")
+            encoded, scales = self._encode(vectors)
+            for file_name, data in (("vectors.bin", encoded.tobytes()), ("documents.bin", b"".join(encoded_docs)),
+                                    ("scales.bin", scales.tobytes() if scales is not None else b"")):
+                self._files[file_name].write(data)
+                self._files[file_name].flush()
+            self._commit({
+                "op": "add", "dim": vectors.shape[1], "ids": list(ids), "metas": [dict(m) for m in metadatas],
+                "doc_lengths": [len(doc) for doc in encoded_docs],
+            })
+            self._remap()
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            present = [doc_id for doc_id in dict.fromkeys(ids) if doc_id in self._rows]
+            if present:
+                self._commit({"op": "delete", "ids": present})
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict]):
+        """Mescla `metadatas` aos metadados dos ids existentes; ids ausentes são ignorados."""
+        with self._lock:
+            pairs = [(doc_id, dict(meta)) for doc_id, meta in zip(ids, metadatas) if doc_id in self._rows]
+            if pairs:
+                self._commit({"op": "update", "ids": [p[0] for p in pairs], "metas": [p[1] for p in pairs]})
+
+    def clear(self):
+        with self._lock:
+            self._close_files()
+            self._start_generation(self._next_generation(self._dir.name))
+
+    @property
+    def dead_rows(self) -> int:
+        return len(self._ids) - len(self._rows)
+
+    def compact(self):
+        """Reescreve só as linhas vivas numa nova geração, devolvendo o espaço das removidas."""
+        with self._lock:
+            rows = np.flatnonzero(self._alive)
+            name = self._next_generation(self._dir.name)
+            directory = self.path / name
+            directory.mkdir(parents=True, exist_ok=True)
+            doc_lengths = []
+            with open(directory / "vectors.bin", "wb") as vectors_f, open(directory / "scales.bin", "wb") as scales_f, \
+                    open(directory / "documents.bin", "wb") as documents_f:
+                for start in range(0, len(rows), self.BLOCK_ROWS):
+                    block = rows[start : start + self.BLOCK_ROWS]
+                    vectors_f.write(np.ascontiguousarray(self._matrix[block]).tobytes())
+                    if self._scales is not None:
+                        scales_f.write(np.ascontiguousarray(self._scales[block]).tobytes())
+                for row in rows:
+                    documents_f.write(self._read_document(row).encode("utf-8"))
+                    doc_lengths.append(self._doc_lengths[row])
+            frames = ()
+            if len(rows):
+                frames = ({
+                    "op": "add", "dim": self.dim, "ids": [self._ids[row] for row in rows],
+                    "metas": [self._metas[row] for row in rows], "doc_lengths": doc_lengths,
+                },)
+            dead = self.dead_rows
+            self._close_files()
+            self._start_generation(name, frames)
+            log.info(f"Índice vetorial compactado: {dead} linhas removidas, {len(rows)} mantidas.")
+
+    # --- leitura ---
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _read_document(self, row: int) -> str:
+        length = self._doc_lengths[row]
+        if not length:
+            return ""
+        return os.pread(self._files["documents.bin"].fileno(), length, self._doc_offsets[row]).decode("utf-8")
+
+    def get(self, ids: List[str]) -> Dict[str, Tuple[str, Dict]]:
+        """(documento, metadados) dos ids existentes."""
+        with self._lock:
+            found = {}
+            for doc_id in ids:
+                row = self._rows.get(doc_id)
+                if row is not None:
+                    found[doc_id] = (self._read_document(row), dict(self._metas[row]))
+            return found
+
+    def iter_documents(self, page_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+        """Percorre as linhas vivas em páginas de (ids, documentos)."""
+        with self._lock:
+            ids = list(self._rows)
+        for start in range(0, len(ids), page_size):
+            found = self.get(ids[start : start + page_size])
+            if found:
+                yield list(found), [doc for doc, _ in found.values()]
+
+    def search(self, query_embeddings, k: int) -> List[List[Tuple[str, float]]]:
+        """
+        Top-k exato por cosseno para cada vetor de consulta, com uma multiplicação de matrizes por bloco
+        de linhas para todas as consultas de uma vez. Devolve, por consulta, pares (id, similaridade).
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1.0, norms)
+        with self._lock:
+            matrix, scales, ids = self._matrix, self._scales, self._ids
+            alive = self._alive.copy()
+        if matrix is None or k <= 0:
+            return [[] for _ in queries]
+
+        rows = len(matrix)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, rows, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, rows)
+            block = matrix[start:end]
+            if scales is not None:
+                scores = (queries @ block.astype(np.float32).T) * scales[start:end]
+            else:
+                scores = queries @ block.T
+            scores[:, ~alive[start:end]] = -np.inf
+            scores = np.concatenate([best_scores, scores], axis=1)
+            candidates = np.concatenate([best_rows, np.broadcast_to(np.arange(start, end), (len(queries), end - start))], axis=1)
+            if scores.shape[1] > k:
+                keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, keep, axis=1)
+                candidates = np.take_along_axis(candidates, keep, axis=1)
+            best_scores, best_rows = scores, candidates
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        results = []
+        for query_scores, query_rows in zip(best_scores, best_rows):
+            hits = []
+            for score, row in zip(query_scores, query_rows):
+                # a linha pode ter sido removida depois da cópia da máscara
+                if np.isfinite(score) and ids[row] is not None:
+                    hits.append((ids[row], float(score)))
+            results.append(hits)
+        return results
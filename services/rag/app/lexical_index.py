@@ -0,0 +1,150 @@
+import re
+import math
+import heapq
+import pickle
+import logging
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+log = logging.getLogger(__name__)
+
+STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas", "um", "uma",
+    "para", "por", "com", "que", "se", "ao", "aos", "ou", "sua", "seu", "suas", "seus", "pela", "pelo",
+}
+TOKEN_RE = re.compile(r"\d+(?:[.,/-]\d+)*|[a-z]+")
+
+def tokenize(text: str) -> List[str]:
+    """Normaliza (minúsculas, sem acentos) e separa termos; números como "1.234" viram "1234"."""
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+    terms = []
+    for token in TOKEN_RE.findall(text):
+        if token[0].isdigit():
+            terms.append(re.sub(r"[.,/-]", "", token))
+        elif token not in STOPWORDS and len(token) > 1:
+            terms.append(token)
+    return terms
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Funde rankings pela soma de 1 / (k + posição); ids bem colocados em mais de uma lista sobem."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+class LexicalIndex:
+    """
+    Índice invertido BM25 em memória, atualizado incrementalmente junto com o vector store e
+    persistido como snapshot em disco. Encontra referências exatas ("Art. 12", "Portaria 1.234")
+    que a busca por cosseno costuma perder.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._total_len = 0
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def load(self) -> bool:
+        if not self.path.exists():
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+            if data.get("version") != self.VERSION:
+                return False
+        except Exception as e:
+            log.warning(f"Snapshot do índice léxico em {self.path} ilegível, será reconstruído: {e}")
+            return False
+        with self._lock:
+            self._postings, self._doc_terms, self._doc_len = data["postings"], data["doc_terms"], data["doc_len"]
+            self._total_len = sum(self._doc_len.values())
+            self._dirty = False
+        return True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {
+                "version": self.VERSION, "postings": self._postings, "doc_terms": self._doc_terms, "doc_len": self._doc_len
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp_path.replace(self.path)
+            self._dirty = False
+
+    def add(self, ids: List[str], documents: List[str]):
+        with self._lock:
+            for doc_id, text in zip(ids, documents):
+                self._remove(doc_id)
+                terms = Counter(tokenize(text))
+                self._doc_terms[doc_id] = dict(terms)
+                length = sum(terms.values())
+                self._doc_len[doc_id] = length
+                self._total_len += length
+                for term, tf in terms.items():
+                    self._postings.setdefault(term, {})[doc_id] = tf
+            self._dirty = True
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+            self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_len.clear()
+            self._total_len = 0
+            self._dirty = True
+
+    def _remove(self, doc_id: str):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._total_len -= self._doc_len.pop(doc_id)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def query(self, text: str, k: int) -> List[Tuple[str, float]]:
+        """Retorna até `k` pares (id, score BM25) em ordem decrescente de score."""
+        terms = set(tokenize(text))
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if not n_docs or not terms:
+                return []
+            avg_len = self._total_len / n_docs
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
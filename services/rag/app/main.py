@@ -1,17 +1,26 @@
+import json
 import logging
+import threading
+from typing import AsyncIterator, List
 from logging.handlers import RotatingFileHandler
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
+from common.observability import RequestIdFilter, instrument
 
-from .rag_engine import RAGPipeline, EmbeddingClient, ChromaStore, GeneratorClient
-from .models import ChatRequest, ChatResponse
+from .rag_engine import RAGPipeline, EmbeddingClient, FileManager, GeneratorClient, GeneratorBusyError, create_vector_store
+from .watcher import DataWatcher
+from .models import ChatRequest, ChatResponse, BatchChatRequest, IndexStatusResponse
 from .config import settings
+from .metrics import LATENCY_BUCKETS
 
 settings.LOGS_DIR.mkdir(exist_ok=True)
 file_handler = RotatingFileHandler(settings.LOG_FILE_PATH, maxBytes=10*1024*1024, backupCount=5)
-file_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s'))
+file_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] [%(name)s] [%(request_id)s] %(message)s'))
+file_handler.addFilter(RequestIdFilter())
 stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s'))
+stream_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] [%(request_id)s] %(message)s'))
+stream_handler.addFilter(RequestIdFilter())
 root_logger = logging.getLogger()
 root_logger.setLevel(logging.INFO)
 root_logger.addHandler(file_handler)
@@ -19,6 +28,13 @@ root_logger.addHandler(stream_handler)
 
 pipeline_state = {}
 
+def run_index_build(pipeline: RAGPipeline):
+    try:
+        pipeline.build_index()
+        logging.info("Índice de embeddings concluído.")
+    except Exception as e:
+        logging.error(f"Falha na construção do índice em segundo plano: {e}", exc_info=True)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):   
     logging.info("--- Iniciando Servidor RAG Orquestrador ---")
@@ -31,15 +47,25 @@ async def lifespan(app: FastAPI):
     try:
         embedder_client = EmbeddingClient(service_url=settings.EMBEDDING_SERVICE_URL)
         generator_client = GeneratorClient(service_url=settings.GENERATOR_SERVICE_URL)
-        store = ChromaStore()
+        store = create_vector_store()
         
         pipeline = RAGPipeline(embedder=embedder_client, store=store, generator=generator_client)
         
-        logging.info("Construindo índice de embeddings. O servidor ficará disponível após o término...")
-        pipeline.build_index()
-        logging.info("Índice de embeddings concluído.")
-
         pipeline_state["rag_pipeline"] = pipeline
+
+        logging.info("Construindo índice de embeddings em segundo plano; /chat responde com a coleção já persistida.")
+        indexer = threading.Thread(target=run_index_build, args=(pipeline,), name="rag-indexer", daemon=True)
+        indexer.start()
+
+        watcher = None
+        if settings.WATCH_ENABLED:
+            # eventos que chegam durante a construção inicial esperam por ela (mesmo lock)
+            watcher = DataWatcher(
+                settings.FILE_PATHS, pipeline.reindex, FileManager.is_supported, mode=settings.WATCH_MODE,
+                debounce=settings.WATCH_DEBOUNCE, max_delay=settings.WATCH_MAX_DELAY,
+                poll_interval=settings.WATCH_POLL_INTERVAL,
+            )
+            watcher.start()
         logging.info("--- Servidor RAG pronto para receber requisições ---")
 
     except Exception as e:
@@ -49,16 +75,37 @@ async def lifespan(app: FastAPI):
     yield
 
     logging.info("--- Finalizando Servidor RAG Orquestrador ---")
+    pipeline.stop_event.set()
+    if watcher is not None:
+        watcher.stop()
+    indexer.join(timeout=10)
+    await embedder_client.aclose()
+    await generator_client.aclose()
     pipeline_state.clear()
 
 app = FastAPI(lifespan=lifespan)
+instrument(app, LATENCY_BUCKETS)
 
 @app.get("/")
 def read_root():
     return {"status": "Servidor RAG Orquestrador online."}
 
+async def stream_chat_events(first: str, tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    try:
+        yield f"data: {json.dumps({'token': first}, ensure_ascii=False)}\n\n"
+        async for token in tokens:
+            yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+    except Exception as e:
+        logging.error(f"Erro ao processar a pergunta (streaming): {e}", exc_info=True)
+        detail = {"detail": "Ocorreu um erro interno ao processar sua pergunta."}
+        yield f"event: error\ndata: {json.dumps(detail, ensure_ascii=False)}\n\n"
+    finally:
+        # cliente desconectado: fecha o stream do gerador e libera o slot lá
+        await tokens.aclose()
+
 @app.post("/chat", response_model=ChatResponse)
-def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest):
     pipeline = pipeline_state.get("rag_pipeline")
     if not pipeline:
         raise HTTPException(status_code=503, detail="Pipeline RAG não está inicializado.")
@@ -67,12 +114,73 @@ def chat_endpoint(request: ChatRequest):
         raise HTTPException(status_code=400, detail="A pergunta não pode estar vazia.")
 
     try:
-        resposta = pipeline.query(request.pergunta)
+        if request.stream:
+            # a recuperação e a abertura do stream do gerador rodam antes da resposta: o primeiro pedaço só
+            # chega depois que o gerador obteve o slot, então fila cheia ainda vira um 429 de verdade
+            tokens = pipeline.query_stream(request.pergunta)
+            first = await anext(tokens)
+            return StreamingResponse(stream_chat_events(first, tokens), media_type="text/event-stream")
+        resposta = await pipeline.query(request.pergunta)
         return ChatResponse(resposta=resposta)
+    except GeneratorBusyError as e:
+        logging.warning(str(e))
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logging.error(f"Erro ao processar a pergunta: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Ocorreu um erro interno ao processar sua pergunta.")
 
+async def stream_batch_results(pipeline: RAGPipeline, perguntas: List[str]) -> AsyncIterator[str]:
+    """Uma linha JSON por pergunta, na ordem em que as respostas ficam prontas."""
+    try:
+        async for index, resposta, erro in pipeline.query_batch(perguntas):
+            line = {"index": index, "pergunta": perguntas[index]}
+            line.update({"detail": erro} if erro else {"resposta": resposta})
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+    except Exception as e:
+        logging.error(f"Erro ao processar o lote de perguntas: {e}", exc_info=True)
+        yield json.dumps({"detail": "Ocorreu um erro interno ao processar o lote."}, ensure_ascii=False) + "\n"
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(request: BatchChatRequest):
+    pipeline = pipeline_state.get("rag_pipeline")
+    if not pipeline:
+        raise HTTPException(status_code=503, detail="Pipeline RAG não está inicializado.")
+
+    if not request.perguntas or not all(request.perguntas):
+        raise HTTPException(status_code=400, detail="O lote deve conter perguntas não vazias.")
+    if len(request.perguntas) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"O lote excede o limite de {settings.BATCH_MAX_QUESTIONS} perguntas.")
+
+    return StreamingResponse(stream_batch_results(pipeline, request.perguntas), media_type="application/x-ndjson")
+
+@app.get("/cache/stats")
+def cache_stats():
+    pipeline = pipeline_state.get("rag_pipeline")
+    if not pipeline:
+        raise HTTPException(status_code=503, detail="Pipeline RAG não está inicializado.")
+    if not pipeline.answer_cache:
+        return {"enabled": False}
+    return {"enabled": True, **pipeline.answer_cache.stats()}
+
 @app.get("/health")
+@app.get("/health/live")
 def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+def readiness_check():
+    pipeline = pipeline_state.get("rag_pipeline")
+    if not pipeline:
+        raise HTTPException(status_code=503, detail="Pipeline RAG não está inicializado.")
+
+    # pronto quando há algo para consultar: índice concluído ou coleção persistida de execuções anteriores
+    if pipeline.progress.state != "done" and pipeline.store.count() == 0:
+        raise HTTPException(status_code=503, detail="Índice ainda em construção e coleção vazia.")
+    return {"status": "ready", "indexing": pipeline.progress.running}
+
+@app.get("/index/status", response_model=IndexStatusResponse)
+def index_status():
+    pipeline = pipeline_state.get("rag_pipeline")
+    if not pipeline:
+        raise HTTPException(status_code=503, detail="Pipeline RAG não está inicializado.")
+    return IndexStatusResponse(**pipeline.progress.snapshot(), indexed_chunks=pipeline.store.count())
\ No newline at end of file
@@ -0,0 +1,41 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from prometheus_client import Histogram
+
+# do embedding de uma pergunta (milissegundos) à indexação completa (minutos)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds", "Duração de cada etapa das consultas e da indexação.",
+    ["operation", "stage"], buckets=LATENCY_BUCKETS,
+)
+
+class StageTimer:
+    """Cronometra as etapas de uma operação: cada etapa alimenta o histograma e o resumo do log."""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.started = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        STAGE_SECONDS.labels(self.operation, name).observe(seconds)
+
+    def finish(self) -> float:
+        total = time.perf_counter() - self.started
+        STAGE_SECONDS.labels(self.operation, "total").observe(total)
+        return total
+
+    def summary(self) -> str:
+        return ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.durations.items())
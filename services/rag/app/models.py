@@ -1,9 +1,28 @@
+from typing import List, Optional
 from pydantic import BaseModel
 
 class ChatRequest(BaseModel):
     """Modelo para a requisição de chat."""
     pergunta: str
+    stream: bool = False
 
 class ChatResponse(BaseModel):
     """Modelo para a resposta do chat."""
-    resposta: str
\ No newline at end of file
+    resposta: str
+
+class BatchChatRequest(BaseModel):
+    """Modelo para a requisição de chat em lote."""
+    perguntas: List[str]
+
+class IndexStatusResponse(BaseModel):
+    """Modelo para o progresso da construção do índice."""
+    state: str
+    files_total: int
+    files_done: int
+    chunks_total: int
+    chunks_embedded: int
+    chunks_deduplicated: int = 0
+    elapsed_seconds: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    indexed_chunks: int
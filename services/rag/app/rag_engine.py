@@ -1,109 +1,650 @@
+import csv
 import time
+import json
+import asyncio
+import hashlib
+import queue
 import logging
-import requests
+import threading
+import struct
+import multiprocessing
+import httpx
+import numpy as np
+from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import List, Tuple, Dict
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
 from itertools import count
+from typing import List, Tuple, Dict, Set, Optional, Iterable, Iterator, AsyncIterator, Callable
 
 import chromadb
 from chromadb.config import Settings
 from pypdf import PdfReader
+from common.observability import outgoing_headers
 
 from .config import settings
+from . import chunking
+from .answer_cache import AnswerCache
+from .context_packer import ContextPacker
+from .dedup import DedupIndex
+from .flat_index import FlatVectorIndex
+from .metrics import STAGE_SECONDS, StageTimer
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion
 
 log = logging.getLogger(__name__)
 
 # --- MÓDULO DE GERENCIAMENTO DE ARQUIVOS ---
+class JsonStreamReader:
+    """
+    Leitura incremental de um arquivo JSON em blocos de `block` caracteres: decodifica um valor por vez
+    e percorre arrays e objetos sem carregar o arquivo inteiro. `peek` posiciona no próximo caractere
+    relevante; `items` e `members` consomem o array ou objeto que começa nessa posição.
+    """
+
+    WHITESPACE = " \t\r\n"
+
+    def __init__(self, f, name: str, block: int):
+        self.f = f
+        self.name = name
+        self.block = block
+        self.decoder = json.JSONDecoder()
+        self.buffer, self.pos = "", 0
+
+    def _fill(self) -> bool:
+        more = self.f.read(self.block)
+        if not more:
+            return False
+        self.buffer, self.pos = self.buffer[self.pos:] + more, 0
+        return True
+
+    def peek(self, skip: str = WHITESPACE) -> str:
+        """Próximo caractere fora de `skip`, sem consumi-lo; vazio no fim do arquivo."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in skip:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def value(self) -> object:
+        while True:
+            try:
+                item, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # um número cortado pelo fim do bloco ("2." + "25") pode continuar no próximo
+                complete = end < len(self.buffer) and self.buffer[end] not in "0123456789.eE+-"
+            except json.JSONDecodeError:
+                item, end, complete = None, None, False
+            # valor incompleto no buffer: lê mais e tenta de novo
+            if complete or not self._fill():
+                if end is None:
+                    raise ValueError(f"JSON truncado ou inválido em {self.name}")
+                self.pos = end
+                return item
+
+    def items(self) -> Iterator[object]:
+        """Itens do array na posição atual, um a um."""
+        self.pos += 1
+        while True:
+            char = self.peek(self.WHITESPACE + ",")
+            if char in ("]", ""):
+                self.pos += 1
+                return
+            yield self.value()
+
+    def members(self) -> Iterator[str]:
+        """Chaves do objeto na posição atual; a cada chave, o chamador consome o valor (`value`, `items`...)."""
+        self.pos += 1
+        while True:
+            char = self.peek(self.WHITESPACE + ",")
+            if char in ("}", ""):
+                self.pos += 1
+                return
+            key = self.value()
+            if self.peek() != ":":
+                raise ValueError(f"JSON inválido em {self.name}: esperado ':' depois de {key!r}")
+            self.pos += 1
+            self.peek()
+            yield key
+
 class FileManager:
+    TEXT_BLOCK_LINES = 2000
+    JSON_READ_BLOCK = 1024 * 1024
+    # muda quando a forma de extrair documentos muda, forçando a reindexação dos arquivos já indexados
+    LOADER_VERSION = 2
+    SUPPORTED_EXTENSIONS = ["*.txt", "*.md", "*.csv", "*.pdf", "*.json", "*.jsonl"]
+    # message_type do Chatwoot: 0 recebida, 1 enviada, 2 atividade, 3 template
+    SPEAKERS = {0: "Cliente", 1: "Atendente", 3: "Atendente"}
+
     @staticmethod
-    def _read_txt_md_csv(file_path: Path) -> str:
-        try:
-            return file_path.read_text(encoding="utf-8", errors="ignore")
-        except Exception as e:
-            log.error(f"Falha ao ler o arquivo de texto {file_path}: {e}")
-            return ""
+    def _iter_plain_text(file_path: Path) -> Iterator[str]:
+        with open(file_path, encoding="utf-8", errors="ignore") as f:
+            block = []
+            for line in f:
+                block.append(line)
+                if len(block) >= FileManager.TEXT_BLOCK_LINES:
+                    yield "".join(block)
+                    block = []
+            if block:
+                yield "".join(block)
 
     @staticmethod
-    def _read_pdf(file_path: Path) -> str:
-        try:
-            reader = PdfReader(file_path)
-            return "\n".join(page.extract_text() for page in reader.pages if page.extract_text())
-        except Exception as e:
-            log.error(f"Falha ao processar o arquivo PDF {file_path}: {e}")
-            return ""
+    def _iter_pdf(file_path: Path) -> Iterator[str]:
+        reader = PdfReader(file_path)
+        for page in reader.pages:
+            text = page.extract_text()
+            if text:
+                yield text
+
+    @staticmethod
+    def iter_text(file_path: Path) -> Iterator[str]:
+        """Lê o arquivo em segmentos (blocos de linhas ou páginas) sem carregar o conteúdo inteiro."""
+        if file_path.suffix in [".txt", ".md", ".csv"]:
+            yield from FileManager._iter_plain_text(file_path)
+        elif file_path.suffix == ".pdf":
+            yield from FileManager._iter_pdf(file_path)
+
+    @staticmethod
+    def _iter_csv_rows(file_path: Path) -> Iterator[Tuple[str, Dict]]:
+        csv.field_size_limit(16 * 1024 * 1024)
+        with open(file_path, encoding="utf-8", errors="ignore", newline="") as f:
+            for index, row in enumerate(csv.DictReader(f)):
+                text = "\n".join(f"{k}: {v}" for k, v in row.items() if k and v and v.strip())
+                if text:
+                    yield text, {"row": index}
 
     @staticmethod
-    def load_documents() -> List[Tuple[Path, str]]:
+    def _iter_jsonl(file_path: Path) -> Iterator[object]:
+        with open(file_path, encoding="utf-8", errors="ignore") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    log.warning(f"Linha {line_no} de {file_path.name} ignorada: JSON inválido ({e}).")
+
+    @staticmethod
+    def _iter_json(file_path: Path) -> Iterator[object]:
+        """
+        Registros de um JSON, em streaming: os itens de um array no topo, ou de `payload`/`data.payload`
+        em um objeto no topo (ex.: resposta da API do Chatwoot), são decodificados um a um. Um objeto
+        sem `payload` é um único registro.
+        """
+        with open(file_path, encoding="utf-8", errors="ignore") as f:
+            reader = JsonStreamReader(f, file_path.name, FileManager.JSON_READ_BLOCK)
+            first = reader.peek()
+            if first == "[":
+                yield from reader.items()
+            elif first == "{":
+                record = {}
+                if not (yield from FileManager._iter_json_payload(reader, record)):
+                    yield record
+            elif first:
+                yield reader.value()
+
+    @staticmethod
+    def _iter_json_payload(reader: "JsonStreamReader", record: Dict, nested: bool = False) -> Iterator[object]:
+        """
+        Percorre os membros do objeto na posição de `reader`: os itens de `payload` (ou de `data.payload`)
+        saem um a um e os demais membros ficam em `record`. Devolve se algum `payload` foi encontrado.
+        """
+        found = False
+        for key in reader.members():
+            char = reader.peek()
+            if key == "payload" and char == "[":
+                yield from reader.items()
+                found = True
+            elif key == "data" and char == "{" and not nested:
+                record[key] = {}
+                found = (yield from FileManager._iter_json_payload(reader, record[key], nested=True)) or found
+            else:
+                record[key] = reader.value()
+        return found
+
+    @staticmethod
+    def _format_date(value) -> Optional[str]:
+        if isinstance(value, (int, float)) and value > 0:
+            return datetime.fromtimestamp(value, timezone.utc).date().isoformat()
+        if isinstance(value, str) and value:
+            return value[:10]
+        return None
+
+    @staticmethod
+    def render_record(record: object) -> Tuple[str, Dict]:
+        """
+        Converte um registro JSON em texto e metadados. Conversas (registros com `messages`) viram uma
+        transcrição "Cliente: ... / Atendente: ...", sem notas privadas nem mensagens de atividade;
+        outros registros viram linhas "campo: valor".
+        """
+        if not isinstance(record, dict):
+            return (str(record) if record is not None else ""), {}
+        meta = {}
+        if isinstance(record.get("id"), (int, str)):
+            meta["chat_id" if "messages" in record else "record_id"] = record["id"]
+        date = FileManager._format_date(record.get("created_at") or record.get("date"))
+        if date:
+            meta["date"] = date
+
+        if isinstance(record.get("messages"), list):
+            lines = []
+            for message in record["messages"]:
+                if not isinstance(message, dict) or message.get("private"):
+                    continue
+                speaker = FileManager.SPEAKERS.get(message.get("message_type"))
+                content = (message.get("content") or "").strip()
+                if speaker and content:
+                    lines.append(f"{speaker}: {content}")
+            return "\n".join(lines), meta
+
+        lines = []
+        for key, value in record.items():
+            if isinstance(value, list):
+                value = ", ".join(str(v) for v in value if isinstance(v, (str, int, float)))
+            if isinstance(value, (str, int, float)) and str(value).strip():
+                lines.append(f"{key}: {value}")
+        return "\n".join(lines), meta
+
+    @staticmethod
+    def iter_documents(file_path: Path) -> Iterator[Tuple[Iterable[str], Dict]]:
+        """
+        Documentos do arquivo como (segmentos de texto, metadados), em streaming: um por arquivo em
+        txt/md/pdf, um por linha em CSV e um por registro (conversa) em JSON/JSONL.
+        """
+        if file_path.suffix == ".csv":
+            for text, meta in FileManager._iter_csv_rows(file_path):
+                yield [text], meta
+            return
+        if file_path.suffix == ".jsonl":
+            records = FileManager._iter_jsonl(file_path)
+        elif file_path.suffix == ".json":
+            records = FileManager._iter_json(file_path)
+        else:
+            yield FileManager.iter_text(file_path), {}
+            return
+        for index, record in enumerate(records):
+            text, meta = FileManager.render_record(record)
+            if text:
+                yield [text], {"record": index, **meta}
+
+    @staticmethod
+    def list_files() -> List[Path]:
         all_files = []
         for dir_path in settings.FILE_PATHS:
             if not dir_path.exists():
                 log.warning(f"Diretório não encontrado, pulando: {dir_path}")
                 continue
             
-            supported_extensions = ["*.txt", "*.md", "*.csv", "*.pdf"]
-            for ext in supported_extensions:
-                all_files.extend(list(dir_path.rglob(ext)))
+            for ext in FileManager.SUPPORTED_EXTENSIONS:
+                # arquivos ocultos (ex.: o cursor do coletor do Chatwoot) não são documentos
+                all_files.extend(p for p in dir_path.rglob(ext) if not p.name.startswith("."))
+        return all_files
 
-        if not all_files:
-            log.warning("Nenhum arquivo encontrado nos diretórios configurados.")
-            return []
-        
-        log.info(f"Encontrados {len(all_files)} arquivos para processamento.")
-        documents = []
-
-        for file_path in all_files:
-            content = ""
-            if file_path.suffix in [".txt", ".md", ".csv"]:
-                content = FileManager._read_txt_md_csv(file_path)
-            elif file_path.suffix == ".pdf":
-                content = FileManager._read_pdf(file_path)
-            
-            if content.strip():
-                documents.append((file_path, content))
-            else:
-                log.warning(f"Arquivo {file_path} vazio ou não pôde ser lido, será ignorado.")
-        return documents
+    @staticmethod
+    def is_supported(path: Path) -> bool:
+        """Mesmo critério de `list_files`, para um caminho isolado (eventos do watcher)."""
+        return (
+            not path.name.startswith(".")
+            and any(path.match(ext) for ext in FileManager.SUPPORTED_EXTENSIONS)
+            and any(path.is_relative_to(dir_path) for dir_path in settings.FILE_PATHS)
+        )
+
+    _chunker: Optional[chunking.StructuralChunker] = None
+
+    @staticmethod
+    def iter_chunks(segments: Iterable[str]) -> Iterator[str]:
+        """Chunka os segmentos em streaming conforme CHUNK_MODE."""
+        if settings.CHUNK_MODE == "tokens":
+            if FileManager._chunker is None:
+                # um por processo de extração, reaproveitando a conexão com o tokenizador
+                FileManager._chunker = chunking.StructuralChunker(
+                    chunking.TokenCounter(settings.EMBEDDING_TOKENIZE_URL),
+                    settings.CHUNK_MAX_TOKENS, settings.CHUNK_OVERLAP_TOKENS,
+                )
+            yield from FileManager._chunker.iter_chunks(segments)
+        else:
+            yield from FileManager._iter_word_chunks(segments)
+
+    @staticmethod
+    def _iter_word_chunks(segments: Iterable[str]) -> Iterator[str]:
+        """Janela deslizante de CHUNK_SIZE palavras com CHUNK_OVERLAP de sobreposição, em streaming."""
+        stride = max(1, settings.CHUNK_SIZE - settings.CHUNK_OVERLAP)
+        words: List[str] = []
+        emitted = False
+        for segment in segments:
+            words.extend(segment.split())
+            while len(words) >= settings.CHUNK_SIZE:
+                yield " ".join(words[: settings.CHUNK_SIZE])
+                emitted = True
+                del words[:stride]
+        # a cauda só vira chunk se tiver algo além da sobreposição já coberta pelo chunk anterior
+        if words and (not emitted or len(words) > settings.CHUNK_OVERLAP):
+            yield " ".join(words)
 
     @staticmethod
     def chunk_text(text: str) -> List[str]:
         if not text: return []
-        words = text.split()
-        stride = settings.CHUNK_SIZE - settings.CHUNK_OVERLAP
-        chunks = [" ".join(words[i : i + settings.CHUNK_SIZE]) for i in range(0, len(words), stride)]
-        return [chunk for chunk in chunks if chunk.strip()]
+        return list(FileManager.iter_chunks([text]))
 
 # --- CLIENTES HTTP PARA MICROSERVIÇOS ---
 class EmbeddingClient:
+    """
+    Cliente do serviço de embedding com conexões keep-alive. `embed` é síncrono (threads da indexação)
+    e `aembed` é assíncrono (consultas), limitado a EMBEDDING_MAX_CONCURRENCY requisições simultâneas.
+    Em caso de sucesso os vetores vêm como matriz NumPy float32; em caso de falha, uma lista vazia por texto.
+    """
+
+    BINARY_FORMATS = {
+        "application/x-embeddings-f32": "<f4",
+        "application/x-embeddings-f16": "<f2",
+    }
+
     def __init__(self, service_url: str):
         self.service_url = service_url
+        wire_format = settings.EMBEDDING_WIRE_FORMAT.lower()
+        # o JSON fica como alternativa para serviços que não falam o formato binário
+        self._headers = (
+            {"Accept": f"application/x-embeddings-{wire_format}, application/json;q=0.5"}
+            if wire_format in ("f32", "f16") else {"Accept": "application/json"}
+        )
+        timeout = httpx.Timeout(settings.EMBEDDING_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+        self._client = httpx.Client(
+            timeout=timeout, limits=httpx.Limits(max_connections=max(1, settings.EMBEDDING_CONCURRENCY))
+        )
+        self._async_client = httpx.AsyncClient(
+            timeout=timeout, limits=httpx.Limits(max_connections=settings.EMBEDDING_MAX_CONCURRENCY)
+        )
+        self._semaphore = asyncio.Semaphore(settings.EMBEDDING_MAX_CONCURRENCY)
+        # embeddings de perguntas em andamento; a reindexação em segundo plano cede a vez a eles
+        self.live_requests = 0
+
+    @classmethod
+    def _decode(cls, response: httpx.Response, expected_rows: int) -> np.ndarray:
+        """
+        Vetores da resposta, um por texto enviado. Corpo malformado ou truncado vira `httpx.DecodingError`,
+        tratado como qualquer outra falha de comunicação com o serviço.
+        """
+        dtype = cls.BINARY_FORMATS.get(response.headers.get("content-type", "").split(";")[0].strip())
+        try:
+            if dtype is None:
+                matrix = np.asarray(response.json()["embeddings"], dtype=np.float32)
+            else:
+                content = response.content
+                rows, dim = struct.unpack_from("<II", content)
+                size = 8 + rows * dim * np.dtype(dtype).itemsize
+                if len(content) != size:
+                    raise ValueError(f"corpo com {len(content)} bytes, esperados {size} para {rows}x{dim}")
+                matrix = np.frombuffer(content, dtype=dtype, offset=8).reshape(rows, dim).astype(np.float32, copy=False)
+        except (struct.error, ValueError, KeyError, TypeError) as e:
+            raise httpx.DecodingError(f"resposta de embedding inválida: {e}", request=response.request) from e
+        if matrix.ndim != 2 or len(matrix) != expected_rows:
+            raise httpx.DecodingError(
+                f"resposta de embedding com formato {matrix.shape}, esperadas {expected_rows} linhas", request=response.request
+            )
+        return matrix
+
+    def embed(self, texts: List[str]) -> "np.ndarray | List[List[float]]":
+        if not texts: return []
+        try:
+            response = self._client.post(self.service_url, json={"texts": texts}, headers=self._headers)
+            response.raise_for_status()
+            return self._decode(response, len(texts))
+        except httpx.HTTPError as e:
+            log.error(f"Falha ao contatar o serviço de embedding em {self.service_url}: {e}")
+            return [[] for _ in texts]
 
-    def embed(self, texts: List[str]) -> List[List[float]]:
+    async def aembed(self, texts: List[str]) -> "np.ndarray | List[List[float]]":
         if not texts: return []
+        self.live_requests += 1
         try:
-            response = requests.post(self.service_url, json={"texts": texts}, timeout=90)
+            async with self._semaphore:
+                response = await self._async_client.post(
+                    self.service_url, json={"texts": texts}, headers={**self._headers, **outgoing_headers()}
+                )
             response.raise_for_status()
-            return response.json()["embeddings"]
-        except requests.exceptions.RequestException as e:
+            return self._decode(response, len(texts))
+        except httpx.HTTPError as e:
             log.error(f"Falha ao contatar o serviço de embedding em {self.service_url}: {e}")
             return [[] for _ in texts]
+        finally:
+            self.live_requests -= 1
+
+    async def aclose(self):
+        self._client.close()
+        await self._async_client.aclose()
+
+class GeneratorBusyError(Exception):
+    """O serviço gerador recusou a requisição por fila cheia (HTTP 429)."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Serviço gerador sobrecarregado; tente novamente em {retry_after}s.")
+        self.retry_after = retry_after
+
+    @classmethod
+    def check(cls, response: httpx.Response):
+        if response.status_code == 429:
+            raise cls(int(response.headers.get("Retry-After", "1")))
+
+class GeneratorError(Exception):
+    """Falha na comunicação com o serviço gerador, antes ou no meio da resposta."""
 
 class GeneratorClient:
+    """Cliente assíncrono do serviço gerador, limitado a GENERATOR_MAX_CONCURRENCY gerações simultâneas."""
+
+    ERROR_REPLY = "Desculpe, ocorreu um erro de comunicação ao tentar gerar a resposta."
+
     def __init__(self, service_url: str):
         self.service_url = service_url
-    
-    def chat(self, user_prompt: str) -> str:
-        prompt = f"<s>[INST] <<SYS>>\n{settings.RAG_SYSTEM_PROMPT}\n<</SYS>>\n\n{user_prompt} [/INST]"
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.GENERATOR_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=settings.GENERATOR_MAX_CONCURRENCY),
+        )
+        self._semaphore = asyncio.Semaphore(settings.GENERATOR_MAX_CONCURRENCY)
+        # o /tokenize responde em milissegundos; no pool das gerações ficaria na fila atrás delas
+        self._tokenize_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.TOKENIZE_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+        )
+
+    # prefixo idêntico em todos os prompts; o gerador mantém o estado KV dele em cache
+    SYSTEM_PREFIX = f"<s>[INST] <<SYS>>\n{settings.RAG_SYSTEM_PROMPT}\n<</SYS>>\n\n"
+
+    @classmethod
+    def build_payload(cls, user_prompt: str, stream: bool = False) -> Dict:
+        return {"prompt": f"{cls.SYSTEM_PREFIX}{user_prompt} [/INST]", "cache_prefix": cls.SYSTEM_PREFIX, "stream": stream}
+
+    async def chat(self, user_prompt: str) -> str:
         try:
-            response = requests.post(self.service_url, json={"prompt": prompt}, timeout=6000)
+            async with self._semaphore:
+                response = await self._client.post(
+                    self.service_url, json=self.build_payload(user_prompt), headers=outgoing_headers()
+                )
+            GeneratorBusyError.check(response)
             response.raise_for_status()
             return response.json()["text"]
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
+            log.error(f"Falha ao contatar o serviço gerador em {self.service_url}: {e}")
+            raise GeneratorError(str(e)) from e
+
+    async def stream_chat(self, user_prompt: str) -> AsyncIterator[str]:
+        """
+        Consome o SSE do `/generate` em modo streaming e repassa os tokens conforme chegam. Uma falha,
+        mesmo depois de tokens já entregues, sai como GeneratorError: a resposta parcial não está completa.
+        """
+        try:
+            async with self._semaphore:
+                async with self._client.stream(
+                    "POST", self.service_url, json=self.build_payload(user_prompt, stream=True), headers=outgoing_headers()
+                ) as response:
+                    GeneratorBusyError.check(response)
+                    response.raise_for_status()
+                    event = None
+                    async for line in response.aiter_lines():
+                        if line.startswith("event:"):
+                            event = line[len("event:"):].strip()
+                        elif line.startswith("data:"):
+                            if event == "done":
+                                return
+                            if event == "error":
+                                raise httpx.HTTPError(json.loads(line[len("data:"):]).get("detail", "erro na geração"))
+                            yield json.loads(line[len("data:"):])["token"]
+                        elif not line:
+                            event = None
+        except httpx.HTTPError as e:
             log.error(f"Falha ao contatar o serviço gerador em {self.service_url}: {e}")
-            return "Desculpe, ocorreu um erro de comunicação ao tentar gerar a resposta."
+            raise GeneratorError(str(e)) from e
+
+    async def count_tokens(self, texts: List[str]) -> Tuple[List[int], Optional[int]]:
+        """
+        Conta tokens com o tokenizador do gerador e devolve também o tamanho do contexto do modelo.
+        Se o `/tokenize` falhar, cai para uma estimativa conservadora por caracteres.
+        """
+        try:
+            response = await self._tokenize_client.post(
+                settings.GENERATOR_TOKENIZE_URL, json={"texts": texts}, headers=outgoing_headers()
+            )
+            response.raise_for_status()
+            data = response.json()
+            return data["counts"], data["context_length"]
+        except (httpx.HTTPError, KeyError, TypeError) as e:
+            log.warning(f"Falha ao contar tokens no gerador, usando estimativa: {e}")
+            return [len(text) // 3 + 1 for text in texts], None
+
+    async def aclose(self):
+        await self._client.aclose()
+        await self._tokenize_client.aclose()
 
 # --- VECTOR STORE ---
-class ChromaStore:
+class VectorStore(ABC):
+    """
+    Interface dos vector stores. As subclasses guardam vetores, textos e metadados (`_upsert`,
+    `_delete`, `_update_metadata`, `_clear`, `_search`, `_get`, `count`, `iter_documents`); a base
+    mantém o índice léxico em sincronia, faz a busca híbrida e avisa os `change_listeners`.
+    """
+
+    def __init__(self):
+        # chamados com os ids de chunks gravados ou removidos (ex.: invalidação do cache de respostas)
+        self.change_listeners: List[Callable[[List[str]], None]] = []
+        self.lexical: Optional[LexicalIndex] = None
+        if settings.HYBRID_SEARCH:
+            self.lexical = LexicalIndex(settings.LEXICAL_INDEX_PATH)
+            self._sync_lexical()
+
+    def _sync_lexical(self):
+        if self.lexical.load() and len(self.lexical) == self.count():
+            return
+        self.rebuild_lexical()
+
+    def rebuild_lexical(self):
+        log.info("Reconstruindo o índice léxico a partir da coleção...")
+        self.lexical.clear()
+        for ids, documents in self.iter_documents():
+            self.lexical.add(ids, documents)
+        self.lexical.save()
+
+    def persist(self):
+        """Grava os índices auxiliares; chamado antes do salvamento do manifesto."""
+        if self.lexical is not None:
+            self.lexical.save()
+
+    def _notify(self, ids: List[str]):
+        for listener in self.change_listeners:
+            listener(ids)
+
+    def add(self, ids: List[str], embeddings: "np.ndarray | List[List[float]]", metadatas: List[Dict], documents: List[str]):
+        if not ids: return
+        # upsert: ids são estáveis, então reprocessar um arquivo não duplica chunks
+        self._upsert(ids, embeddings, metadatas, documents)
+        if self.lexical is not None:
+            self.lexical.add(ids, documents)
+        self._notify(ids)
+
+    def delete(self, ids: List[str]):
+        if not ids: return
+        self._delete(ids)
+        if self.lexical is not None:
+            self.lexical.delete(ids)
+        self._notify(ids)
+
+    def set_sources(self, sources: Dict[str, Iterable[str]]):
+        """Atualiza o `source` de chunks compartilhados por vários arquivos (chunks deduplicados)."""
+        if not sources: return
+        ids = list(sources)
+        metadatas = [{"source": " | ".join(sorted({Path(key).name for key in sources[cid]}))} for cid in ids]
+        self._update_metadata(ids, metadatas)
+
+    def reset(self):
+        ids = self._clear()
+        if self.lexical is not None:
+            self.lexical.clear()
+        self._notify(ids)
+
+    def query(self, query_embedding: List[float], query_text: Optional[str] = None) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Retorna os documentos, as fontes e os ids dos chunks mais relevantes. Com a busca híbrida ativa,
+        os VECTOR_TOP_K vizinhos por cosseno e os LEXICAL_TOP_K melhores por BM25 são fundidos por RRF.
+        """
+        return self.query_many([query_embedding], [query_text])[0]
+
+    def query_many(self, query_embeddings: List[List[float]],
+                   query_texts: Optional[List[Optional[str]]] = None) -> List[Tuple[List[str], List[str], List[str]]]:
+        """`query` para várias perguntas com uma única busca vetorial multi-vetor."""
+        if not len(query_embeddings):
+            return []
+        if self.count() == 0:
+            # coleção ainda vazia durante a primeira indexação
+            return [([], [], []) for _ in query_embeddings]
+        query_texts = query_texts or [None] * len(query_embeddings)
+        vector_rankings, found = self._search(query_embeddings, settings.VECTOR_TOP_K)
+        rankings = []
+        for ranked, query_text in zip(vector_rankings, query_texts):
+            if self.lexical is not None and query_text:
+                lexical_ids = [doc_id for doc_id, _ in self.lexical.query(query_text, settings.LEXICAL_TOP_K)]
+                ranked = reciprocal_rank_fusion([ranked, lexical_ids], k=settings.RRF_K)
+            rankings.append(ranked[: settings.TOP_K_RESULTS])
+
+        # hits só do BM25 ainda não têm texto: uma única leitura para todas as perguntas
+        missing = list(dict.fromkeys(doc_id for ranked in rankings for doc_id in ranked if doc_id not in found))
+        if missing:
+            found.update(self._get(missing))
+
+        results = []
+        for ranked in rankings:
+            top = [doc_id for doc_id in ranked if doc_id in found]
+            results.append(([found[doc_id][0] for doc_id in top], [found[doc_id][1].get("source", "?") for doc_id in top], top))
+        return results
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def iter_documents(self, page_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+        """Percorre a coleção inteira em páginas de (ids, documentos)."""
+
+    @abstractmethod
+    def _upsert(self, ids: List[str], embeddings, metadatas: List[Dict], documents: List[str]):
+        ...
+
+    @abstractmethod
+    def _delete(self, ids: List[str]):
+        ...
+
+    @abstractmethod
+    def _update_metadata(self, ids: List[str], metadatas: List[Dict]):
+        ...
+
+    @abstractmethod
+    def _clear(self) -> List[str]:
+        """Apaga tudo e devolve os ids que existiam."""
+
+    @abstractmethod
+    def _search(self, query_embeddings, k: int) -> Tuple[List[List[str]], Dict[str, Tuple[str, Dict]]]:
+        """Ids dos `k` vizinhos de cada consulta, em ordem, e (documento, metadados) dos que já vieram na busca."""
+
+    @abstractmethod
+    def _get(self, ids: List[str]) -> Dict[str, Tuple[str, Dict]]:
+        ...
+
+class ChromaStore(VectorStore):
     def __init__(self):
         settings.DB_DIR.mkdir(exist_ok=True)
         self.client = chromadb.Client(
@@ -112,85 +653,1106 @@ class ChromaStore:
         self.collection = self.client.get_or_create_collection(
             name=settings.COLLECTION_NAME, metadata={"hnsw:space": "cosine"}
         )
+        super().__init__()
         log.info(f"Vector store '{settings.COLLECTION_NAME}' conectado em {settings.DB_DIR}.")
 
-    def add(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict], documents: List[str]):
-        if not ids: return
-        self.collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+    def iter_documents(self, page_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+        offset = 0
+        while True:
+            page = self.collection.get(include=["documents"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                return
+            yield page["ids"], page["documents"]
+            offset += len(page["ids"])
+
+    def _upsert(self, ids: List[str], embeddings, metadatas: List[Dict], documents: List[str]):
+        self.collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def _delete(self, ids: List[str]):
+        self.collection.delete(ids=ids)
+
+    def _update_metadata(self, ids: List[str], metadatas: List[Dict]):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def _clear(self) -> List[str]:
+        ids = self.collection.get(include=[])["ids"]
+        self.client.delete_collection(name=settings.COLLECTION_NAME)
+        self.collection = self.client.get_or_create_collection(
+            name=settings.COLLECTION_NAME, metadata={"hnsw:space": "cosine"}
+        )
+        return ids
+
+    def _search(self, query_embeddings, k: int) -> Tuple[List[List[str]], Dict[str, Tuple[str, Dict]]]:
+        res = self.collection.query(query_embeddings=list(query_embeddings), n_results=k)
+        found: Dict[str, Tuple[str, Dict]] = {}
+        for ids, docs, metas in zip(res["ids"], res["documents"], res["metadatas"]):
+            found.update({doc_id: (doc, meta) for doc_id, doc, meta in zip(ids, docs, metas)})
+        return [list(ids) for ids in res["ids"]], found
+
+    def _get(self, ids: List[str]) -> Dict[str, Tuple[str, Dict]]:
+        extra = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return {doc_id: (doc, meta) for doc_id, doc, meta in zip(extra["ids"], extra["documents"], extra["metadatas"])}
+
+class NumpyStore(VectorStore):
+    """
+    Busca exata em um `FlatVectorIndex` (matriz memory-mapped em float32 ou int8). Sem HNSW nem SQLite:
+    abre rápido e ocupa pouca memória residente em coleções de dezenas de milhares de chunks.
+    """
+
+    def __init__(self):
+        self.index = FlatVectorIndex(settings.NUMPY_STORE_DIR, settings.NUMPY_STORE_DTYPE)
+        super().__init__()
+        log.info(f"Vector store NumPy ({settings.NUMPY_STORE_DTYPE}, {len(self.index)} chunks) aberto em {settings.NUMPY_STORE_DIR}.")
+
+    def persist(self):
+        # linhas removidas só ocupam espaço e tempo de busca; a compactação reescreve o índice inteiro
+        if self.index.dead_rows > settings.NUMPY_STORE_COMPACT_RATIO * max(len(self.index), 1):
+            self.index.compact()
+        super().persist()
+
+    def iter_documents(self, page_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+        return self.index.iter_documents(page_size)
+
+    def _upsert(self, ids: List[str], embeddings, metadatas: List[Dict], documents: List[str]):
+        self.index.upsert(ids, embeddings, metadatas, documents)
+
+    def _delete(self, ids: List[str]):
+        self.index.delete(ids)
+
+    def _update_metadata(self, ids: List[str], metadatas: List[Dict]):
+        self.index.update_metadata(ids, metadatas)
+
+    def count(self) -> int:
+        return len(self.index)
+
+    def _clear(self) -> List[str]:
+        ids = [doc_id for page, _ in self.index.iter_documents() for doc_id in page]
+        self.index.clear()
+        return ids
+
+    def _search(self, query_embeddings, k: int) -> Tuple[List[List[str]], Dict[str, Tuple[str, Dict]]]:
+        rankings = [[doc_id for doc_id, _ in hits] for hits in self.index.search(query_embeddings, k)]
+        return rankings, self.index.get(list(dict.fromkeys(doc_id for ranked in rankings for doc_id in ranked)))
+
+    def _get(self, ids: List[str]) -> Dict[str, Tuple[str, Dict]]:
+        return self.index.get(ids)
+
+VECTOR_STORES = {"chroma": ChromaStore, "numpy": NumpyStore}
+
+def create_vector_store() -> VectorStore:
+    if settings.VECTOR_STORE not in VECTOR_STORES:
+        raise ValueError(f"VECTOR_STORE inválido: {settings.VECTOR_STORE} (opções: {', '.join(VECTOR_STORES)})")
+    return VECTOR_STORES[settings.VECTOR_STORE]()
 
-    def query(self, query_embedding: List[float]) -> Tuple[List[str], List[str]]:
-        res = self.collection.query(query_embeddings=[query_embedding], n_results=settings.TOP_K_RESULTS)
-        docs = res.get("documents", [[]])[0]
-        sources = [m.get("source", "?") for m in res.get("metadatas", [[]])[0]]
-        return docs, sources
+def vector_store_signature() -> str:
+    """Identifica o backend no manifesto; trocar de backend ou de tipo de vetor força a reindexação."""
+    if settings.VECTOR_STORE == "numpy":
+        return f";store:numpy-{settings.NUMPY_STORE_DTYPE}"
+    # o Chroma não aparece na assinatura, para que índices anteriores a esta opção continuem válidos
+    return ""
+
+# --- MANIFESTO DO ÍNDICE ---
+class IndexManifest:
+    """
+    Registro persistente dos arquivos já indexados (mtime, tamanho, hash do conteúdo e ids dos chunks),
+    junto com a configuração de chunking usada para gerá-los. Durante a indexação, `flush` só acrescenta
+    as mudanças a um log ao lado do manifesto; `save` reescreve o manifesto inteiro e descarta o log.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path = path or settings.MANIFEST_PATH
+        self.log_path = path.with_suffix(".log")
+        self.exists = path.exists()
+        self.files: Dict[str, Dict] = {}
+        # mudanças (chave, entrada ou None se removida) ainda fora do log
+        self._delta: List[Tuple[str, Optional[Dict]]] = []
+        # indexação anterior interrompida: os snapshots dos índices auxiliares podem estar atrasados
+        self.recovered = False
+        self.chunking = f"{chunking.signature()};loader:{FileManager.LOADER_VERSION}{vector_store_signature()}"
+        if self.exists:
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                self.files = data["files"]
+            except Exception as e:
+                log.warning(f"Manifesto do índice em {path} ilegível, será reconstruído: {e}")
+                self.exists = False
+            else:
+                if data.get("chunking") != self.chunking:
+                    log.info(f"Configuração de chunking mudou ({data.get('chunking')} -> {self.chunking}); todos os arquivos serão reindexados.")
+                    for entry in self.files.values():
+                        entry.update(mtime=None, hash=None)
+        if self.log_path.exists():
+            self._replay()
+
+    def _replay(self):
+        """Reaplica o log de uma indexação interrompida e o incorpora ao manifesto."""
+        applied = 0
+        with open(self.log_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:
+                    # última linha pela metade: a queda aconteceu durante a gravação
+                    break
+                entry = change["entry"]
+                if entry is None:
+                    self.files.pop(change["key"], None)
+                else:
+                    if change["chunking"] != self.chunking:
+                        entry.update(mtime=None, hash=None)
+                    self.files[change["key"]] = entry
+                applied += 1
+        log.info(f"{applied} mudanças recuperadas do log do manifesto ({self.log_path.name}).")
+        self.recovered = True
+        self.save()
+
+    @staticmethod
+    def file_hash(file_path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _changed_hash(self, path: Path) -> Optional[str]:
+        """Hash do arquivo se ele é novo ou mudou desde que foi indexado; None se o índice continua válido."""
+        stat = path.stat()
+        entry = self.files.get(str(path))
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            return None
+        content_hash = self.file_hash(path)
+        if entry and entry["hash"] == content_hash:
+            # apenas o mtime mudou (ex.: cópia ou touch); o conteúdo indexado continua válido
+            entry.update(mtime=stat.st_mtime, size=stat.st_size)
+            self._delta.append((str(path), entry))
+            return None
+        return content_hash
+
+    def diff(self, paths: List[Path]) -> Tuple[List[Tuple[Path, str]], List[str]]:
+        """Retorna os arquivos novos ou alterados (com seu hash) e as chaves dos arquivos removidos."""
+        changed, seen = [], set()
+        for path in paths:
+            seen.add(str(path))
+            content_hash = self._changed_hash(path)
+            if content_hash:
+                changed.append((path, content_hash))
+        removed = [key for key in self.files if key not in seen]
+        return changed, removed
+
+    def diff_paths(self, paths: Iterable[Path]) -> Tuple[List[Tuple[Path, str]], List[str]]:
+        """`diff` restrito a `paths` (eventos do watcher): os que não existem mais contam como removidos."""
+        changed, removed = [], []
+        for path in paths:
+            try:
+                content_hash = self._changed_hash(path) if FileManager.is_supported(path) else None
+            except FileNotFoundError:
+                if str(path) in self.files:
+                    removed.append(str(path))
+                continue
+            if content_hash:
+                changed.append((path, content_hash))
+        return changed, removed
+
+    def chunk_ids(self, key: str) -> List[str]:
+        return self.files.get(key, {}).get("chunk_ids", [])
+
+    def record(self, path: Path, content_hash: str, chunk_ids: List[str], error: Optional[str] = None):
+        stat = path.stat()
+        self.files[str(path)] = {
+            "mtime": stat.st_mtime, "size": stat.st_size, "hash": content_hash, "chunk_ids": chunk_ids
+        }
+        if error:
+            self.files[str(path)]["error"] = error
+        self._delta.append((str(path), self.files[str(path)]))
+
+    def forget(self, key: str):
+        if self.files.pop(key, None) is not None:
+            self._delta.append((key, None))
+
+    def flush(self):
+        """Acrescenta ao log as mudanças desde o último `flush` ou `save`, sem reescrever o manifesto."""
+        if not self._delta:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lines = [json.dumps({"key": key, "entry": entry, "chunking": self.chunking}) for key, entry in self._delta]
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        self._delta = []
+        self.exists = True
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"chunking": self.chunking, "files": self.files}), encoding="utf-8")
+        tmp_path.replace(self.path)
+        # o log só some depois do manifesto novo no lugar; reaplicá-lo sobre ele não muda nada
+        self.log_path.unlink(missing_ok=True)
+        self._delta = []
+        self.exists = True
+
+def chunk_id(source_key: str, chunk: str) -> str:
+    """Id estável de um chunk, derivado do arquivo de origem e do seu conteúdo."""
+    return hashlib.sha1(f"{source_key}\x00{chunk}".encode("utf-8")).hexdigest()
+
+# --- PROGRESSO DA INDEXAÇÃO ---
+class IndexProgress:
+    """Estado da construção do índice, atualizado pela thread de indexação e lido pelo endpoint de status."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.state = "idle"
+        self.files_total = 0
+        self.files_done = 0
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.chunks_deduplicated = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.indexing_started_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def start(self):
+        with self._lock:
+            self._reset()
+            self.state = "scanning"
+            self.started_at = time.time()
+
+    def update(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            if fields.get("state") == "indexing" and self.indexing_started_at is None:
+                self.indexing_started_at = time.time()
+            if fields.get("state") in ("done", "failed", "stopped"):
+                self.finished_at = time.time()
+
+    def increment(self, field: str, amount: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    @property
+    def running(self) -> bool:
+        return self.state in ("scanning", "indexing")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            now = self.finished_at or time.time()
+            eta = None
+            if self.running and self.indexing_started_at and 0 < self.files_done < self.files_total:
+                # chunks são produzidos em streaming, então o total de chunks só é conhecido no fim;
+                # o ritmo de arquivos concluídos é a melhor estimativa disponível
+                rate = self.files_done / max(now - self.indexing_started_at, 1e-6)
+                eta = round((self.files_total - self.files_done) / rate, 1)
+            return {
+                "state": self.state,
+                "files_total": self.files_total,
+                "files_done": self.files_done,
+                "chunks_total": self.chunks_total,
+                "chunks_embedded": self.chunks_embedded,
+                "chunks_deduplicated": self.chunks_deduplicated,
+                "elapsed_seconds": round(now - self.started_at, 1) if self.started_at else None,
+                "eta_seconds": eta,
+                "error": self.error,
+            }
+
+def release_chunks(store: VectorStore, dedup: Optional[DedupIndex], key: str, ids: List[str]):
+    """Remove as referências do arquivo `key` aos chunks; só apaga do store os que ficaram sem nenhuma."""
+    if dedup is None:
+        store.delete(ids)
+        return
+    orphans, shared = [], {}
+    for cid in dict.fromkeys(ids):
+        if dedup.release(cid, key):
+            orphans.append(cid)
+        else:
+            shared[cid] = dedup.refs(cid)
+    store.delete(orphans)
+    store.set_sources(shared)
+
+# --- PIPELINE DE INGESTÃO ---
+class EmbeddingThrottle:
+    """
+    Limita o embedding da reindexação em segundo plano: no máximo `rate` chunks por segundo (token
+    bucket) e, antes de cada lote, espera até LIVE_WAIT_MAX segundos enquanto houver embeddings de
+    perguntas do /chat em andamento no mesmo `EmbeddingClient`.
+    """
+
+    LIVE_WAIT_MAX = 2.0
+
+    def __init__(self, rate: float, embedder: "EmbeddingClient"):
+        self.rate = rate
+        self.embedder = embedder
+        self.capacity = max(rate, settings.EMBEDDING_BATCH_SIZE)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, chunks: int, stop_event: threading.Event):
+        if self.rate > 0:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate) - chunks
+                self._updated = now
+                delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if delay:
+                stop_event.wait(delay)
+        deadline = time.monotonic() + self.LIVE_WAIT_MAX
+        while self.embedder.live_requests > 0 and time.monotonic() < deadline and not stop_event.is_set():
+            time.sleep(0.01)
+
+class IngestPipeline:
+    """
+    Ingestão em streaming: os chunks são agrupados em lotes numa fila limitada, embedados por até
+    EMBEDDING_CONCURRENCY requisições simultâneas e gravados no store assim que cada lote fica pronto.
+    Um único escritor controla store, manifesto e progresso; um arquivo entra no manifesto quando
+    todos os seus chunks foram gravados. Com o índice de duplicatas, chunks quase iguais a um já
+    existente (ou em voo) não são embedados: o arquivo passa a referenciar o chunk canônico.
+    """
+
+    MANIFEST_SAVE_EVERY = 25
+
+    def __init__(self, embedder: "EmbeddingClient", store: VectorStore, manifest: IndexManifest,
+                 progress: IndexProgress, hashes: Dict[str, str], dedup: Optional[DedupIndex] = None,
+                 concurrency: Optional[int] = None, throttle: Optional[EmbeddingThrottle] = None):
+        self.embedder = embedder
+        self.store = store
+        self.manifest = manifest
+        self.progress = progress
+        self.hashes = hashes
+        self.dedup = dedup
+        # canônicos enviados ao embedding e ainda não gravados, e os arquivos à espera de cada um
+        self.pending: Set[str] = set()
+        self.waiting: Dict[str, List[str]] = {}
+        self.embed_queue: queue.Queue = queue.Queue(maxsize=settings.EMBEDDING_QUEUE_SIZE)
+        self.write_queue: queue.Queue = queue.Queue(maxsize=settings.EMBEDDING_QUEUE_SIZE)
+        self.expected: Dict[str, int] = {}
+        self.stored_ids: Dict[str, List[str]] = {}
+        self.failed = set()
+        self.skipped = set()
+        self.chunks_stored = 0
+        self.chunks_deduplicated = 0
+        self.batches_done = 0
+        self._unsaved = 0
+        self._last_full_checkpoint = time.monotonic()
+        self.concurrency = concurrency or settings.EMBEDDING_CONCURRENCY
+        self.throttle = throttle
+        self.stop_event: Optional[threading.Event] = None
+
+    def run(self, events: Iterable[Tuple[str, str, object]], stop_event: threading.Event) -> bool:
+        self.stop_event = stop_event
+        workers = [
+            threading.Thread(target=self._embed_worker, name=f"rag-embed-{i}", daemon=True)
+            for i in range(max(1, self.concurrency))
+        ]
+        writer = threading.Thread(target=self._writer, name="rag-index-writer", daemon=True)
+        for thread in workers + [writer]:
+            thread.start()
+
+        completed = True
+        batch: List[Tuple[str, str, dict]] = []
+        try:
+            for kind, key, payload in events:
+                if stop_event.is_set():
+                    completed = False
+                    break
+                if kind != "chunks":
+                    self.write_queue.put((kind, key, payload))
+                    continue
+                self.progress.increment("chunks_total", len(payload))
+                for chunk in payload:
+                    if self._deduplicate(chunk):
+                        continue
+                    batch.append(chunk)
+                    if len(batch) >= settings.EMBEDDING_BATCH_SIZE:
+                        self.embed_queue.put(batch)
+                        batch = []
+            if batch and completed:
+                self.embed_queue.put(batch)
+        finally:
+            if hasattr(events, "close"):
+                events.close()
+            for _ in workers:
+                self.embed_queue.put(None)
+            for thread in workers:
+                thread.join()
+            self.write_queue.put(None)
+            writer.join()
+            self._checkpoint(full=True)
+
+        if self.chunks_deduplicated:
+            log.info(f"{self.chunks_deduplicated} chunks quase duplicados descartados antes do embedding.")
+        if self.failed:
+            log.warning(f"{len(self.failed)} arquivos tiveram falha de embedding e serão reprocessados na próxima execução.")
+        if self.skipped:
+            log.warning(f"{len(self.skipped)} arquivos não puderam ser extraídos e ficam fora do índice até serem modificados.")
+        return completed
+
+    def _checkpoint(self, full: bool = False):
+        """
+        Os chunks já estão no store quando o arquivo entra no manifesto, então um checkpoint comum só
+        acrescenta as entradas novas ao log do manifesto. Os snapshots inteiros (índice léxico, índice de
+        duplicatas e manifesto compactado) são gravados a cada INDEX_CHECKPOINT_INTERVAL segundos e no
+        fim da execução; após uma queda, os snapshots atrasados são reconstruídos a partir do store.
+        """
+        if full or time.monotonic() - self._last_full_checkpoint >= settings.INDEX_CHECKPOINT_INTERVAL:
+            # o store antes do manifesto: o manifesto nunca aponta para chunks que não foram gravados
+            self.store.persist()
+            self.manifest.save()
+            if self.dedup is not None:
+                self.dedup.save()
+            self._last_full_checkpoint = time.monotonic()
+        else:
+            self.manifest.flush()
+
+    def _deduplicate(self, chunk: Tuple[str, str, dict]) -> bool:
+        """Registra o chunk no índice de duplicatas; True se ele é quase cópia de um chunk já existente."""
+        if self.dedup is None:
+            return False
+        cid, text, meta = chunk
+        signature = self.dedup.signature(text)
+        canonical = self.dedup.find(signature)
+        if canonical and canonical != cid and self.dedup.acquire(canonical, meta["path"]):
+            self.chunks_deduplicated += 1
+            self.progress.increment("chunks_deduplicated")
+            self.write_queue.put(("duplicate", meta["path"], canonical))
+            return True
+        self.dedup.add(cid, signature, meta["path"])
+        self.pending.add(cid)
+        return False
+
+    def _embed_worker(self):
+        while True:
+            batch = self.embed_queue.get()
+            if batch is None:
+                return
+            if self.throttle is not None:
+                self.throttle.wait(len(batch), self.stop_event)
+            start = time.perf_counter()
+            try:
+                embeddings = self.embedder.embed([c[1] for c in batch])
+            except Exception as e:
+                log.error(f"Erro inesperado ao embedar lote: {e}", exc_info=True)
+                embeddings = [[] for _ in batch]
+            STAGE_SECONDS.labels("index_batch", "embed").observe(time.perf_counter() - start)
+            self.write_queue.put(("batch", batch, embeddings))
+
+    def _writer(self):
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                return
+            try:
+                if item[0] == "close":
+                    self.expected[item[1]] = item[2]
+                    self._maybe_finish(item[1])
+                elif item[0] == "error":
+                    self._extraction_failed(item[1], item[2])
+                elif item[0] == "duplicate":
+                    self._link(item[1], item[2])
+                else:
+                    self._store_batch(item[1], item[2])
+            except Exception as e:
+                # o escritor não pode morrer, senão as filas limitadas travam os produtores
+                log.error(f"Erro ao gravar lote no índice: {e}", exc_info=True)
+
+    def _store_batch(self, batch: List[Tuple[str, str, dict]], embeddings: List[List[float]]):
+        ready = []
+        for chunk, emb in zip(batch, embeddings):
+            key = chunk[2]["path"]
+            if len(emb) == 0:
+                self._fail(key)
+            elif key not in self.failed and key not in self.skipped:
+                ready.append((chunk, emb))
+
+        start = time.perf_counter()
+        try:
+            self.store.add(
+                [c[0] for c, _ in ready], [emb for _, emb in ready], [c[2] for c, _ in ready], [c[1] for c, _ in ready]
+            )
+            STAGE_SECONDS.labels("index_batch", "store").observe(time.perf_counter() - start)
+        except Exception as e:
+            log.error(f"Falha ao gravar lote no vector store: {e}")
+            for chunk, _ in ready:
+                self._fail(chunk[2]["path"])
+            ready = []
+
+        for chunk, _ in ready:
+            self.stored_ids.setdefault(chunk[2]["path"], []).append(chunk[0])
+        self.chunks_stored += len(ready)
+        if self.dedup is not None:
+            stored = {chunk[0] for chunk, _ in ready}
+            for chunk in batch:
+                if chunk[0] in stored:
+                    self.pending.discard(chunk[0])
+                    for waiter in self.waiting.pop(chunk[0], []):
+                        self._link(waiter, chunk[0])
+                else:
+                    self._abandon(chunk[0])
+        self.batches_done += 1
+        self.progress.increment("chunks_embedded", len(batch))
+        log.info(f"Processado lote de embeddings {self.batches_done}...")
+
+        for key in {chunk[2]["path"] for chunk, _ in ready}:
+            self._maybe_finish(key)
+
+    def _link(self, key: str, canonical: str):
+        """Faz o arquivo `key` referenciar um chunk canônico no lugar do seu chunk quase duplicado."""
+        if canonical in self.pending:
+            self.waiting.setdefault(canonical, []).append(key)
+            return
+        if key in self.failed or key in self.skipped:
+            release_chunks(self.store, self.dedup, key, [canonical])
+            return
+        refs = self.dedup.refs(canonical)
+        if not refs:
+            # o canônico não chegou a ser gravado; o arquivo é reprocessado na próxima execução
+            self._fail(key)
+            return
+        self.store.set_sources({canonical: refs})
+        self.stored_ids.setdefault(key, []).append(canonical)
+        self._maybe_finish(key)
+
+    def _abandon(self, cid: str):
+        """Canônico que não foi gravado: sai do índice de duplicatas e os arquivos à espera dele falham."""
+        self.pending.discard(cid)
+        self.dedup.discard(cid)
+        for waiter in self.waiting.pop(cid, []):
+            self._fail(waiter)
+
+    def _fail(self, key: str):
+        if key in self.failed:
+            return
+        self.failed.add(key)
+        # remove o que já foi gravado do arquivo para não deixar chunks órfãos
+        release_chunks(self.store, self.dedup, key, self.stored_ids.pop(key, []))
+
+    def _extraction_failed(self, key: str, reason: str):
+        self.skipped.add(key)
+        release_chunks(self.store, self.dedup, key, self.stored_ids.pop(key, []))
+        self.expected.pop(key, None)
+        # erros de extração são determinísticos: o arquivo fica no manifesto, sem chunks,
+        # e só volta a ser processado quando for modificado
+        self._record(key, [], error=reason)
+
+    def _maybe_finish(self, key: str):
+        if key in self.failed or key not in self.expected:
+            return
+        ids = self.stored_ids.get(key, [])
+        if len(ids) < self.expected[key]:
+            return
+        del self.expected[key]
+        self.stored_ids.pop(key, None)
+        self._record(key, list(dict.fromkeys(ids)))
+
+    def _record(self, key: str, ids: List[str], error: Optional[str] = None):
+        self.manifest.record(Path(key), self.hashes[key], ids, error=error)
+        self.progress.increment("files_done")
+        self._unsaved += 1
+        if self._unsaved >= self.MANIFEST_SAVE_EVERY:
+            self._checkpoint()
+            self._unsaved = 0
 
 # --- WORKER PARA MULTIPROCESSING ---
-doc_id_counter = count()
+def iter_file_chunk_batches(file_path: Path) -> Iterator[List[Tuple[str, str, dict]]]:
+    source_key = str(file_path)
+    batch, seen = [], set()
+    for segments, doc_meta in FileManager.iter_documents(file_path):
+        # cada documento (conversa, linha de CSV) é chunkado separadamente
+        for chunk in FileManager.iter_chunks(segments):
+            cid = chunk_id(source_key, chunk)
+            if cid in seen:
+                continue
+            seen.add(cid)
+            batch.append((cid, chunk, {"source": file_path.name, "path": source_key, **doc_meta}))
+            if len(batch) >= settings.EMBEDDING_BATCH_SIZE:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def extraction_worker(tasks, results, overrides: Dict[str, object]):
+    """
+    Loop de um processo de extração: recebe um arquivo por vez do processo principal, extrai e chunka,
+    enviando os chunks em lotes. Sai com None ou quando o processo principal deixa de existir.
+    """
+    # o processo começa do zero (forkserver/spawn): reaplica os ajustes feitos em `settings` no principal
+    settings.__dict__.update(overrides)
+    parent = multiprocessing.parent_process()
+    # o principal só pede a saída depois de consumir todos os resultados; se ele morreu, ninguém lê a
+    # fila e o flush dos lotes pendentes travaria a saída do worker
+    results.cancel_join_thread()
 
-def process_file_to_chunks(file_content_tuple: Tuple[Path, str]) -> List[Tuple[str, dict]]:
-    file_path, content = file_content_tuple
-    chunks = FileManager.chunk_text(content)
-    return [(chunk, {"source": str(file_path.name)}) for chunk in chunks]
+    def send(message) -> bool:
+        while True:
+            try:
+                results.put(message, timeout=1.0)
+                return True
+            except queue.Full:
+                if not parent.is_alive():
+                    return False
+
+    while True:
+        try:
+            key = tasks.get(timeout=1.0)
+        except queue.Empty:
+            if parent.is_alive():
+                continue
+            return
+        if key is None:
+            return
+        try:
+            total = 0
+            for batch in iter_file_chunk_batches(Path(key)):
+                if not send(("chunks", key, batch)):
+                    return
+                total += len(batch)
+            message = ("close", key, total)
+        except Exception as e:
+            message = ("error", key, f"{type(e).__name__}: {e}")
+        if not send(message):
+            return
+
+class ExtractionPool:
+    """
+    Pool de processos que extraem e chunkam os arquivos em paralelo. Os chunks voltam em lotes por uma
+    fila limitada, como um stream de eventos ("chunks" | "close" | "error", caminho, payload). O processo
+    principal entrega um arquivo por vez a cada worker e sabe sempre qual arquivo está com qual: um
+    worker que morre, ou que passa EXTRACTION_TIMEOUT segundos sem progresso, é substituído e o arquivo
+    é reportado como erro.
+    """
+
+    # fork a partir do uvicorn (threads do indexador, do watcher, do httpx) pode herdar locks travados
+    START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = None):
+        self.workers = workers or settings.EXTRACTION_WORKERS
+        self.timeout = timeout or settings.EXTRACTION_TIMEOUT
+
+    def iter_events(self, files: List[Path]) -> Iterator[Tuple[str, str, object]]:
+        if not files:
+            return
+        ctx = multiprocessing.get_context(self.START_METHOD)
+        if self.START_METHOD == "forkserver":
+            # o servidor importa este módulo uma vez; cada worker nasce dele já com as dependências carregadas
+            ctx.set_forkserver_preload([__name__])
+        results = ctx.Queue(maxsize=2 * self.workers)
+        pending = [str(file_path) for file_path in reversed(files)]
+        overrides = dict(vars(settings))
+
+        worker_ids = count()
+        procs: Dict[int, Tuple[multiprocessing.Process, object]] = {}  # worker -> (processo, fila de tarefas)
+        active: Dict[int, List] = {}  # worker -> [arquivo, instante do último progresso]
+        owner: Dict[str, int] = {}
+
+        def assign(wid: int):
+            if pending:
+                key = pending.pop()
+                procs[wid][1].put(key)
+                active[wid] = [key, time.monotonic()]
+                owner[key] = wid
+
+        def spawn():
+            wid = next(worker_ids)
+            tasks = ctx.Queue()
+            proc = ctx.Process(target=extraction_worker, args=(tasks, results, overrides), name=f"rag-extract-{wid}", daemon=True)
+            proc.start()
+            procs[wid] = (proc, tasks)
+            assign(wid)
+
+        for _ in range(min(self.workers, len(files))):
+            spawn()
+
+        finished = set()
+        last_check = time.monotonic()
+        try:
+            while len(finished) < len(files):
+                try:
+                    message = results.get(timeout=1.0)
+                except queue.Empty:
+                    message = None
+                now = time.monotonic()
+                if message is None or now - last_check >= 1.0:
+                    last_check = now
+                    for wid, (key, last_seen) in list(active.items()):
+                        proc = procs[wid][0]
+                        if proc.is_alive():
+                            # só com a fila vazia o silêncio indica arquivo travado: com resultados
+                            # pendentes o worker pode estar só esperando espaço na fila
+                            if message is not None or now - last_seen < self.timeout:
+                                continue
+                            reason = "timeout"
+                        else:
+                            reason = f"worker encerrado (exitcode {proc.exitcode})"
+                        log.warning(f"Extração de {key} abortada: {reason}.")
+                        proc.terminate()
+                        del procs[wid], active[wid]
+                        owner.pop(key, None)
+                        finished.add(key)
+                        if pending:
+                            spawn()
+                        yield "error", key, reason
+                if message is None:
+                    continue
+
+                kind, ref, payload = message
+                if ref in finished:
+                    continue
+                wid = owner.get(ref)
+                if wid in active:
+                    active[wid][1] = time.monotonic()
+                if kind in ("close", "error"):
+                    finished.add(ref)
+                    active.pop(wid, None)
+                    owner.pop(ref, None)
+                    if kind == "error":
+                        log.error(f"Falha ao extrair o arquivo {ref}: {payload}")
+                    if wid in procs:
+                        assign(wid)
+                yield kind, ref, payload
+        finally:
+            for _, tasks in procs.values():
+                tasks.put(None)
+            for proc, _ in procs.values():
+                proc.join(timeout=1 if len(finished) == len(files) else 0)
+                if proc.is_alive():
+                    proc.terminate()
 
 # --- PIPELINE PRINCIPAL ---
+class Retrieval:
+    """Resultado da etapa de recuperação de uma pergunta."""
+
+    def __init__(self, reply: Optional[str] = None, user_prompt: str = "", sources: Optional[List[str]] = None,
+                 embedding: Optional[List[float]] = None, chunk_ids: Optional[List[str]] = None,
+                 epoch: Optional[int] = None):
+        self.reply = reply
+        self.user_prompt = user_prompt
+        self.sources = sources or []
+        self.embedding = embedding
+        self.chunk_ids = chunk_ids or []
+        # época do cache de respostas antes da busca; a resposta só é guardada se o índice não mudou
+        self.epoch = epoch
+
 class RAGPipeline:
-    def __init__(self, embedder: EmbeddingClient, store: ChromaStore, generator: GeneratorClient):
+    PROMPT_TEMPLATE = "CONTEXTO:\n{context}\n\nPERGUNTA:\n{pergunta}\n\nResponda de forma concisa."
+    NO_EMBEDDING_REPLY = "Não foi possível processar a pergunta. Verifique o serviço de embedding."
+    NO_CONTEXT_REPLY = "Não encontrei informações relevantes nas fontes para responder a sua pergunta."
+
+    def __init__(self, embedder: EmbeddingClient, store: VectorStore, generator: GeneratorClient):
         self.embedder = embedder
         self.store = store
         self.generator = generator
+        self.manifest = IndexManifest()
+        self.progress = IndexProgress()
+        self.stop_event = threading.Event()
+        # a construção inicial e as reindexações do watcher nunca correm ao mesmo tempo
+        self._index_lock = threading.Lock()
+        self._loaded = False
+        self.packer = ContextPacker(
+            generator.count_tokens, settings.CONTEXT_TOKEN_BUDGET, settings.RESPONSE_TOKEN_RESERVE,
+            settings.CHUNK_OVERLAP_TOKENS if settings.CHUNK_MODE == "tokens" else settings.CHUNK_OVERLAP,
+        )
+        self.dedup: Optional[DedupIndex] = None
+        if settings.DEDUP_ENABLED:
+            self.dedup = DedupIndex(settings.DEDUP_INDEX_PATH, settings.DEDUP_THRESHOLD, settings.DEDUP_NUM_PERM, settings.DEDUP_BANDS)
+        self.answer_cache: Optional[AnswerCache] = None
+        if settings.ANSWER_CACHE_SIZE > 0:
+            self.answer_cache = AnswerCache(
+                settings.ANSWER_CACHE_SIZE, settings.ANSWER_CACHE_TTL, settings.ANSWER_CACHE_THRESHOLD
+            )
+            store.change_listeners.append(self.answer_cache.invalidate)
 
     def build_index(self):
-        log.info("Iniciando construção do índice...")
-        start_time = time.time()
-        
-        documents = FileManager.load_documents()
-        if not documents:
-            log.info("Nenhum documento novo para indexar.")
+        with self._index_lock:
+            log.info("Iniciando construção do índice...")
+            self.progress.start()
+            try:
+                self._build_index()
+            except Exception as e:
+                self.progress.update(state="failed", error=str(e))
+                raise
+
+    def reindex(self, paths: Optional[Set[Path]] = None):
+        """
+        Chamado pelo watcher dos diretórios de dados: atualiza o índice só com `paths` (ou reexamina todos
+        os arquivos, com None). O embedding fica limitado a WATCH_EMBEDDING_RATE chunks/s e cede a vez
+        às perguntas do /chat.
+        """
+        with self._index_lock:
+            if self.stop_event.is_set():
+                return
+            log.info(
+                "Mudanças nos diretórios de dados; reexaminando todos os arquivos..." if paths is None
+                else f"Mudanças em {len(paths)} arquivos dos diretórios de dados; atualizando o índice..."
+            )
+            self.progress.start()
+            try:
+                self._build_index(paths, concurrency=settings.WATCH_EMBEDDING_CONCURRENCY,
+                                  throttle=EmbeddingThrottle(settings.WATCH_EMBEDDING_RATE, self.embedder),
+                                  operation="reindex")
+            except Exception as e:
+                self.progress.update(state="failed", error=str(e))
+                log.error(f"Falha ao atualizar o índice: {e}", exc_info=True)
+
+    def _build_index(self, paths: Optional[Set[Path]] = None, concurrency: Optional[int] = None,
+                     throttle: Optional[EmbeddingThrottle] = None, operation: str = "build_index"):
+        timer = StageTimer(operation)
+
+        if not self._loaded:
+            with timer.stage("load"):
+                if not self.manifest.exists and self.store.count() > 0:
+                    log.warning("Manifesto do índice ausente; limpando coleção existente para evitar chunks duplicados.")
+                    self.store.reset()
+                if self.manifest.recovered and self.store.lexical is not None:
+                    self.store.rebuild_lexical()
+                if self.dedup is not None and (
+                    self.manifest.recovered or not (self.dedup.load() and len(self.dedup) == self.store.count())
+                ):
+                    self._rebuild_dedup()
+            self._loaded = True
+
+        with timer.stage("scan"):
+            if paths is None:
+                changed, removed = self.manifest.diff(FileManager.list_files())
+            else:
+                changed, removed = self.manifest.diff_paths(paths)
+        with timer.stage("cleanup"):
+            for key in removed:
+                release_chunks(self.store, self.dedup, key, self.manifest.chunk_ids(key))
+                self.manifest.forget(key)
+            for file_path, _ in changed:
+                release_chunks(self.store, self.dedup, str(file_path), self.manifest.chunk_ids(str(file_path)))
+                self.manifest.forget(str(file_path))
+        if removed:
+            log.info(f"Removidos do índice os chunks de {len(removed)} arquivos excluídos.")
+
+        if not changed:
+            self.store.persist()
+            self.manifest.save()
+            if self.dedup is not None:
+                self.dedup.save()
+            self.progress.update(state="done")
+            log.info(f"Nenhum documento novo ou alterado para indexar ({timer.summary()}).")
+            timer.finish()
             return
 
-        all_chunks_with_meta = []
-        with ProcessPoolExecutor(max_workers=settings.N_THREADS) as executor:
-            futures = [executor.submit(process_file_to_chunks, doc) for doc in documents]
-            for future in as_completed(futures):
-                all_chunks_with_meta.extend(future.result())
+        log.info(f"{len(changed)} arquivos novos ou alterados serão indexados.")
+        self.progress.update(state="indexing", files_total=len(changed))
+        hashes = {str(file_path): content_hash for file_path, content_hash in changed}
 
-        if not all_chunks_with_meta:
-            log.warning("Nenhum chunk gerado. Índice não foi modificado.")
+        ingest = IngestPipeline(
+            self.embedder, self.store, self.manifest, self.progress, hashes, self.dedup, concurrency, throttle
+        )
+        events = ExtractionPool().iter_events([file_path for file_path, _ in changed])
+        # extração, embedding e gravação correm em paralelo; os lotes têm histogramas próprios (index_batch)
+        with timer.stage("ingest"):
+            completed = ingest.run(events, self.stop_event)
+        if not completed:
+            self.progress.update(state="stopped")
+            log.info("Construção do índice interrompida; será retomada na próxima inicialização.")
             return
 
-        log.info(f"Total de {len(all_chunks_with_meta)} chunks gerados. Criando embeddings em lotes...")
-        
-        chunks_to_embed = [c[0] for c in all_chunks_with_meta]
-        all_embeddings = []
-        for i in range(0, len(chunks_to_embed), settings.EMBEDDING_BATCH_SIZE):
-            batch_chunks = chunks_to_embed[i : i + settings.EMBEDDING_BATCH_SIZE]
-            batch_embeddings = self.embedder.embed(batch_chunks)
-            all_embeddings.extend(batch_embeddings)
-            log.info(f"Processado lote de embeddings {i // settings.EMBEDDING_BATCH_SIZE + 1}...")
-
-        ids = [f"doc_{next(doc_id_counter)}" for _ in all_chunks_with_meta]
-        metadatas = [c[1] for c in all_chunks_with_meta]
-        
-        self.store.add(ids, all_embeddings, metadatas, chunks_to_embed)
-        
-        end_time = time.time()
-        log.info(f"Índice construído com sucesso em {end_time - start_time:.2f} segundos.")
+        self.progress.update(state="done")
+        log.info(
+            f"Índice construído com sucesso em {timer.finish():.2f} segundos "
+            f"({ingest.chunks_stored} chunks armazenados; {timer.summary()})."
+        )
 
-    def query(self, pergunta: str) -> str:
+    def _rebuild_dedup(self):
+        """Reconstrói o índice de duplicatas a partir da coleção e das referências do manifesto."""
+        log.info("Reconstruindo o índice de chunks duplicados a partir da coleção...")
+        refs: Dict[str, Set[str]] = {}
+        for key, entry in self.manifest.files.items():
+            for cid in entry.get("chunk_ids", []):
+                refs.setdefault(cid, set()).add(key)
+        self.dedup.clear()
+        for ids, documents in self.store.iter_documents():
+            self.dedup.restore(ids, documents, refs)
+        self.dedup.save()
+
+    async def _prepare(self, pergunta: str, timer: StageTimer) -> Retrieval:
+        """Recupera o contexto da pergunta, ou uma resposta imediata (erro, nada encontrado ou cache)."""
         log.info(f"Recebida nova pergunta: '{pergunta[:80]}...'")
-        query_embedding = self.embedder.embed([pergunta])[0]
+        with timer.stage("embed"):
+            query_embedding = (await self.embedder.aembed([pergunta]))[0]
         
-        if not query_embedding:
-            return "Não foi possível processar a pergunta. Verifique o serviço de embedding."
+        if len(query_embedding) == 0:
+            return Retrieval(reply=self.NO_EMBEDDING_REPLY)
+
+        cached = self._cached_reply(query_embedding, timer)
+        if cached:
+            return Retrieval(reply=cached)
+
+        epoch = self._cache_epoch()
+        # a busca no Chroma é síncrona; roda fora do event loop
+        with timer.stage("retrieve"):
+            hits = await asyncio.to_thread(self.store.query, query_embedding, pergunta)
+        return await self._build_prompt(pergunta, query_embedding, hits, timer, epoch)
+
+    def _cache_epoch(self) -> Optional[int]:
+        return self.answer_cache.epoch if self.answer_cache else None
 
-        contexts, sources = self.store.query(query_embedding)
+    def _cached_reply(self, query_embedding, timer: StageTimer) -> Optional[str]:
+        if not self.answer_cache:
+            return None
+        with timer.stage("answer_cache"):
+            cached = self.answer_cache.lookup(query_embedding)
+        if cached:
+            log.info("Resposta servida pelo cache semântico.")
+        return cached
 
+    async def _build_prompt(self, pergunta: str, query_embedding, hits: Tuple[List[str], List[str], List[str]],
+                            timer: StageTimer, epoch: Optional[int] = None) -> Retrieval:
+        contexts, sources, chunk_ids = hits
         if not contexts:
-            return "Não encontrei informações relevantes nas fontes para responder a sua pergunta."
+            return Retrieval(reply=self.NO_CONTEXT_REPLY)
 
-        context_str = "\n\n---\n\n".join(contexts)
-        user_prompt = f"CONTEXTO:\n{context_str}\n\nPERGUNTA:\n{pergunta}\n\nResponda de forma concisa."
-        
-        reply = self.generator.chat(user_prompt)
-        unique_sources = "\n".join(f"- {s}" for s in sorted(set(sources)))
-        return f"{reply}\n\n**Fontes:**\n{unique_sources}"
\ No newline at end of file
+        frame = GeneratorClient.build_payload(self.PROMPT_TEMPLATE.format(context="", pergunta=pergunta))["prompt"]
+        with timer.stage("pack"):
+            packed = await self.packer.pack(frame, contexts, sources, chunk_ids)
+        user_prompt = self.PROMPT_TEMPLATE.format(context=packed.text, pergunta=pergunta)
+        return Retrieval(
+            user_prompt=user_prompt, sources=packed.sources, embedding=query_embedding, chunk_ids=packed.chunk_ids, epoch=epoch
+        )
+
+    @staticmethod
+    def _format_sources(sources: List[str]) -> str:
+        # chunks deduplicados trazem todas as fontes em um único `source`, separadas por " | "
+        unique_sources = "\n".join(f"- {s}" for s in sorted({name for s in sources for name in s.split(" | ")}))
+        return f"\n\n**Fontes:**\n{unique_sources}"
+
+    def _remember(self, retrieval: Retrieval, reply: str, answer: str):
+        # só respostas geradas até o fim chegam aqui; falhas do gerador saem antes como GeneratorError
+        if self.answer_cache and reply.strip():
+            self.answer_cache.store(retrieval.embedding, answer, retrieval.chunk_ids, retrieval.epoch)
+
+    @staticmethod
+    def _log_timings(timer: StageTimer):
+        log.info(f"Pergunta respondida em {timer.finish() * 1000:.0f}ms ({timer.summary()}).")
+
+    async def query(self, pergunta: str) -> str:
+        timer = StageTimer("query")
+        retrieval = await self._prepare(pergunta, timer)
+        if retrieval.reply:
+            self._log_timings(timer)
+            return retrieval.reply
+
+        try:
+            with timer.stage("generate"):
+                reply = await self.generator.chat(retrieval.user_prompt)
+        except GeneratorError:
+            self._log_timings(timer)
+            return GeneratorClient.ERROR_REPLY
+        answer = f"{reply}{self._format_sources(retrieval.sources)}"
+        self._remember(retrieval, reply, answer)
+        self._log_timings(timer)
+        return answer
+
+    async def query_stream(self, pergunta: str) -> AsyncIterator[str]:
+        """Mesma resposta de `query`, entregue token a token, com a lista de fontes ao final."""
+        timer = StageTimer("query_stream")
+        retrieval = await self._prepare(pergunta, timer)
+        if retrieval.reply:
+            self._log_timings(timer)
+            yield retrieval.reply
+            return
+
+        tokens = []
+        start = time.perf_counter()
+        try:
+            async for token in self.generator.stream_chat(retrieval.user_prompt):
+                if not tokens:
+                    timer.record("first_token", time.perf_counter() - start)
+                tokens.append(token)
+                yield token
+        except GeneratorError:
+            # os tokens parciais já foram entregues; a resposta incompleta não vai para o cache
+            yield GeneratorClient.ERROR_REPLY
+            self._log_timings(timer)
+            return
+        timer.record("generate", time.perf_counter() - start)
+        sources = self._format_sources(retrieval.sources)
+        yield sources
+        reply = "".join(tokens)
+        self._remember(retrieval, reply, f"{reply}{sources}")
+        self._log_timings(timer)
+
+    async def query_batch(self, perguntas: List[str]) -> AsyncIterator[Tuple[int, Optional[str], Optional[str]]]:
+        """
+        Responde um lote de perguntas e entrega (índice, resposta, erro) conforme cada uma termina.
+        Os embeddings saem em lotes de EMBEDDING_BATCH_SIZE, a busca vetorial das perguntas fora do
+        cache é uma única consulta multi-vetor, e no máximo BATCH_GENERATION_CONCURRENCY gerações
+        correm ao mesmo tempo, deixando o restante do limite do gerador para o /chat interativo.
+        """
+        log.info(f"Recebido lote de {len(perguntas)} perguntas.")
+        timer = StageTimer("query_batch")
+        size = settings.EMBEDDING_BATCH_SIZE
+        with timer.stage("embed"):
+            batches = await asyncio.gather(*(
+                self.embedder.aembed(perguntas[start : start + size]) for start in range(0, len(perguntas), size)
+            ))
+        embeddings = [embedding for batch in batches for embedding in batch]
+
+        pending = []
+        for index, embedding in enumerate(embeddings):
+            if len(embedding) == 0:
+                yield index, self.NO_EMBEDDING_REPLY, None
+                continue
+            cached = self._cached_reply(embedding, timer)
+            if cached:
+                yield index, cached, None
+            else:
+                pending.append(index)
+
+        if pending:
+            epoch = self._cache_epoch()
+            with timer.stage("retrieve"):
+                hits = await asyncio.to_thread(
+                    self.store.query_many, [embeddings[i] for i in pending], [perguntas[i] for i in pending]
+                )
+            semaphore = asyncio.Semaphore(settings.BATCH_GENERATION_CONCURRENCY)
+
+            async def respond(index: int, question_hits) -> Tuple[int, Optional[str], Optional[str]]:
+                try:
+                    retrieval = await self._build_prompt(perguntas[index], embeddings[index], question_hits, timer, epoch)
+                    if retrieval.reply:
+                        return index, retrieval.reply, None
+                    async with semaphore:
+                        start = time.perf_counter()
+                        reply = await self._generate_patiently(retrieval.user_prompt)
+                        timer.record("generate", time.perf_counter() - start)
+                    answer = f"{reply}{self._format_sources(retrieval.sources)}"
+                    self._remember(retrieval, reply, answer)
+                    return index, answer, None
+                except GeneratorBusyError as e:
+                    return index, None, str(e)
+                except GeneratorError:
+                    return index, None, GeneratorClient.ERROR_REPLY
+                except Exception as e:
+                    log.error(f"Erro ao responder a pergunta {index} do lote: {e}", exc_info=True)
+                    return index, None, "Ocorreu um erro interno ao processar a pergunta."
+
+            tasks = [asyncio.create_task(respond(index, question_hits)) for index, question_hits in zip(pending, hits)]
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    yield await finished
+            finally:
+                # cliente desconectado no meio do lote: não deixa gerações órfãs ocupando o gerador
+                for task in tasks:
+                    task.cancel()
+
+        log.info(f"Lote de {len(perguntas)} perguntas respondido em {timer.finish():.2f}s ({timer.summary()}).")
+
+    async def _generate_patiently(self, user_prompt: str) -> str:
+        """`generator.chat` que espera o Retry-After quando o gerador está com a fila cheia."""
+        for _ in range(settings.BATCH_BUSY_RETRIES):
+            try:
+                return await self.generator.chat(user_prompt)
+            except GeneratorBusyError as e:
+                await asyncio.sleep(e.retry_after)
+        return await self.generator.chat(user_prompt)
@@ -0,0 +1,241 @@
+import os
+import time
+import errno
+import ctypes
+import select
+import struct
+import logging
+import threading
+import ctypes.util
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+# constantes de <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+class Inotify:
+    """inotify via ctypes, sem dependências: vigia diretórios recursivamente e devolve eventos por caminho."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        self._dirs: Dict[int, Path] = {}
+
+    def watch_tree(self, root: Path):
+        for directory, _, _ in os.walk(root):
+            wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOENT:
+                    continue
+                # ENOSPC: limite fs.inotify.max_user_watches atingido
+                raise OSError(error, f"inotify_add_watch falhou em {directory}: {os.strerror(error)}")
+            self._dirs[wd] = Path(directory)
+
+    def read(self, timeout: float) -> List[Tuple[Optional[Path], int]]:
+        """Eventos (caminho, máscara) disponíveis em até `timeout` segundos; caminho None em overflow."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events, offset = [], 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is not None:
+                events.append((directory / os.fsdecode(name) if name else directory, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class DataWatcher:
+    """
+    Vigia os diretórios de dados e chama `on_change` com os arquivos criados, alterados ou removidos,
+    depois de `debounce` segundos sem novos eventos (ou `max_delay` desde o primeiro, para escritas que
+    não param). `on_change(None)` pede um reexame completo: overflow da fila do kernel ou diretórios
+    criados, movidos ou removidos. Usa inotify quando disponível e, senão, compara a cada
+    `poll_interval` segundos o mtime e o tamanho dos arquivos aceitos por `accept`. Diretórios de dados
+    que ainda não existem são verificados a cada segundo e passam a ser vigiados quando surgem.
+    """
+
+    def __init__(self, roots: List[Path], on_change: Callable[[Optional[Set[Path]]], None],
+                 accept: Callable[[Path], bool], mode: str = "auto", debounce: float = 2.0,
+                 max_delay: float = 30.0, poll_interval: float = 10.0):
+        self.roots = roots
+        self.on_change = on_change
+        self.accept = accept
+        self.mode = mode
+        self.debounce = debounce
+        self.max_delay = max(max_delay, debounce)
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rag-watcher", daemon=True)
+        self._pending: Set[Path] = set()
+        self._full = False
+        self._first_event: Optional[float] = None
+        self._last_event: Optional[float] = None
+        # diretórios de dados que ainda não existem (ex.: data/json antes da primeira coleta do scraper)
+        self._missing: List[Path] = []
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._thread.join(timeout=timeout)
+
+    def _run(self):
+        inotify = None
+        if self.mode in ("auto", "inotify"):
+            try:
+                inotify = Inotify()
+                for root in self.roots:
+                    if root.exists():
+                        inotify.watch_tree(root)
+                    else:
+                        self._missing.append(root)
+            except (OSError, AttributeError) as e:
+                if inotify is not None:
+                    inotify.close()
+                    inotify = None
+                log.warning(f"inotify indisponível ({e}); vigiando {len(self.roots)} diretórios por polling a cada {self.poll_interval:.0f}s.")
+        try:
+            if inotify is not None:
+                log.info(f"Vigiando {len(self.roots)} diretórios de dados com inotify.")
+                self._run_inotify(inotify)
+            else:
+                if self.mode == "poll":
+                    log.info(f"Vigiando {len(self.roots)} diretórios de dados por polling a cada {self.poll_interval:.0f}s.")
+                self._run_polling()
+        except Exception as e:
+            log.error(f"Watcher dos diretórios de dados interrompido: {e}", exc_info=True)
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    # --- debounce ---
+    def _record(self, paths: Set[Path], full: bool = False):
+        if not paths and not full:
+            return
+        now = time.monotonic()
+        self._pending |= paths
+        self._full = self._full or full
+        self._first_event = self._first_event or now
+        self._last_event = now
+
+    def _wait_time(self, idle: float) -> float:
+        """Quanto esperar por eventos antes de verificar de novo se o lote pendente já pode sair."""
+        if self._first_event is None:
+            return idle
+        now = time.monotonic()
+        due = min(self._last_event + self.debounce, self._first_event + self.max_delay)
+        return max(0.0, min(idle, due - now))
+
+    def _flush_if_due(self):
+        if self._first_event is None or self._wait_time(float("inf")) > 0:
+            return
+        paths = None if self._full else self._pending
+        self._pending, self._full = set(), False
+        self._first_event = self._last_event = None
+        try:
+            self.on_change(paths)
+        except Exception as e:
+            log.error(f"Falha ao processar mudanças nos diretórios de dados: {e}", exc_info=True)
+
+    # --- backends ---
+    def _attach_missing(self, inotify: Inotify) -> Set[Path]:
+        """Passa a vigiar os diretórios que surgiram e devolve os arquivos que já estão neles."""
+        paths = set()
+        for root in [root for root in self._missing if root.exists()]:
+            try:
+                inotify.watch_tree(root)
+            except OSError as e:
+                log.warning(f"Não foi possível vigiar o diretório {root}: {e}")
+                continue
+            self._missing.remove(root)
+            log.info(f"Diretório de dados {root} criado; passando a vigiá-lo.")
+            # arquivos gravados entre a criação do diretório e o início da vigilância não geram eventos
+            paths |= set(self._scan(root))
+        return paths
+
+    def _run_inotify(self, inotify: Inotify):
+        while not self._stop.is_set():
+            paths, full = self._attach_missing(inotify), False
+            for path, mask in inotify.read(self._wait_time(1.0)):
+                if path is None:
+                    log.warning("Fila de eventos do inotify transbordou; os diretórios serão reexaminados.")
+                    full = True
+                elif mask & IN_ISDIR or mask & IN_DELETE_SELF:
+                    # diretório novo (ou trazido de fora) passa a ser vigiado; o conteúdo dele entra no reexame
+                    if mask & IN_DELETE_SELF and path in self.roots and path not in self._missing:
+                        self._missing.append(path)
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        try:
+                            inotify.watch_tree(path)
+                        except OSError as e:
+                            log.warning(f"Não foi possível vigiar o novo diretório {path}: {e}")
+                    full = True
+                elif self.accept(path):
+                    paths.add(path)
+            self._record(paths, full)
+            self._flush_if_due()
+
+    def _scan(self, root: Path) -> Dict[Path, Tuple[int, int]]:
+        files = {}
+        for directory, _, names in os.walk(root):
+            for name in names:
+                path = Path(directory) / name
+                if not self.accept(path):
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                files[path] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def _snapshot(self) -> Dict[Path, Tuple[int, int]]:
+        files = {}
+        for root in self.roots:
+            files.update(self._scan(root))
+        return files
+
+    def _run_polling(self):
+        previous = self._snapshot()
+        next_poll = time.monotonic() + self.poll_interval
+        while not self._stop.wait(self._wait_time(max(0.0, next_poll - time.monotonic()))):
+            if time.monotonic() >= next_poll:
+                current = self._snapshot()
+                changed = {path for path in previous.keys() | current.keys() if previous.get(path) != current.get(path)}
+                previous = current
+                next_poll = time.monotonic() + self.poll_interval
+                self._record(changed)
+            self._flush_if_due()
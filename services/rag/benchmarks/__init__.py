@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# o pacote compartilhado services/common fica fora de services/rag; na imagem ele é copiado para /app
+_SERVICES_DIR = str(Path(__file__).resolve().parent.parent.parent)
+if _SERVICES_DIR not in sys.path:
+    sys.path.append(_SERVICES_DIR)
@@ -0,0 +1,100 @@
+"""
+Corpus sintético e determinístico para os benchmarks: portarias em txt/md (capítulos, artigos e
+parágrafos, com um aviso padrão repetido para exercitar a deduplicação) e conversas do Chatwoot em
+JSON, no formato gravado pelo coletor. A mesma semente gera sempre os mesmos arquivos e perguntas.
+"""
+import json
+import random
+from pathlib import Path
+from typing import Dict, List
+
+WORDS = (
+    "condutor candidato instrutor veículo aula prática teórica exame credenciamento biometria telemetria "
+    "auditoria fiscalização renovação habilitação categoria carteira documento prazo registro sistema "
+    "centro formação departamento trânsito estadual federal resolução portaria norma requisito carga "
+    "horária simulador percurso avaliação aprovação reprovação matrícula cadastro presencial remota "
+    "híbrida sala equipamento câmera frequência controle diretor responsável técnico infraestrutura "
+    "acessibilidade segurança sinalização legislação penalidade multa suspensão cassação recurso defesa "
+    "processo administrativo notificação autuação infração pontuação reciclagem curso especializado "
+    "transporte escolar coletivo emergência mototaxista ciclomotor motocicleta automóvel caminhão ônibus"
+).split()
+
+NOTICE = (
+    "Esta portaria entra em vigor na data de sua publicação, revogadas as disposições em contrário. "
+    "Os casos omissos serão resolvidos pela diretoria competente do departamento estadual de trânsito."
+)
+
+ROMAN = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII"]
+
+def sentence(rng: random.Random, min_words: int = 8, max_words: int = 22) -> str:
+    words = rng.choices(WORDS, k=rng.randint(min_words, max_words))
+    return " ".join(words).capitalize() + "."
+
+def paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(sentence(rng) for _ in range(sentences))
+
+def legal_document(rng: random.Random, number: int, articles: int, markdown: bool) -> str:
+    lines = [f"# Portaria {number}/2024" if markdown else f"PORTARIA {number}/2024", ""]
+    for article in range(1, articles + 1):
+        if article % 6 == 1:
+            chapter = ROMAN[min(article // 6, len(ROMAN) - 1)]
+            lines += [f"## CAPÍTULO {chapter}" if markdown else f"CAPÍTULO {chapter}", ""]
+        lines.append(f"Art. {article}º {paragraph(rng, rng.randint(2, 5))}")
+        for index in range(1, rng.randint(0, 3) + 1):
+            lines.append(f"§ {index}º {paragraph(rng, rng.randint(1, 3))}")
+        lines.append("")
+    lines.append(NOTICE)
+    return "\n".join(lines)
+
+def conversation(rng: random.Random, chat_id: int) -> Dict:
+    created_at = 1_700_000_000 + chat_id * 3_600
+    messages = []
+    for index in range(rng.randint(4, 12)):
+        message_type = index % 2
+        messages.append({
+            "id": chat_id * 100 + index, "content": paragraph(rng, rng.randint(1, 3)),
+            "message_type": message_type, "private": False, "created_at": created_at + index * 60,
+            "sender": {"type": "contact" if message_type == 0 else "user", "name": None},
+        })
+    return {
+        "id": chat_id, "inbox_id": 1, "status": "resolved", "created_at": created_at,
+        "last_activity_at": created_at + len(messages) * 60, "labels": [], "contact": {"id": None, "name": None},
+        "messages": messages,
+    }
+
+def write_corpus(root: Path, files: int, articles: int = 24, conversations_per_file: int = 25, seed: int = 42) -> Dict:
+    """Gera `files` arquivos em root/{txt,md,json} (60% txt, 20% md, 20% json) e devolve um resumo."""
+    rng = random.Random(seed)
+    for folder in ("txt", "md", "json"):
+        (root / folder).mkdir(parents=True, exist_ok=True)
+    total_bytes = 0
+    chat_id = 0
+    for index in range(files):
+        kind = ("txt", "txt", "txt", "md", "json")[index % 5]
+        if kind == "json":
+            records = []
+            for _ in range(conversations_per_file):
+                chat_id += 1
+                records.append(conversation(rng, chat_id))
+            content = json.dumps(records, ensure_ascii=False)
+        else:
+            content = legal_document(rng, index + 1, articles, markdown=kind == "md")
+        path = root / kind / f"bench_{index:05d}.{kind}"
+        path.write_text(content, encoding="utf-8")
+        total_bytes += len(content.encode("utf-8"))
+    return {"files": files, "bytes": total_bytes, "seed": seed}
+
+def questions(count: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    templates = [
+        "O que diz o Art. {article}º da Portaria {number}/2024 sobre {a} e {b}?",
+        "Qual o prazo para {a} de {b}?",
+        "Quais são os requisitos de {a} para {b}?",
+        "Como funciona a {a} na {b}?",
+    ]
+    return [
+        rng.choice(templates).format(
+            article=rng.randint(1, 20), number=rng.randint(1, 50), a=rng.choice(WORDS), b=rng.choice(WORDS)
+        )
+        for _ in range(count)
+    ]
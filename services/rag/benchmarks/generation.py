@@ -0,0 +1,89 @@
+"""
+A/B da decodificação especulativa do serviço gerador: os mesmos prompts no formato do RAG (contexto
+do corpus sintético + pergunta) são enviados alternadamente com `"speculative": false` e com o padrão
+do serviço. Para comparar, o gerador precisa estar com SPECULATIVE_DECODING=true.
+
+Executar a partir de services/rag:
+
+    python -m benchmarks.generation --generator-url http://localhost:8002/generate --prompts 20
+"""
+import json
+import random
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+from .corpus import legal_document, questions
+from .run import RESULTS_DIR, git_commit, summarize
+
+def build_prompts(count: int, seed: int) -> List[str]:
+    from app.rag_engine import GeneratorClient, RAGPipeline
+
+    rng = random.Random(seed)
+    prompts = []
+    for pergunta in questions(count, seed=seed):
+        context = legal_document(rng, rng.randint(1, 50), articles=8, markdown=False)
+        user_prompt = RAGPipeline.PROMPT_TEMPLATE.format(context=context, pergunta=pergunta)
+        prompts.append(GeneratorClient.build_payload(user_prompt))
+    return prompts
+
+def run_mode(client: httpx.Client, url: str, payload: Dict, speculative: bool) -> Dict:
+    body = {**payload, "stream": False}
+    if not speculative:
+        body["speculative"] = False
+    response = client.post(url, json=body)
+    response.raise_for_status()
+    return {**(response.json().get("stats") or {}), "seconds": response.elapsed.total_seconds()}
+
+def aggregate(runs: List[Dict]) -> Dict:
+    drafted = sum(r.get("draft_tokens", 0) for r in runs)
+    accepted = sum(r.get("accepted_draft_tokens", 0) for r in runs)
+    rates = [r["tokens_per_second"] for r in runs if r.get("tokens_per_second")]
+    return {
+        "requests": len(runs),
+        "latency_ms": summarize([r["seconds"] for r in runs]),
+        "time_to_first_token_ms": summarize([r.get("time_to_first_token_ms", 0) / 1000 for r in runs]),
+        "tokens_per_second_mean": round(sum(rates) / len(rates), 2) if rates else None,
+        "generated_tokens": sum(r.get("generated_tokens", 0) for r in runs),
+        "draft_tokens": drafted,
+        "accepted_draft_tokens": accepted,
+        "acceptance_rate": round(accepted / drafted, 4) if drafted else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="A/B da decodificação especulativa do serviço gerador.")
+    parser.add_argument("--generator-url", required=True, help="ex.: http://localhost:8002/generate")
+    parser.add_argument("--prompts", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    prompts = build_prompts(args.prompts, args.seed)
+    runs: Dict[str, List[Dict]] = {"baseline": [], "speculative": []}
+    with httpx.Client(timeout=httpx.Timeout(600, connect=10)) as client:
+        stats_url = args.generator_url.rsplit("/", 1)[0] + "/speculative/stats"
+        if not client.get(stats_url).json().get("enabled"):
+            print("Aviso: o gerador está com SPECULATIVE_DECODING desligado; os dois modos serão iguais.")
+        for index, payload in enumerate(prompts):
+            # a ordem alterna para que aquecimento e cache de prefixo não favoreçam um dos modos
+            order = ("baseline", "speculative") if index % 2 == 0 else ("speculative", "baseline")
+            for mode in order:
+                runs[mode].append(run_mode(client, args.generator_url, payload, mode == "speculative"))
+
+    results = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        **{mode: aggregate(mode_runs) for mode, mode_runs in runs.items()},
+    }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    output = args.output or RESULTS_DIR / f"generation_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Resultado gravado em {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+"""
+Benchmark ponta a ponta do serviço RAG: indexação de um corpus sintético (arquivos/s, chunks/s, pico
+de RSS) e carga concorrente no `/chat` (p50/p95/p99, requisições/s, tempo médio por etapa lido do
+`/metrics`). Sem URLs, os serviços de embedding e gerador são substituídos por `benchmarks.standins`;
+com `--embedding-url`/`--generator-url` o benchmark usa os serviços reais com `llama_cpp`. O resultado
+é gravado em JSON para comparar execuções.
+
+Executar a partir de services/rag:
+
+    python -m benchmarks.run --files 200 --requests 300 --concurrency 8
+    python -m benchmarks.run --embedding-url http://localhost:8001/embed --generator-url http://localhost:8002/generate
+    python -m benchmarks.run --rag-url http://localhost:8000 --requests 100   # só a carga, num serviço em execução
+    python -m benchmarks.run --set HYBRID_SEARCH=false --set EMBEDDING_BATCH_SIZE=64
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import socket
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from .corpus import questions, write_corpus
+
+RAG_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+STAGE_RE = re.compile(r'^rag_stage_duration_seconds_(sum|count)\{operation="([^"]+)",stage="([^"]+)"\} (\S+)$')
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_ready(url: str, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} não ficou pronto em {timeout:.0f}s")
+
+def current_rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+class RssSampler:
+    """Amostra o RSS do processo em segundo plano e guarda o pico do intervalo medido."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_mb: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-rss", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = current_rss_mb()
+            if rss is not None:
+                self.peak_mb = max(self.peak_mb or 0.0, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        if self.peak_mb is None:
+            # sem /proc: o pico da vida inteira do processo é o melhor disponível
+            self.peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+    return {
+        "p50": ms(percentile(values, 0.50)), "p95": ms(percentile(values, 0.95)), "p99": ms(percentile(values, 0.99)),
+        "mean": ms(sum(values) / len(values)) if values else None, "max": ms(max(values) if values else None),
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=RAG_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def start_standins(args) -> Tuple[List[subprocess.Popen], str, str]:
+    procs, urls = [], []
+    for service, extra in (
+        ("embedding", ["--dim", str(args.dim), "--latency-ms", str(args.embed_latency_ms), "--per-text-ms", str(args.embed_per_text_ms)]),
+        ("generator", ["--token-ms", str(args.token_ms), "--max-tokens", str(args.max_tokens), "--instances", str(args.generator_instances)]),
+    ):
+        port = free_port()
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.standins", service, "--port", str(port), *extra], cwd=RAG_DIR
+        ))
+        wait_ready(f"http://127.0.0.1:{port}/health")
+        urls.append(f"http://127.0.0.1:{port}/{'embed' if service == 'embedding' else 'generate'}")
+    return procs, urls[0], urls[1]
+
+def configure(workdir: Path, embedding_url: str, generator_url: str, overrides: List[str]):
+    """
+    Configura o serviço RAG via ambiente (lido na importação de `app.config`, inclusive pelos processos
+    de extração) e muda todos os caminhos sob /app para o diretório de trabalho do benchmark.
+    """
+    os.environ["EMBEDDING_SERVICE_URL"] = embedding_url
+    os.environ["GENERATOR_SERVICE_URL"] = generator_url
+    # perguntas se repetem ao longo da carga; sem isto o benchmark mediria o cache semântico
+    os.environ.setdefault("ANSWER_CACHE_SIZE", "0")
+    for item in overrides:
+        key, _, value = item.partition("=")
+        os.environ[key.strip()] = value
+
+    from app.config import settings
+
+    base = Path("/app")
+    for name in dir(type(settings)):
+        value = getattr(settings, name)
+        if isinstance(value, Path) and value.is_relative_to(base):
+            setattr(settings, name, workdir / value.relative_to(base))
+        elif isinstance(value, list) and value and all(isinstance(v, Path) for v in value):
+            setattr(settings, name, [workdir / v.relative_to(base) if v.is_relative_to(base) else v for v in value])
+    settings.LOGS_DIR.mkdir(parents=True, exist_ok=True)
+    for dir_path in settings.FILE_PATHS:
+        dir_path.mkdir(parents=True, exist_ok=True)
+    return settings
+
+def settings_snapshot(settings) -> Dict:
+    return {
+        name: getattr(settings, name) for name in dir(type(settings))
+        if name.isupper() and name != "RAG_SYSTEM_PROMPT" and isinstance(getattr(settings, name), (int, float, str, bool))
+    }
+
+def bench_index(args, settings) -> Dict:
+    from prometheus_client import REGISTRY
+    from app.rag_engine import EmbeddingClient, GeneratorClient, RAGPipeline, create_vector_store
+
+    corpus = write_corpus(settings.DATA_DIR, args.files, seed=args.seed)
+    embedder = EmbeddingClient(settings.EMBEDDING_SERVICE_URL)
+    generator = GeneratorClient(settings.GENERATOR_SERVICE_URL)
+    pipeline = RAGPipeline(embedder=embedder, store=create_vector_store(), generator=generator)
+
+    start = time.perf_counter()
+    with RssSampler() as rss:
+        pipeline.build_index()
+    seconds = time.perf_counter() - start
+    asyncio.run(embedder.aclose())
+    asyncio.run(generator.aclose())
+
+    progress = pipeline.progress.snapshot()
+    stages = {}
+    for stage in ("load", "scan", "cleanup", "ingest"):
+        value = REGISTRY.get_sample_value("rag_stage_duration_seconds_sum", {"operation": "build_index", "stage": stage})
+        if value is not None:
+            stages[stage] = round(value * 1000, 2)
+    for stage in ("embed", "store"):
+        total = REGISTRY.get_sample_value("rag_stage_duration_seconds_sum", {"operation": "index_batch", "stage": stage})
+        count = REGISTRY.get_sample_value("rag_stage_duration_seconds_count", {"operation": "index_batch", "stage": stage})
+        if count:
+            stages[f"batch_{stage}_mean"] = round(total / count * 1000, 2)
+    return {
+        **corpus,
+        "seconds": round(seconds, 3),
+        "chunks_total": progress.get("chunks_total"),
+        "chunks_embedded": progress.get("chunks_embedded"),
+        "chunks_deduplicated": progress.get("chunks_deduplicated"),
+        "indexed_chunks": pipeline.store.count(),
+        "files_per_second": round(args.files / seconds, 2),
+        "chunks_per_second": round((progress.get("chunks_total") or 0) / seconds, 2),
+        "peak_rss_mb": round(rss.peak_mb, 1),
+        # processos de extração já encerrados (os substitutos ainda estão de pé e não entram)
+        "children_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "stages_ms": stages,
+    }
+
+def serve_rag(port: int):
+    import uvicorn
+    from app import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-rag", daemon=True)
+    thread.start()
+    wait_ready(f"http://127.0.0.1:{port}/health/ready", timeout=600)
+    return server, thread
+
+def scrape_stages(base_url: str) -> Dict[Tuple[str, str], List[float]]:
+    try:
+        text = httpx.get(f"{base_url}/metrics", timeout=10).text
+    except httpx.HTTPError:
+        return {}
+    stages: Dict[Tuple[str, str], List[float]] = {}
+    for line in text.splitlines():
+        match = STAGE_RE.match(line)
+        if match:
+            kind, operation, stage, value = match.groups()
+            stages.setdefault((operation, stage), [0.0, 0.0])[0 if kind == "sum" else 1] = float(value)
+    return stages
+
+def stage_means(before: Dict, after: Dict, operation: str) -> Dict[str, float]:
+    means = {}
+    for (op, stage), (total, count) in after.items():
+        if op != operation:
+            continue
+        prev_total, prev_count = before.get((op, stage), (0.0, 0.0))
+        if count > prev_count:
+            means[stage] = round((total - prev_total) / (count - prev_count) * 1000, 2)
+    return means
+
+async def chat_load(base_url: str, prompts: List[str], concurrency: int, stream: bool) -> Dict:
+    latencies: List[float] = []
+    first_bytes: List[float] = []
+    statuses: Dict[str, int] = {}
+    next_index = 0
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal next_index
+        while next_index < len(prompts):
+            pergunta = prompts[next_index]
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                if stream:
+                    async with client.stream("POST", f"{base_url}/chat", json={"pergunta": pergunta, "stream": True}) as response:
+                        first = None
+                        async for line in response.aiter_lines():
+                            if first is None and line.startswith("data:"):
+                                first = time.perf_counter() - start
+                        status = response.status_code
+                    if first is not None:
+                        first_bytes.append(first)
+                else:
+                    status = (await client.post(f"{base_url}/chat", json={"pergunta": pergunta})).status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(600, connect=10), limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        seconds = time.perf_counter() - start
+
+    result = {
+        "requests": len(prompts), "concurrency": concurrency, "stream": stream,
+        "ok": statuses.get("200", 0), "status_counts": statuses,
+        "seconds": round(seconds, 3), "rps": round(len(prompts) / seconds, 2),
+        "latency_ms": summarize(latencies),
+    }
+    if stream:
+        result["first_token_ms"] = summarize(first_bytes)
+    return result
+
+def bench_chat(args, base_url: str) -> Dict:
+    prompts = questions(args.requests + args.warmup, seed=args.seed)
+    if args.warmup:
+        asyncio.run(chat_load(base_url, prompts[: args.warmup], min(args.concurrency, args.warmup), args.stream))
+    before = scrape_stages(base_url)
+    with RssSampler() as rss:
+        result = asyncio.run(chat_load(base_url, prompts[args.warmup :], args.concurrency, args.stream))
+    after = scrape_stages(base_url)
+    result["stages_ms"] = stage_means(before, after, "query_stream" if args.stream else "query")
+    if not args.rag_url:
+        result["peak_rss_mb"] = round(rss.peak_mb, 1)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de indexação e de carga no /chat do serviço RAG.")
+    parser.add_argument("--files", type=int, default=100, help="arquivos do corpus sintético")
+    parser.add_argument("--requests", type=int, default=200, help="perguntas enviadas ao /chat")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5, help="perguntas fora da medição, antes da carga")
+    parser.add_argument("--stream", action="store_true", help="usa o /chat em streaming e mede o primeiro token")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-index", action="store_true", help="não mede a indexação (o servidor indexa antes da carga)")
+    parser.add_argument("--skip-chat", action="store_true", help="mede só a indexação")
+    parser.add_argument("--embedding-url", help="serviço de embedding real (ex.: http://localhost:8001/embed)")
+    parser.add_argument("--generator-url", help="serviço gerador real (ex.: http://localhost:8002/generate)")
+    parser.add_argument("--rag-url", help="serviço RAG já em execução; só a carga no /chat é medida")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="CHAVE=VALOR",
+                        help="variável de configuração do serviço RAG (repetível)")
+    parser.add_argument("--workdir", type=Path, help="diretório de dados e índice (padrão: temporário)")
+    parser.add_argument("--output", type=Path, help="arquivo JSON de resultado (padrão: benchmarks/results/)")
+    parser.add_argument("--log-level", default="WARNING", help="nível de log do serviço RAG durante a medição")
+    standin = parser.add_argument_group("serviços substitutos")
+    standin.add_argument("--dim", type=int, default=384)
+    standin.add_argument("--embed-latency-ms", type=float, default=5.0)
+    standin.add_argument("--embed-per-text-ms", type=float, default=1.0)
+    standin.add_argument("--token-ms", type=float, default=20.0)
+    standin.add_argument("--max-tokens", type=int, default=64)
+    standin.add_argument("--generator-instances", type=int, default=1)
+    args = parser.parse_args()
+
+    results = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+    }
+
+    procs: List[subprocess.Popen] = []
+    try:
+        if args.rag_url:
+            results["backends"] = {"rag": args.rag_url}
+            results["chat"] = bench_chat(args, args.rag_url.rstrip("/"))
+        else:
+            embedding_url, generator_url = args.embedding_url, args.generator_url
+            if not embedding_url or not generator_url:
+                procs, standin_embedding, standin_generator = start_standins(args)
+                embedding_url = embedding_url or standin_embedding
+                generator_url = generator_url or standin_generator
+            results["backends"] = {
+                "embedding": args.embedding_url or "stand-in", "generator": args.generator_url or "stand-in",
+            }
+            workdir = args.workdir or Path(tempfile.mkdtemp(prefix="rag-bench-"))
+            settings = configure(workdir, embedding_url, generator_url, args.overrides)
+            # importar app.main configura os handlers de log do serviço; o nível fica a cargo do benchmark
+            from app import main as _  # noqa: F401
+            logging.getLogger().setLevel(args.log_level.upper())
+            results["settings"] = settings_snapshot(settings)
+            results["workdir"] = str(workdir)
+            if args.skip_index:
+                write_corpus(settings.DATA_DIR, args.files, seed=args.seed)
+            else:
+                results["index"] = bench_index(args, settings)
+                print(json.dumps({"index": results["index"]}, indent=2, ensure_ascii=False))
+            if not args.skip_chat:
+                port = free_port()
+                server, thread = serve_rag(port)
+                try:
+                    results["chat"] = bench_chat(args, f"http://127.0.0.1:{port}")
+                finally:
+                    server.should_exit = True
+                    thread.join(timeout=30)
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    if "chat" in results:
+        print(json.dumps({"chat": results["chat"]}, indent=2, ensure_ascii=False))
+    output = args.output or RESULTS_DIR / f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Resultado gravado em {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Serviços substitutos de embedding e gerador para benchmarks sem modelos GGUF. Implementam os mesmos
+contratos (`/embed`, `/generate`, `/tokenize`, `/health`) com latência e dimensão configuráveis e
+respostas determinísticas: o mesmo texto sempre produz o mesmo vetor e a mesma resposta.
+
+    python -m benchmarks.standins embedding --port 8101 --dim 384 --latency-ms 5 --per-text-ms 1
+    python -m benchmarks.standins generator --port 8102 --token-ms 20 --max-tokens 64
+"""
+import re
+import json
+import zlib
+import struct
+import asyncio
+import argparse
+from typing import List, Optional
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Header, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+BINARY_FORMATS = {
+    "application/x-embeddings-f32": "<f4",
+    "application/x-embeddings-f16": "<f2",
+}
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+
+class TokenizeRequest(BaseModel):
+    texts: List[str]
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    stream: bool = False
+    cache_prefix: Optional[str] = None
+
+def estimate_tokens(text: str) -> int:
+    # ordem de grandeza de um tokenizador BPE em português
+    return max(1, len(text) // 4)
+
+def hashed_embedding(text: str, dim: int) -> np.ndarray:
+    """Bag of words com feature hashing: textos com palavras em comum ficam próximos no cosseno."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in WORD_RE.findall(text.lower()):
+        h = zlib.crc32(word.encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[zlib.crc32(text.encode("utf-8")) % dim] = 1.0
+        return vector
+    return vector / norm
+
+def create_embedding_app(dim: int, latency_ms: float, per_text_ms: float, context_length: int) -> FastAPI:
+    app = FastAPI()
+    # o serviço real tem uma única thread usando o modelo; as requisições são atendidas em série
+    model_lock = asyncio.Lock()
+
+    @app.post("/embed")
+    async def embed(request: EmbedRequest, accept: Optional[str] = Header(None)):
+        async with model_lock:
+            await asyncio.sleep((latency_ms + per_text_ms * len(request.texts)) / 1000)
+        matrix = np.stack([hashed_embedding(text, dim) for text in request.texts])
+        for media_type, dtype in BINARY_FORMATS.items():
+            if accept and media_type in accept:
+                body = struct.pack("<II", *matrix.shape) + matrix.astype(dtype).tobytes()
+                return Response(content=body, media_type=media_type)
+        return {"embeddings": matrix.tolist()}
+
+    @app.post("/tokenize")
+    def tokenize(request: TokenizeRequest):
+        return {"counts": [estimate_tokens(t) for t in request.texts], "context_length": context_length}
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    return app
+
+def create_generator_app(token_ms: float, prompt_ms_per_token: float, max_tokens: int, instances: int,
+                         context_length: int) -> FastAPI:
+    app = FastAPI()
+    slots = asyncio.Semaphore(instances)
+
+    def answer_tokens(prompt: str) -> List[str]:
+        # "copia" o início do contexto, como as respostas reais que citam os artigos
+        context = prompt.split("CONTEXTO:", 1)[-1]
+        words = WORD_RE.findall(context) or ["ok"]
+        return [f" {words[i % len(words)]}" for i in range(max_tokens)]
+
+    async def produce(request: GenerateRequest):
+        async with slots:
+            await asyncio.sleep(prompt_ms_per_token * estimate_tokens(request.prompt) / 1000)
+            for token in answer_tokens(request.prompt):
+                await asyncio.sleep(token_ms / 1000)
+                yield token
+
+    def stats(request: GenerateRequest) -> dict:
+        return {"prompt_tokens": estimate_tokens(request.prompt), "generated_tokens": max_tokens,
+                "tokens_per_second": round(1000 / token_ms, 2) if token_ms > 0 else None}
+
+    @app.post("/generate")
+    async def generate(request: GenerateRequest):
+        if request.stream:
+            async def events():
+                async for token in produce(request):
+                    yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+                yield f"event: done\ndata: {json.dumps(stats(request))}\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+        return {"text": "".join([token async for token in produce(request)]).strip(), "stats": stats(request)}
+
+    @app.post("/tokenize")
+    def tokenize(request: TokenizeRequest):
+        return {"counts": [estimate_tokens(t) for t in request.texts], "context_length": context_length}
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço substituto de embedding ou gerador para benchmarks.")
+    parser.add_argument("service", choices=["embedding", "generator"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--context-length", type=int, default=4096)
+    parser.add_argument("--dim", type=int, default=384, help="dimensão dos vetores (embedding)")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="custo fixo por requisição (embedding)")
+    parser.add_argument("--per-text-ms", type=float, default=1.0, help="custo por texto (embedding)")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="tempo por token gerado (gerador)")
+    parser.add_argument("--prompt-ms-per-token", type=float, default=0.2, help="avaliação do prompt (gerador)")
+    parser.add_argument("--max-tokens", type=int, default=64, help="tokens por resposta (gerador)")
+    parser.add_argument("--instances", type=int, default=1, help="gerações simultâneas (gerador)")
+    args = parser.parse_args()
+
+    if args.service == "embedding":
+        app = create_embedding_app(args.dim, args.latency_ms, args.per_text_ms, args.context_length)
+    else:
+        app = create_generator_app(args.token_ms, args.prompt_ms_per_token, args.max_tokens, args.instances, args.context_length)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Comparação dos backends de vector store (`VECTOR_STORE`) sem serviços externos: cada backend indexa o
+mesmo conjunto sintético de vetores e textos e depois é reaberto em um processo novo, onde se medem o
+tempo de abertura, o RSS, a latência de `query` (uma pergunta) e de `query_many` (lotes) e o recall
+dos vizinhos em relação à busca exata. A busca híbrida fica desligada para medir só a parte vetorial.
+
+Executar a partir de services/rag:
+
+    python -m benchmarks.vector_store --chunks 50000 --dim 384 --queries 300
+    python -m benchmarks.vector_store --backends numpy numpy-int8 --set NUMPY_STORE_COMPACT_RATIO=0.5
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+from .corpus import paragraph
+from .run import RAG_DIR, RESULTS_DIR, RssSampler, current_rss_mb, git_commit, summarize
+
+BACKENDS = {
+    "chroma": ["VECTOR_STORE=chroma"],
+    "numpy": ["VECTOR_STORE=numpy", "NUMPY_STORE_DTYPE=float32"],
+    "numpy-int8": ["VECTOR_STORE=numpy", "NUMPY_STORE_DTYPE=int8"],
+}
+
+def dataset(chunks: int, dim: int, seed: int) -> np.ndarray:
+    """Vetores agrupados em torno de centros, como embeddings de documentos sobre poucos assuntos."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, chunks // 200), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), size=chunks)] + 0.6 * rng.normal(size=(chunks, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def query_set(vectors: np.ndarray, count: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    queries = vectors[rng.integers(0, len(vectors), size=count)] + 0.3 * rng.normal(size=(count, vectors.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def build(args, settings) -> Dict:
+    from app.rag_engine import create_vector_store
+
+    vectors = dataset(args.chunks, args.dim, args.seed)
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    with RssSampler() as rss:
+        store = create_vector_store()
+        for offset in range(0, len(vectors), settings.EMBEDDING_BATCH_SIZE):
+            batch = range(offset, min(offset + settings.EMBEDDING_BATCH_SIZE, len(vectors)))
+            store.add(
+                [f"chunk-{i}" for i in batch], vectors[batch.start : batch.stop],
+                [{"source": f"doc_{i // 40:05d}.txt", "path": f"/data/txt/doc_{i // 40:05d}.txt"} for i in batch],
+                [paragraph(rng, 4) for _ in batch],
+            )
+        store.persist()
+    seconds = time.perf_counter() - start
+    disk = sum(f.stat().st_size for f in settings.DB_DIR.rglob("*") if f.is_file())
+    return {
+        "build_seconds": round(seconds, 3), "chunks_per_second": round(args.chunks / seconds, 1),
+        "build_peak_rss_mb": round(rss.peak_mb, 1), "disk_mb": round(disk / 1024 ** 2, 1),
+    }
+
+def query(args, settings) -> Dict:
+    from app.rag_engine import create_vector_store
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    store = create_vector_store()
+    open_seconds = time.perf_counter() - start
+    rss_open = current_rss_mb()
+
+    vectors = dataset(args.chunks, args.dim, args.seed)
+    queries = query_set(vectors, args.queries, args.seed)
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, : settings.TOP_K_RESULTS]
+    del vectors
+
+    single, hits = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        _, _, ids = store.query(q)
+        single.append(time.perf_counter() - t0)
+        hits.append(ids)
+    batched = []
+    for offset in range(0, len(queries), args.batch):
+        t0 = time.perf_counter()
+        store.query_many(list(queries[offset : offset + args.batch]))
+        batched.append((time.perf_counter() - t0) / len(queries[offset : offset + args.batch]))
+
+    found = sum(len({f"chunk-{i}" for i in truth} & set(ids)) for truth, ids in zip(exact, hits))
+    return {
+        "open_seconds": round(open_seconds, 3),
+        "rss_after_open_mb": round(rss_open - rss_before, 1) if rss_open and rss_before else None,
+        "query_ms": summarize(single),
+        "query_many_ms_per_query": summarize(batched),
+        "recall_at_k": round(found / (len(queries) * settings.TOP_K_RESULTS), 4),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def worker(args):
+    from .run import configure
+
+    # URLs não usadas: nenhum serviço é chamado; só os caminhos e o backend importam
+    overrides = BACKENDS[args.worker] + [f"TOP_K_RESULTS={args.k}", f"VECTOR_TOP_K={args.k}", "HYBRID_SEARCH=false"] + args.overrides
+    settings = configure(args.workdir, "http://127.0.0.1:9/embed", "http://127.0.0.1:9/generate", overrides)
+    result = build(args, settings) if args.phase == "build" else query(args, settings)
+    print(json.dumps(result))
+
+def run_worker(args, backend: str, phase: str, workdir: Path) -> Dict:
+    command = [
+        sys.executable, "-m", "benchmarks.vector_store", "--worker", backend, "--phase", phase, "--workdir", str(workdir),
+        "--chunks", str(args.chunks), "--dim", str(args.dim), "--queries", str(args.queries), "--batch", str(args.batch),
+        "--k", str(args.k), "--seed", str(args.seed), *[f"--set={item}" for item in args.overrides],
+    ]
+    output = subprocess.run(command, cwd=RAG_DIR, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(f"{backend}/{phase} falhou:\n{output.stderr[-4000:]}")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparação dos backends de vector store: latência, RSS e recall.")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=32, help="perguntas por chamada de query_many")
+    parser.add_argument("--k", type=int, default=10, help="vizinhos por consulta (VECTOR_TOP_K e TOP_K_RESULTS)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="CHAVE=VALOR")
+    parser.add_argument("--workdir", type=Path, help="diretório dos índices (padrão: temporário)")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--worker", choices=list(BACKENDS), help=argparse.SUPPRESS)
+    parser.add_argument("--phase", choices=["build", "query"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="rag-vs-bench-"))
+    results = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items() if k not in ("worker", "phase")},
+    }
+    for backend in args.backends:
+        # processos separados: a indexação não infla o RSS medido na abertura e nas consultas
+        backend_dir = workdir / backend
+        results[backend] = {**run_worker(args, backend, "build", backend_dir), **run_worker(args, backend, "query", backend_dir)}
+        print(json.dumps({backend: results[backend]}, indent=2, ensure_ascii=False))
+
+    output = args.output or RESULTS_DIR / f"vector_store_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Resultado gravado em {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import aiohttp
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Limita a taxa sustentada a `rate` requisições/s, permitindo rajadas de até `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def drain(self):
+        """Esvazia o balde após um 429, para que as próximas requisições também esperem."""
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+
+class ChatwootError(Exception):
+    pass
+
+class ChatwootClient:
+    """
+    Cliente da API do Chatwoot com uma única sessão HTTP (pool de conexões) compartilhada, no máximo
+    MAX_CONCURRENCY requisições em voo, token bucket e novas tentativas com backoff exponencial em
+    429, 5xx e erros de rede (respeitando Retry-After quando enviado).
+    """
+
+    def __init__(self):
+        if not settings.API_URL or not settings.ACCOUNT_ID or not settings.API_TOKEN:
+            raise ChatwootError("API_URL, ACCOUNT_ID e API_TOKEN precisam estar definidos.")
+        self.base_url = f"{settings.API_URL}/accounts/{settings.ACCOUNT_ID}"
+        self._semaphore = asyncio.Semaphore(settings.MAX_CONCURRENCY)
+        self._bucket = TokenBucket(settings.RATE_LIMIT_PER_SECOND, settings.RATE_LIMIT_BURST)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+
+    async def __aenter__(self) -> "ChatwootClient":
+        self._session = aiohttp.ClientSession(
+            headers={"api_access_token": settings.API_TOKEN},
+            timeout=aiohttp.ClientTimeout(total=settings.REQUEST_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=settings.MAX_CONCURRENCY),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), settings.MAX_BACKOFF)
+            except ValueError:
+                pass
+        return min(settings.MAX_BACKOFF, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def get(self, path: str, params: Optional[Dict] = None) -> Dict:
+        url = f"{self.base_url}{path}"
+        for attempt in range(settings.MAX_RETRIES + 1):
+            await self._bucket.acquire()
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    self.requests += 1
+                    async with self._session.get(url, params=params) as resp:
+                        if resp.status == 429 or resp.status >= 500:
+                            retry_after = resp.headers.get("Retry-After")
+                            error = f"HTTP {resp.status}"
+                            if resp.status == 429:
+                                self.throttled += 1
+                                self._bucket.drain()
+                        else:
+                            resp.raise_for_status()
+                            return await resp.json()
+            except aiohttp.ClientResponseError as e:
+                # 4xx além de 429 não melhora tentando de novo
+                raise ChatwootError(f"GET {path} falhou: HTTP {e.status}") from e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {e}"
+
+            if attempt == settings.MAX_RETRIES:
+                break
+            delay = self._backoff(attempt, retry_after)
+            self.retries += 1
+            log.warning(f"GET {path} ({error}); nova tentativa em {delay:.1f}s.")
+            await asyncio.sleep(delay)
+        raise ChatwootError(f"GET {path} falhou após {settings.MAX_RETRIES + 1} tentativas: {error}")
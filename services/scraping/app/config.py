@@ -0,0 +1,29 @@
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class Config:
+    BASE_DIR = Path('/app')
+
+    API_URL = (os.getenv("API_URL") or "").rstrip("/")
+    ACCOUNT_ID = os.getenv("ACCOUNT_ID")
+    API_TOKEN = os.getenv("API_TOKEN")
+
+    # requisições simultâneas ao Chatwoot e taxa sustentada (token bucket) compartilhada por todas
+    MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", os.getenv("MAX_THREADS", "4")))
+    RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "5"))
+    RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+    REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "30"))
+    MAX_RETRIES = int(os.getenv("MAX_RETRIES", "6"))
+    # espera máxima entre tentativas quando o servidor não manda Retry-After
+    MAX_BACKOFF = float(os.getenv("MAX_BACKOFF", "60"))
+
+    # ./data é montado em /app/data, o mesmo volume que o RAG indexa; o estado fica fora de data/json
+    # um arquivo por conversa (<id>.json), numa pasta própria dentro de data/json
+    OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR", str(BASE_DIR / "data" / "json" / "chatwoot")))
+    STATE_DIR = Path(os.getenv("STATE_DIR", str(BASE_DIR / "data" / "state")))
+    CURSOR_PATH = Path(os.getenv("CURSOR_PATH", str(STATE_DIR / "chatwoot_cursor.json")))
+
+settings = Config()
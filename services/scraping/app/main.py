@@ -1,69 +1,212 @@
-from concurrent.futures import ThreadPoolExecutor
-import asyncio, aiohttp, os, pprint
-from dotenv import load_dotenv
-from pathlib import Path
 import json
+import time
+import asyncio
+import logging
+import argparse
+from typing import Dict, List, Optional
+
+from .client import ChatwootClient, ChatwootError
+from .config import settings
+
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s'))
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
+root_logger.addHandler(stream_handler)
+
+log = logging.getLogger(__name__)
 
 class ChatwootScraperAsync:
-    def __init__(self):
-        load_dotenv()
-        self.base_url = os.getenv("API_URL")
-        self.max_threads = int(os.getenv("MAX_THREADS", 3))
-        self.account_id = os.getenv("ACCOUNT_ID")
-        self.token = os.getenv("API_TOKEN")
-        self.headers = {"api_access_token": self.token}
-        self.root_path = Path(__file__).absolute().parent.parent.parent.parent + "data/json"
-
-    def get_resolved_chats(self, per_page=25):
-        def thread_worker(page_start):
-            asyncio.run(self.process_pages_async_while(page_start, per_page))
-
-        with ThreadPoolExecutor(max_workers=self.max_threads) as executor:
-            futures = [executor.submit(thread_worker, 1) for _ in range(self.max_threads)]
-            for future in futures:
-                future.result()
-
-    async def process_pages_async_while(self, page_start=1, per_page=25):
-        page = page_start
-        async with aiohttp.ClientSession() as session:
-            while True:
-                chats = await self.fetch_chats_page(session, page, per_page)
-                if not chats:
-                    break
-                await self.fetch_all_chats_messages(chats)
-                page += 1
-
-    async def fetch_chats_page(self, session, page, per_page=25):
-        url = f"{self.base_url}/accounts/{self.account_id}/conversations?status=resolved&page={page}&per_page={per_page}"
-        async with session.get(url, headers=self.headers) as resp:
-            data = await resp.json()
-            return [chat["id"] for chat in data["data"]["payload"]]
-
-    async def fetch_all_chats_messages(self, id_chats):
-        async with aiohttp.ClientSession() as session:
-            tasks = [self.fetch_messages(session, chat_id) for chat_id in id_chats]
-            return await asyncio.gather(*tasks)
-
-    async def fetch_messages(self, session, chat_id):
-        url = f"{self.base_url}/accounts/{self.account_id}/conversations/{chat_id}/messages"
-        async with session.get(url, headers=self.headers) as resp:
-            data = await resp.json()
-            messages = data.get("payload", [])
-            for msg in messages:
-                pprint.pprint(msg)
-                exit()
-                # print(f"Chat {chat_id} -> {msg.get('content')}")
-            exit()
-            return messages
-
-    def format_chat_messages(self, messages):
-        return messages
-
-    def save_chat(self, chat_id, messages):
-        with open(f"{self.root_path}/chat_{chat_id}.json", "w") as f:
-            json.dump(messages, f)
+    """
+    Coleta as conversas resolvidas do Chatwoot e grava cada uma em `OUTPUT_DIR/<id>.json`. Uma conversa
+    coletada de novo (reaberta e resolvida outra vez, ou de volta porque o cursor ficou para trás)
+    sobrescreve o próprio arquivo, então o RAG nunca indexa a mesma conversa duas vezes. Os workers pegam números de página de um contador compartilhado (nenhuma página é
+    buscada duas vezes) e enviam as conversas para uma fila limitada, consumida pelos workers que
+    buscam as mensagens. A listagem vem da atividade mais recente para a mais antiga, então a coleta
+    para ao alcançar o cursor (`last_activity_at`) salvo pela execução anterior.
+    """
+
+    MESSAGES_PAGE_SIZE = 20  # tamanho de página fixo da API de mensagens
+
+    def __init__(self, client: ChatwootClient, full: bool = False):
+        self.client = client
+        self.cursor = 0 if full else self._load_cursor()
+        self.conversations: asyncio.Queue = asyncio.Queue(maxsize=settings.MAX_CONCURRENCY * 25)
+        self._next_page = 1
+        self._last_page: Optional[int] = None
+        self.newest = self.cursor
+        self.failed_activity: List[int] = []
+        self.listing_failed = False
+        self.pages = 0
+        self.written = 0
+        self.unchanged = 0
+
+    @staticmethod
+    def _load_cursor() -> int:
+        try:
+            return int(json.loads(settings.CURSOR_PATH.read_text(encoding="utf-8"))["last_activity_at"])
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            log.warning(f"Cursor em {settings.CURSOR_PATH} ilegível, coletando tudo: {e}")
+            return 0
+
+    def _save_cursor(self, value: int):
+        settings.CURSOR_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = settings.CURSOR_PATH.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"last_activity_at": value, "updated_at": int(time.time())}), encoding="utf-8")
+        tmp_path.replace(settings.CURSOR_PATH)
+
+    @staticmethod
+    def _activity(conversation: Dict) -> int:
+        return int(conversation.get("last_activity_at") or conversation.get("timestamp") or 0)
+
+    async def _list_worker(self):
+        while self._last_page is None or self._next_page <= self._last_page:
+            page = self._next_page
+            self._next_page += 1
+            try:
+                data = await self.client.get(
+                    "/conversations", {"status": "resolved", "assignee_type": "all", "page": page}
+                )
+            except ChatwootError as e:
+                log.error(f"Falha ao listar a página {page}: {e}")
+                self.listing_failed = True
+                self._last_page = min(self._last_page or page, page)
+                return
+            payload = data.get("data", {}).get("payload", [])
+            self.pages += 1
+            if not payload:
+                self._last_page = min(self._last_page or page, page)
+                continue
+            for conversation in payload:
+                if self._activity(conversation) > self.cursor:
+                    await self.conversations.put(conversation)
+                else:
+                    # daqui em diante tudo já foi coletado em execuções anteriores
+                    self._last_page = min(self._last_page or page, page)
+
+    async def _fetch_messages(self, conversation_id: int) -> List[Dict]:
+        messages: Dict[int, Dict] = {}
+        before = None
+        while True:
+            params = {"before": before} if before else None
+            data = await self.client.get(f"/conversations/{conversation_id}/messages", params)
+            batch = [m for m in data.get("payload", []) if m["id"] not in messages]
+            for message in batch:
+                messages[message["id"]] = message
+            if len(batch) < self.MESSAGES_PAGE_SIZE:
+                break
+            before = min(m["id"] for m in batch)
+        return [messages[i] for i in sorted(messages)]
+
+    @staticmethod
+    def format_chat(conversation: Dict, messages: List[Dict]) -> Dict:
+        sender = conversation.get("meta", {}).get("sender") or {}
+        return {
+            "id": conversation["id"],
+            "inbox_id": conversation.get("inbox_id"),
+            "status": conversation.get("status"),
+            "created_at": conversation.get("created_at"),
+            "last_activity_at": ChatwootScraperAsync._activity(conversation),
+            "labels": conversation.get("labels", []),
+            "contact": {"id": sender.get("id"), "name": sender.get("name")},
+            "messages": [
+                {
+                    "id": m["id"],
+                    "content": m.get("content"),
+                    "message_type": m.get("message_type"),
+                    "private": m.get("private", False),
+                    "created_at": m.get("created_at"),
+                    "sender": {"type": (m.get("sender") or {}).get("type"), "name": (m.get("sender") or {}).get("name")},
+                }
+                for m in messages
+            ],
+        }
+
+    @staticmethod
+    def _write(conversation_id: int, content: str) -> bool:
+        """Grava a conversa no arquivo dela; False se o arquivo já tinha exatamente esse conteúdo."""
+        path = settings.OUTPUT_DIR / f"{conversation_id}.json"
+        try:
+            if path.read_text(encoding="utf-8") == content:
+                # sem mudança: não regrava, e o watcher do RAG não reindexa o arquivo
+                return False
+        except FileNotFoundError:
+            pass
+        # grava num arquivo oculto e renomeia, para o indexador nunca ler uma conversa pela metade
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(content, encoding="utf-8")
+        tmp_path.replace(path)
+        return True
+
+    async def _message_worker(self):
+        while True:
+            conversation = await self.conversations.get()
+            try:
+                if conversation is None:
+                    return
+                await self._collect(conversation)
+            finally:
+                self.conversations.task_done()
+
+    async def _collect(self, conversation: Dict):
+        # a atividade já foi calculada na listagem, então não falha aqui
+        activity = self._activity(conversation)
+        try:
+            messages = await self._fetch_messages(conversation["id"])
+            content = json.dumps(self.format_chat(conversation, messages), ensure_ascii=False) + "\n"
+            changed = self._write(conversation["id"], content)
+        except Exception as e:
+            # uma conversa com problema não pode derrubar o worker, senão a fila para de andar
+            log.error(f"Falha ao coletar a conversa {conversation.get('id')}: {e}", exc_info=not isinstance(e, ChatwootError))
+            self.failed_activity.append(activity)
+            return
+        if changed:
+            self.written += 1
+        else:
+            self.unchanged += 1
+        self.newest = max(self.newest, activity)
+        if (self.written + self.unchanged) % 500 == 0:
+            log.info(f"{self.written + self.unchanged} conversas coletadas ({self.pages} páginas).")
+
+    def _next_cursor(self) -> int:
+        """Avança o cursor só até onde tudo foi gravado; conversas com falha voltam na próxima execução."""
+        if self.listing_failed:
+            return self.cursor
+        if self.failed_activity:
+            return max(self.cursor, min(self.failed_activity) - 1)
+        return self.newest
+
+    async def get_resolved_chats(self) -> int:
+        """Coleta as conversas novas desde o cursor; devolve quantos arquivos foram criados ou atualizados."""
+        settings.OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+        start = time.time()
+        log.info(f"Coletando conversas resolvidas com atividade após {self.cursor}...")
+
+        message_workers = [asyncio.create_task(self._message_worker()) for _ in range(settings.MAX_CONCURRENCY)]
+        try:
+            await asyncio.gather(*(self._list_worker() for _ in range(settings.MAX_CONCURRENCY)))
+        finally:
+            for _ in message_workers:
+                await self.conversations.put(None)
+            await asyncio.gather(*message_workers)
+
+        self._save_cursor(self._next_cursor())
+        log.info(
+            f"{self.written} conversas gravadas em {settings.OUTPUT_DIR} ({self.unchanged} sem mudança) em "
+            f"{self.pages} páginas, {time.time() - start:.1f}s ({self.client.requests} requisições, "
+            f"{self.client.throttled} respostas 429, {self.client.retries} novas tentativas)."
+        )
+        if self.failed_activity or self.listing_failed:
+            log.warning(f"{len(self.failed_activity)} conversas falharam; o cursor não avança além delas.")
+        return self.written
 
+async def main(full: bool = False):
+    async with ChatwootClient() as client:
+        await ChatwootScraperAsync(client, full=full).get_resolved_chats()
 
 if __name__ == "__main__":
-    requester = ChatwootScraperAsync()
-    # requester.get_resolved_chats()
+    parser = argparse.ArgumentParser(description="Coleta incremental das conversas resolvidas do Chatwoot.")
+    parser.add_argument("--full", action="store_true", help="ignora o cursor e coleta todas as conversas")
+    asyncio.run(main(parser.parse_args().full))